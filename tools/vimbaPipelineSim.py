@@ -0,0 +1,414 @@
+#!/bin/env python3
+import os, re, sys, json, heapq, random
+from collections import deque
+from optparse import OptionParser
+
+# Vimba frame buffers queued by ADVimba::startCapture
+NUM_VIMBA_BUFFERS = 10
+
+# The timeout of the newFrameEventId_ wait in ADVimba::imageGrabTask
+GRAB_TASK_TIMEOUT = 0.1
+
+# bytes per element of the NDArray data types in IMAGE_TYPE
+typeBytes = dict(Int8=1, UInt8=1, Int16=2, UInt16=2, Int32=4, UInt32=4,
+                 Int64=8, UInt64=8, Float32=4, Float64=8)
+
+# read IMAGE_XSIZE, IMAGE_YSIZE, IMAGE_TYPE and IMAGE_COLORMODE from the
+# epicsEnvSet lines of a camera's .env file
+def read_env(filename):
+    env = {}
+    for name, value in re.findall(r'epicsEnvSet\(\s*"(\w+)",\s*"([^"]*)"\s*\)', open(filename).read()):
+        env[name] = value
+    return dict(xsize = int(env["IMAGE_XSIZE"]), ysize = int(env["IMAGE_YSIZE"]),
+                type = env.get("IMAGE_TYPE", "UInt8"), colormode = int(env.get("IMAGE_COLORMODE", "0")))
+
+# bytes in the NDArray of a frame. IMAGE_COLORMODE 2 is RGB, 0 and 1 (Bayer)
+# are one value per pixel
+def frame_bytes(xsize, ysize, type, colormode):
+    return xsize * ysize * typeBytes[type] * (3 if colormode == 2 else 1)
+
+class Distribution(object):
+    """A service time with a mean and a coefficient of variation, which is
+    fixed if the cv is 0 and gamma distributed otherwise"""
+    def __init__(self, mean, cv=0.0):
+        self.mean = mean
+        self.cv = cv
+
+    def sample(self, rng):
+        if self.cv <= 0 or self.mean <= 0:
+            return self.mean
+        shape = 1.0 / (self.cv * self.cv)
+        return rng.gammavariate(shape, self.mean / shape)
+
+class Plugin(object):
+    """A downstream NDPluginDriver, with its input queue and threads. A
+    blocking plugin processes each array in the driver's callback, with the
+    driver lock held"""
+    def __init__(self, name, service, queueSize=20, threads=1, blocking=False):
+        self.name = name
+        self.service = service
+        self.queueSize = queueSize
+        self.threads = threads
+        self.blocking = blocking
+        self.queue = deque()
+        self.busy = 0
+        self.processed = 0
+        self.dropped = 0
+        self.latencies = []
+        self.queueHigh = 0
+
+# parse a plugin given as name:mean_ms[:queue[:threads[:blocking]]] where the
+# mean can be mean/cv
+def parse_plugin(spec):
+    parts = spec.split(":")
+    if len(parts) < 2:
+        raise ValueError("Plugin %s should be name:mean_ms[:queue[:threads[:blocking]]]" % spec)
+    mean, _, cv = parts[1].partition("/")
+    return Plugin(parts[0], Distribution(float(mean) / 1e3, float(cv or 0)),
+                  int(parts[2]) if len(parts) > 2 else 20,
+                  int(parts[3]) if len(parts) > 3 else 1,
+                  len(parts) > 4 and parts[4].lower() in ["1", "yes", "true", "blocking"])
+
+def percentiles(values, points=(50, 90, 99, 100)):
+    if not values:
+        return {}
+    values = sorted(values)
+    return dict(("p%d" % p, values[min(len(values) - 1, int(len(values) * p / 100.0))]) for p in points)
+
+class PipelineSim(object):
+    """Discrete event model of ADVimba's acquisition pipeline.
+
+    The camera sends a frame every 1/frameRate seconds into one of the
+    queueDepth Vimba frame buffers, or it is dropped if they are all in use.
+    Vimba's callback thread runs processFrame on each frame in turn. It takes
+    the driver lock, converts the frame, allocates an NDArray from the pool,
+    copies the frame into it, and reads the transport layer statistics. It
+    then does the NDArray callbacks and requeues the Vimba frame buffer, all
+    with the lock held. The pool allocation fails if maxMemory would be
+    exceeded, which aborts the acquisition. imageGrabTask takes the lock
+    after each frame and whenever its 0.1 s wait times out, and other port
+    activity (channel access puts, polling) takes it at random. Plugins hold
+    a reference to each array they queue until they have processed it, and
+    drop arrays when their queue is full"""
+
+    def __init__(self, frameBytes, frameRate, plugins=[], maxMemory=0, queueDepth=NUM_VIMBA_BUFFERS,
+                 convert=Distribution(0), memcpyRate=5e9, overhead=Distribution(50e-6),
+                 statistics=Distribution(0), jitter=0.0, grabTaskHold=Distribution(20e-6),
+                 portRate=0.0, portHold=Distribution(100e-6), seed=0):
+        self.frameBytes = frameBytes
+        self.frameRate = frameRate
+        self.plugins = plugins
+        self.maxArrays = maxMemory // frameBytes if maxMemory else None
+        self.queueDepth = queueDepth
+        self.convert = convert
+        self.copyTime = frameBytes / memcpyRate
+        self.overhead = overhead
+        self.statistics = statistics
+        self.jitter = jitter
+        self.grabTaskHold = grabTaskHold
+        self.portRate = portRate
+        self.portHold = portHold
+        self.rng = random.Random(seed)
+        self.events = []
+        self.sequence = 0
+        self.now = 0.0
+
+    # run an action at time t
+    def at(self, t, action, *args):
+        self.sequence += 1
+        heapq.heappush(self.events, (t, self.sequence, action, args))
+
+    # the driver lock, which is handed over in the order it was asked for
+    def lock(self, action, *args):
+        self.lockRequests += 1
+        if self.lockHeld:
+            self.lockWaiters.append((self.now, action, args))
+        else:
+            self.lockHeld = True
+            self.lockWaits.append(0.0)
+            action(*args)
+
+    def unlock(self):
+        if self.lockWaiters:
+            t, action, args = self.lockWaiters.popleft()
+            self.lockWaits.append(self.now - t)
+            action(*args)
+        else:
+            self.lockHeld = False
+
+    # an NDArray from the pool is freed when its last reference is released
+    def release(self, array):
+        array["refs"] -= 1
+        if array["refs"] == 0:
+            self.arraysInUse -= 1
+
+    def run(self, duration):
+        self.lockHeld = False
+        self.lockWaiters = deque()
+        self.lockWaits = []
+        self.lockRequests = 0
+        self.freeBuffers = self.queueDepth
+        self.delivery = deque()
+        self.delivering = False
+        self.arraysInUse = 0
+        self.arraysHigh = 0
+        self.buffersHigh = 0
+        self.frames = 0
+        self.transportDropped = 0
+        self.published = 0
+        self.aborted = None
+        self.acquiring = True
+        self.grabTaskWaiting = True
+        self.grabTaskSignalled = False
+        self.grabTaskTimeout = None
+        self.processTimes = []
+        self.latencies = []
+        self.duration = duration
+        self.at(0.0, self.camera_frame)
+        self.grab_task_wait()
+        if self.portRate > 0:
+            self.at(self.rng.expovariate(self.portRate), self.port_activity)
+        while self.events:
+            t, seq, action, args = heapq.heappop(self.events)
+            if t > duration:
+                break
+            self.now = t
+            action(*args)
+        return self.results()
+
+    # the camera sends a frame, if there is a Vimba buffer free for it
+    def camera_frame(self):
+        if not self.acquiring:
+            return
+        self.frames += 1
+        if self.freeBuffers > 0:
+            self.freeBuffers -= 1
+            self.buffersHigh = max(self.buffersHigh, self.queueDepth - self.freeBuffers)
+            self.delivery.append(dict(t0 = self.now))
+            self.deliver()
+        else:
+            self.transportDropped += 1
+        period = 1.0 / self.frameRate
+        if self.jitter:
+            period = max(0.0, self.rng.gauss(period, period * self.jitter))
+        self.at(self.now + period, self.camera_frame)
+
+    # Vimba's callback thread calls processFrame on the next frame
+    def deliver(self):
+        if self.delivering or not self.delivery:
+            return
+        self.delivering = True
+        frame = self.delivery.popleft()
+        frame["start"] = self.now
+        self.lock(self.process_locked, frame)
+
+    def process_locked(self, frame):
+        self.at(self.now + self.convert.sample(self.rng), self.process_alloc, frame)
+
+    def process_alloc(self, frame):
+        if self.maxArrays is not None and self.arraysInUse >= self.maxArrays:
+            # not enough buffers left! Aborting acquisition!
+            if self.aborted is None:
+                self.aborted = self.now
+            self.acquiring = False
+            self.process_done(frame, None)
+            return
+        self.arraysInUse += 1
+        self.arraysHigh = max(self.arraysHigh, self.arraysInUse)
+        array = dict(refs = 1, t0 = frame["t0"])
+        self.at(self.now + self.copyTime + self.overhead.sample(self.rng), self.process_callbacks, frame, array)
+
+    def process_callbacks(self, frame, array):
+        self.published += 1
+        self.latencies.append(self.now - frame["t0"])
+        blocking = 0.0
+        for plugin in self.plugins:
+            if plugin.blocking:
+                t = plugin.service.sample(self.rng)
+                blocking += t
+                plugin.processed += 1
+                plugin.latencies.append(self.now + blocking - frame["t0"])
+            elif len(plugin.queue) < plugin.queueSize:
+                array["refs"] += 1
+                plugin.queue.append(array)
+                plugin.queueHigh = max(plugin.queueHigh, len(plugin.queue))
+                self.plugin_start(plugin)
+            else:
+                plugin.dropped += 1
+        self.at(self.now + blocking + self.statistics.sample(self.rng), self.process_done, frame, array)
+
+    def process_done(self, frame, array):
+        if array is not None:
+            self.release(array)
+        self.processTimes.append(self.now - frame["start"])
+        self.freeBuffers += 1
+        self.delivering = False
+        self.grab_task_signal()
+        self.unlock()
+        self.deliver()
+
+    def plugin_start(self, plugin):
+        while plugin.busy < plugin.threads and plugin.queue:
+            plugin.busy += 1
+            array = plugin.queue.popleft()
+            self.at(self.now + plugin.service.sample(self.rng), self.plugin_done, plugin, array)
+
+    def plugin_done(self, plugin, array):
+        plugin.busy -= 1
+        plugin.processed += 1
+        plugin.latencies.append(self.now - array["t0"])
+        self.release(array)
+        self.plugin_start(plugin)
+
+    # imageGrabTask waits for newFrameEventId_ for up to 0.1 s, then takes
+    # the lock to check the acquisition and do the parameter callbacks
+    def grab_task_wait(self):
+        if self.grabTaskSignalled:
+            self.grabTaskSignalled = False
+            self.lock(self.grab_task_locked)
+            return
+        self.grabTaskWaiting = True
+        self.grabTaskTimeout = self.sequence + 1
+        self.at(self.now + GRAB_TASK_TIMEOUT, self.grab_task_wake, self.grabTaskTimeout)
+
+    def grab_task_signal(self):
+        if self.grabTaskWaiting:
+            self.grab_task_wake(None)
+        else:
+            self.grabTaskSignalled = True
+
+    def grab_task_wake(self, timeout):
+        # a timeout that was overtaken by a signal
+        if timeout is not None and (not self.grabTaskWaiting or timeout != self.grabTaskTimeout):
+            return
+        self.grabTaskWaiting = False
+        self.lock(self.grab_task_locked)
+
+    def grab_task_locked(self):
+        self.at(self.now + self.grabTaskHold.sample(self.rng), self.grab_task_unlock)
+
+    def grab_task_unlock(self):
+        self.unlock()
+        self.grab_task_wait()
+
+    # other users of the port, like channel access puts and polled reads
+    def port_activity(self):
+        self.lock(lambda: self.at(self.now + self.portHold.sample(self.rng), self.unlock))
+        self.at(self.now + self.rng.expovariate(self.portRate), self.port_activity)
+
+    def results(self):
+        ms = lambda d: dict((k, v * 1e3) for k, v in d.items())
+        return dict(
+            frames = self.frames,
+            published = self.published,
+            transportDropped = self.transportDropped,
+            dropRate = float(self.transportDropped) / self.frames if self.frames else 0.0,
+            aborted = self.aborted,
+            poolArraysHigh = self.arraysHigh,
+            poolBytesHigh = self.arraysHigh * self.frameBytes,
+            vimbaBuffersHigh = self.buffersHigh,
+            processFrameMs = ms(percentiles(self.processTimes)),
+            lockWaitMs = ms(percentiles(self.lockWaits)),
+            publishLatencyMs = ms(percentiles(self.latencies)),
+            plugins = dict((p.name, dict(processed = p.processed, dropped = p.dropped,
+                                         queueHigh = p.queueHigh,
+                                         latencyMs = ms(percentiles(p.latencies))))
+                           for p in self.plugins))
+
+# print the results of a run
+def report(r, frameBytes):
+    print("Frames sent by camera      %d" % r["frames"])
+    print("Frames published           %d" % r["published"])
+    print("Dropped, no Vimba buffer   %d (%.2f%%)" % (r["transportDropped"], 100 * r["dropRate"]))
+    if r["aborted"] is not None:
+        print("Pool exhausted, aborted at %.3f s" % r["aborted"])
+    print("Vimba buffers in use, max  %d" % r["vimbaBuffersHigh"])
+    print("NDArrays in use, max       %d (%.1f MB, maxMemory >= %d)" % (r["poolArraysHigh"],
+          r["poolBytesHigh"] / 1e6, r["poolBytesHigh"]))
+    show = lambda d: "  ".join("%s %.2f" % (k, d[k]) for k in sorted(d, key=lambda k: int(k[1:])))
+    print("processFrame ms            %s" % show(r["processFrameMs"]))
+    print("Lock wait ms               %s" % show(r["lockWaitMs"]))
+    print("Publish latency ms         %s" % show(r["publishLatencyMs"]))
+    for name, p in sorted(r["plugins"].items()):
+        print("Plugin %-19s processed %d dropped %d queue max %d, latency ms %s" % (name,
+              p["processed"], p["dropped"], p["queueHigh"], show(p["latencyMs"])))
+
+def main():
+    parser = OptionParser("""%prog [options]
+
+This script simulates the acquisition pipeline of ADVimba, to predict dropped
+frames, the maxMemory needed and latencies. See tools/README.md.""")
+    parser.add_option("", "--env", dest="env", default=None,
+                      help="read IMAGE_XSIZE, IMAGE_YSIZE, IMAGE_TYPE and IMAGE_COLORMODE from this .env file")
+    parser.add_option("", "--xsize", type="int", dest="xsize", default=None, help="image width")
+    parser.add_option("", "--ysize", type="int", dest="ysize", default=None, help="image height")
+    parser.add_option("", "--type", dest="type", default=None, choices=list(typeBytes),
+                      help="NDArray data type (default: UInt8)")
+    parser.add_option("", "--colormode", type="int", dest="colormode", default=None,
+                      help="0=Mono, 1=Bayer, 2=RGB (default: 0)")
+    parser.add_option("-f", "--frame-rate", type="float", dest="frameRate", default=30.0,
+                      help="frames per second (default: 30)")
+    parser.add_option("", "--jitter", type="float", dest="jitter", default=0.0,
+                      help="standard deviation of the frame period as a fraction of it (default: 0)")
+    parser.add_option("-t", "--duration", type="float", dest="duration", default=60.0,
+                      help="seconds of acquisition to simulate (default: 60)")
+    parser.add_option("", "--max-memory", type="int", dest="maxMemory", default=0,
+                      help="maxMemory of ADVimbaConfig in bytes, 0 for unlimited (default: 0)")
+    parser.add_option("", "--queue-depth", type="int", dest="queueDepth", default=NUM_VIMBA_BUFFERS,
+                      help="Vimba frame buffers (default: %d)" % NUM_VIMBA_BUFFERS)
+    parser.add_option("", "--convert-ms", dest="convert", default="0",
+                      help="pixel conversion time in processFrame, mean_ms[/cv] (default: 0)")
+    parser.add_option("", "--memcpy-gbs", type="float", dest="memcpy", default=5.0,
+                      help="memcpy rate into the NDArray in GB/s (default: 5)")
+    parser.add_option("", "--overhead-ms", dest="overhead", default="0.05",
+                      help="rest of processFrame: attributes, timestamps, mean_ms[/cv] (default: 0.05)")
+    parser.add_option("", "--statistics-ms", dest="statistics", default="0",
+                      help="reading the transport layer statistics features, mean_ms[/cv] (default: 0)")
+    parser.add_option("", "--grab-task-ms", dest="grabTask", default="0.02",
+                      help="time imageGrabTask holds the lock, mean_ms[/cv] (default: 0.02)")
+    parser.add_option("", "--port-rate", type="float", dest="portRate", default=0.0,
+                      help="other port requests that take the lock per second (default: 0)")
+    parser.add_option("", "--port-ms", dest="portHold", default="0.1",
+                      help="time each other port request holds the lock, mean_ms[/cv] (default: 0.1)")
+    parser.add_option("-p", "--plugin", dest="plugins", action="append", default=[],
+                      help="downstream plugin, name:mean_ms[/cv][:queue[:threads[:blocking]]], may be repeated")
+    parser.add_option("", "--seed", type="int", dest="seed", default=0, help="random seed (default: 0)")
+    parser.add_option("-o", "--output", dest="output", default=None,
+                      help="write the results as json to this file")
+    options, args = parser.parse_args()
+    if args:
+        parser.error("Incorrect number of arguments")
+    image = dict(xsize = None, ysize = None, type = "UInt8", colormode = 0)
+    if options.env:
+        image.update(read_env(options.env))
+    for name in image:
+        if getattr(options, name) is not None:
+            image[name] = getattr(options, name)
+    if image["xsize"] is None or image["ysize"] is None:
+        parser.error("Need --env or --xsize and --ysize")
+    def distribution(text):
+        mean, _, cv = text.partition("/")
+        return Distribution(float(mean) / 1e3, float(cv or 0))
+    try:
+        plugins = [parse_plugin(spec) for spec in options.plugins]
+    except ValueError as e:
+        parser.error(str(e))
+    nbytes = frame_bytes(**image)
+    sim = PipelineSim(nbytes, options.frameRate, plugins, options.maxMemory, options.queueDepth,
+                      convert = distribution(options.convert), memcpyRate = options.memcpy * 1e9,
+                      overhead = distribution(options.overhead), statistics = distribution(options.statistics),
+                      jitter = options.jitter, grabTaskHold = distribution(options.grabTask),
+                      portRate = options.portRate, portHold = distribution(options.portHold),
+                      seed = options.seed)
+    print("%dx%d %s colormode %d, %.2f MB per frame at %.1f fps for %.1f s" % (image["xsize"], image["ysize"],
+          image["type"], image["colormode"], nbytes / 1e6, options.frameRate, options.duration))
+    results = sim.run(options.duration)
+    report(results, nbytes)
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(dict(image = image, frameBytes = nbytes, options = options.__dict__, results = results),
+                      f, indent=2, sort_keys=True, default=str)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
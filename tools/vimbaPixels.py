@@ -0,0 +1,345 @@
+#!/bin/env python3
+import os, re, sys, time, json
+from optparse import OptionParser
+
+import numpy as np
+
+# The sensor sizes of the cameras the driver ships .env files for
+default_env_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vimbaApp", "Db")
+
+# The conversions ADVimba::processFrame asks VmbImageTransform for, by the
+# value of VMBConvertPixelFormat
+conversions = ["None", "Mono8", "Mono16", "RGB8", "RGB16"]
+
+# The input pixel formats handled here, as (bits per pixel, packed, bayer)
+pixelFormats = {
+    "Mono8":        (8, False, False),
+    "Mono10":       (10, False, False),
+    "Mono10p":      (10, True, False),
+    "Mono12":       (12, False, False),
+    "Mono12Packed": (12, True, False),
+    "Mono12p":      (12, True, False),
+    "Mono14":       (14, False, False),
+    "Mono16":       (16, False, False),
+    "BayerRG8":     (8, False, True),
+}
+
+# bytes in a raw frame of a pixel format
+def frame_bytes(pixelFormat, width, height):
+    bits, packed, bayer = pixelFormats[pixelFormat]
+    if packed:
+        return width * height * bits // 8
+    return width * height * (1 if bits <= 8 else 2)
+
+class PixelConverter(object):
+    """Vectorized models of the pixel conversions done by the driver, which
+    write into output buffers that are allocated on first use and then reused
+    for every frame of the same size, unlike the buffer processFrame mallocs
+    for each frame. They do the same work as VmbImageTransform, to time it,
+    but haven't been checked against frames it converted, so the rounding
+    below is assumed.
+
+    Unpacked Mono10..Mono14 pixels are least significant bit aligned in 16
+    bits, as the camera sends them. Converting to Mono8 keeps the top 8 bits.
+    Widening to 16 bits copies the value, or shifts it up to the most
+    significant bit with msb. The 2x2 debayer gives each pixel the red and
+    blue of the 2x2 block starting at it and the floor of the mean of its two
+    greens, repeating the last row and column at the edges. A Bayer frame is
+    converted to Mono by debayering it and taking the BT.601 luma of each
+    pixel, (77 R + 150 G + 29 B) >> 8"""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.buffers = {}
+
+    # a reusable buffer of the given name, shape and type
+    def buffer(self, name, shape, dtype):
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = self.buffers[name] = np.empty(shape, dtype)
+        return buf
+
+    # GigE Vision Mono12Packed: 2 pixels in 3 bytes, with the top 8 bits of
+    # each pixel in bytes 0 and 2 and their low 4 bits in the two halves of
+    # byte 1
+    def unpack_mono12_packed(self, data):
+        raw = np.frombuffer(data, np.uint8, count=frame_bytes("Mono12Packed", self.width, self.height)).reshape(-1, 3)
+        out = self.buffer("mono16", (self.height, self.width), np.uint16)
+        flat = out.reshape(-1, 2)
+        b0, b1, b2 = raw[:, 0], raw[:, 1], raw[:, 2]
+        np.left_shift(b0, 4, out=flat[:, 0], dtype=np.uint16)
+        flat[:, 0] |= b1 & 0x0F
+        np.left_shift(b2, 4, out=flat[:, 1], dtype=np.uint16)
+        flat[:, 1] |= b1 >> 4
+        return out
+
+    # PFNC Mono12p: pixels packed least significant bit first, 2 in 3 bytes
+    def unpack_mono12p(self, data):
+        raw = np.frombuffer(data, np.uint8, count=frame_bytes("Mono12p", self.width, self.height)).reshape(-1, 3)
+        out = self.buffer("mono16", (self.height, self.width), np.uint16)
+        flat = out.reshape(-1, 2)
+        b0, b1, b2 = raw[:, 0], raw[:, 1], raw[:, 2]
+        np.bitwise_and(b1, 0x0F, out=flat[:, 0], dtype=np.uint16)
+        flat[:, 0] <<= 8
+        flat[:, 0] |= b0
+        np.left_shift(b2, 4, out=flat[:, 1], dtype=np.uint16)
+        flat[:, 1] |= b1 >> 4
+        return out
+
+    # PFNC Mono10p: pixels packed least significant bit first, 4 in 5 bytes
+    def unpack_mono10p(self, data):
+        raw = np.frombuffer(data, np.uint8, count=frame_bytes("Mono10p", self.width, self.height)).reshape(-1, 5)
+        out = self.buffer("mono16", (self.height, self.width), np.uint16)
+        flat = out.reshape(-1, 4)
+        # pixel i is the low bits of byte i shifted down by 2i, and the high
+        # bits from the bottom of byte i + 1
+        for i in range(4):
+            np.bitwise_and(raw[:, i + 1], (1 << (2 * i + 2)) - 1, out=flat[:, i], dtype=np.uint16)
+            flat[:, i] <<= 8 - 2 * i
+            flat[:, i] |= raw[:, i] >> (2 * i)
+        return out
+
+    # a frame of any Mono format as 8 bit or 16 bit pixels
+    def mono(self, data, pixelFormat):
+        bits, packed, bayer = pixelFormats[pixelFormat]
+        if pixelFormat == "Mono12Packed":
+            return self.unpack_mono12_packed(data)
+        elif pixelFormat == "Mono12p":
+            return self.unpack_mono12p(data)
+        elif pixelFormat == "Mono10p":
+            return self.unpack_mono10p(data)
+        dtype = np.uint8 if bits <= 8 else np.uint16
+        return np.frombuffer(data, dtype, count=self.width * self.height).reshape(self.height, self.width)
+
+    # BayerRG8 to RGB8 with the 2x2 debayer of VmbDebayerMode2x2
+    def debayer_rg8(self, data):
+        h, w = self.height, self.width
+        raw = np.frombuffer(data, np.uint8, count=w * h).reshape(h, w)
+        # the frame with its last row and column repeated
+        padded = self.buffer("padded", (h + 1, w + 1), np.uint8)
+        padded[:h, :w] = raw
+        padded[h, :w] = raw[h - 1]
+        padded[:, w] = padded[:, w - 1]
+        green = self.buffer("green", (h, w), np.uint16)
+        out = self.buffer("rgb8", (h, w, 3), np.uint8)
+        # the 2x2 block starting at each pixel
+        a, b = padded[:h, :w], padded[:h, 1:]
+        c, d = padded[1:, :w], padded[1:, 1:]
+        # (rows, columns, red, green 1, green 2, blue) for each phase of RGGB
+        phases = [(0, 0, a, b, c, d), (0, 1, b, a, d, c),
+                  (1, 0, c, a, d, b), (1, 1, d, b, c, a)]
+        for row, col, red, green1, green2, blue in phases:
+            o = out[row::2, col::2]
+            g = green[row::2, col::2]
+            o[..., 0] = red[row::2, col::2]
+            o[..., 2] = blue[row::2, col::2]
+            np.add(green1[row::2, col::2], green2[row::2, col::2], out=g, dtype=np.uint16)
+            g >>= 1
+            o[..., 1] = g
+        return out
+
+    # 8 bit or 16 bit pixels of bits significant bits as Mono8
+    def to_mono8(self, pixels, bits, name="mono8"):
+        if pixels.dtype == np.uint8:
+            return pixels
+        out = self.buffer(name, pixels.shape, np.uint8)
+        np.right_shift(pixels, bits - 8, out=out, casting="unsafe")
+        return out
+
+    # 8 bit or 16 bit pixels of bits significant bits copied into 16 bit
+    # pixels, shifted up to the most significant bit with msb, as the driver
+    # copies them into its NDArray
+    def to_16(self, pixels, bits, msb=False, name="wide16"):
+        shift = 16 - bits if msb else 0
+        out = self.buffer(name, pixels.shape, np.uint16)
+        np.left_shift(pixels, shift, out=out, dtype=np.uint16)
+        return out
+
+    # RGB8 pixels as their 8 bit luma
+    def luma(self, rgb):
+        out = self.buffer("luma", rgb.shape[:2], np.uint16)
+        np.multiply(rgb[..., 0], 77, out=out, dtype=np.uint16)
+        out += rgb[..., 1].astype(np.uint16) * 150
+        out += rgb[..., 2].astype(np.uint16) * 29
+        out >>= 8
+        mono = self.buffer("bayermono8", rgb.shape[:2], np.uint8)
+        mono[...] = out
+        return mono
+
+    # a frame of pixelFormat converted as VMBConvertPixelFormat asks
+    def convert(self, data, pixelFormat, conversion="None", msb=False):
+        bits, packed, bayer = pixelFormats[pixelFormat]
+        if bayer and conversion == "None":
+            pixels = self.mono(data, "Mono8")
+        elif bayer:
+            pixels = self.debayer_rg8(data)
+            if conversion in ["Mono8", "Mono16"]:
+                pixels = self.luma(pixels)
+        else:
+            pixels = self.mono(data, pixelFormat)
+            if conversion in ["RGB8", "RGB16"]:
+                pixels = self.gray_to_rgb(self.to_mono8(pixels, bits) if conversion == "RGB8" else pixels)
+        if conversion in ["Mono8", "RGB8"]:
+            return self.to_mono8(pixels, bits)
+        elif conversion in ["Mono16", "RGB16"]:
+            return self.to_16(pixels, bits, msb)
+        return pixels
+
+    # a Mono frame as RGB with equal colours
+    def gray_to_rgb(self, pixels):
+        out = self.buffer("rgb%d" % (pixels.itemsize * 8), pixels.shape + (3,), pixels.dtype)
+        out[...] = pixels[..., np.newaxis]
+        return out
+
+# Straightforward per pixel versions of the conversions, to check the
+# vectorized ones against on small frames. They are written from the same
+# assumptions, so they catch mistakes in the vectorizing, not differences
+# from VmbImageTransform
+def reference_unpack(data, pixelFormat, n):
+    data = bytearray(data)
+    pixels = []
+    if pixelFormat == "Mono12Packed":
+        for i in range(0, n // 2):
+            b0, b1, b2 = data[3 * i:3 * i + 3]
+            pixels += [(b0 << 4) | (b1 & 0xF), (b2 << 4) | (b1 >> 4)]
+    else:
+        # least significant bit first packing
+        bits = pixelFormats[pixelFormat][0]
+        value = int.from_bytes(bytes(data[:n * bits // 8]), "little")
+        pixels = [(value >> (bits * i)) & ((1 << bits) - 1) for i in range(n)]
+    return pixels
+
+def reference_debayer_rg8(raw, width, height):
+    def at(y, x):
+        return raw[min(y, height - 1) * width + min(x, width - 1)]
+    out = []
+    for y in range(height):
+        for x in range(width):
+            block = {}
+            for dy in range(2):
+                for dx in range(2):
+                    colour = "RGGB"[((y + dy) % 2) * 2 + (x + dx) % 2]
+                    block.setdefault(colour, []).append(at(y + dy, x + dx))
+            out.append((block["R"][0], sum(block["G"]) // 2, block["B"][0]))
+    return out
+
+def reference_luma(rgb):
+    return [(77 * r + 150 * g + 29 * b) >> 8 for r, g, b in rgb]
+
+# check the vectorized conversions against the reference ones on random
+# frames, returning a list of the ones that differ
+def verify(width=16, height=6, seed=0):
+    rng = np.random.RandomState(seed)
+    failures = []
+    converter = PixelConverter(width, height)
+    for pixelFormat in ["Mono12Packed", "Mono12p", "Mono10p"]:
+        data = rng.randint(0, 256, frame_bytes(pixelFormat, width, height)).astype(np.uint8).tobytes()
+        got = converter.mono(data, pixelFormat).ravel().tolist()
+        if got != reference_unpack(data, pixelFormat, width * height):
+            failures.append(pixelFormat)
+    data = rng.randint(0, 256, width * height).astype(np.uint8).tobytes()
+    got = [tuple(p) for p in converter.debayer_rg8(data).reshape(-1, 3).tolist()]
+    rgb = reference_debayer_rg8(bytearray(data), width, height)
+    if got != rgb:
+        failures.append("BayerRG8")
+    if converter.convert(data, "BayerRG8", "Mono8").ravel().tolist() != reference_luma(rgb):
+        failures.append("BayerRG8 to Mono8")
+    # widening copies into the reused buffer, it doesn't hand back the frame
+    data = rng.randint(0, 256, frame_bytes("Mono12", width, height)).astype(np.uint8).tobytes()
+    wide = converter.convert(data, "Mono12", "Mono16")
+    if not wide.flags.writeable or wide.tobytes() != data:
+        failures.append("Mono12 to Mono16")
+    # and round trip a frame of 12 bit pixels through both packings
+    pixels = rng.randint(0, 4096, width * height)
+    packed = bytearray()
+    for p0, p1 in zip(pixels[0::2], pixels[1::2]):
+        packed += bytes([p0 >> 4, (p0 & 0xF) | ((p1 & 0xF) << 4), p1 >> 4])
+    if converter.mono(bytes(packed), "Mono12Packed").ravel().tolist() != pixels.tolist():
+        failures.append("Mono12Packed round trip")
+    return failures
+
+# the (camera, width, height) of the .env files in directory
+def env_sensor_sizes(directory=default_env_dir):
+    sizes = []
+    for f in sorted(os.listdir(directory)):
+        if not f.endswith(".env"):
+            continue
+        text = open(os.path.join(directory, f)).read()
+        x = re.search(r'"IMAGE_XSIZE",\s*"(\d+)"', text)
+        y = re.search(r'"IMAGE_YSIZE",\s*"(\d+)"', text)
+        if x and y:
+            sizes.append((f[:-len(".env")], int(x.group(1)), int(y.group(1))))
+    return sizes
+
+# the fastest time of repeat runs of function, after one to warm up
+def best_time(function, repeat):
+    function()
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+# time each conversion at width x height, both with reused buffers and with a
+# new converter, so new buffers, for every frame as processFrame does
+def bench_size(width, height, cases, repeat=10):
+    results = []
+    rng = np.random.RandomState(0)
+    converter = PixelConverter(width, height)
+    for pixelFormat, conversion in cases:
+        data = rng.randint(0, 256, frame_bytes(pixelFormat, width, height)).astype(np.uint8).tobytes()
+        reused = best_time(lambda: converter.convert(data, pixelFormat, conversion), repeat)
+        fresh = best_time(lambda: PixelConverter(width, height).convert(data, pixelFormat, conversion), repeat)
+        out = converter.convert(data, pixelFormat, conversion)
+        results.append(dict(pixelFormat = pixelFormat, conversion = conversion,
+                            width = width, height = height,
+                            inBytes = len(data), outBytes = out.nbytes,
+                            seconds = reused, freshSeconds = fresh,
+                            framesPerSecond = 1.0 / reused,
+                            megabytesPerSecond = len(data) / reused / 1e6))
+    return results
+
+default_cases = [("Mono12Packed", "None"), ("Mono12p", "None"), ("Mono10p", "None"),
+                 ("Mono12Packed", "Mono8"), ("Mono12", "Mono8"), ("Mono12", "Mono16"),
+                 ("Mono8", "Mono16"), ("BayerRG8", "Mono8"), ("BayerRG8", "RGB8"), ("BayerRG8", "RGB16")]
+
+def main():
+    parser = OptionParser("""%prog [options]
+
+This script checks and times NumPy versions of the pixel conversions of
+processFrame. See tools/README.md.""")
+    parser.add_option("", "--size", dest="sizes", action="append", default=None, metavar="WIDTHxHEIGHT",
+                      help="sensor size to time, may be repeated (default: the sizes in vimbaApp/Db/*.env)")
+    parser.add_option("-r", "--repeat", type="int", dest="repeat", default=10,
+                      help="frames to time each conversion over (default: 10)")
+    parser.add_option("-o", "--output", dest="output", default=None,
+                      help="write the results as json to this file")
+    options, args = parser.parse_args()
+    if args:
+        parser.error("Incorrect number of arguments")
+    failures = verify()
+    if failures:
+        print("Conversions that differ from the per pixel versions: %s" % ", ".join(failures))
+        sys.exit(1)
+    if options.sizes:
+        sizes = [("", int(w), int(h)) for w, h in (s.lower().split("x") for s in options.sizes)]
+    else:
+        sizes = env_sensor_sizes()
+    results = []
+    print("%-18s %-13s %-7s %9s %9s %9s %9s" % ("camera", "input", "convert", "ms", "new ms", "frames/s", "MB/s"))
+    for camera, width, height in sizes:
+        for r in bench_size(width, height, default_cases, options.repeat):
+            r["camera"] = camera
+            results.append(r)
+            print("%-18s %-13s %-7s %9.2f %9.2f %9.0f %9.0f" % (camera or "%dx%d" % (width, height),
+                  r["pixelFormat"], r["conversion"], r["seconds"] * 1e3, r["freshSeconds"] * 1e3,
+                  r["framesPerSecond"], r["megabytesPerSecond"]))
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(dict(numpy = np.__version__, results = results), f, indent=2, sort_keys=True)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/bin/env python3
+import os, sys, math, time, json, platform, tempfile, tracemalloc
+from contextlib import redirect_stdout, redirect_stderr
+from io import StringIO
+from optparse import OptionParser
+
+import makeDbAndEdl
+from makeDbAndEdl import open_genicam, read_nodes, FeatureModel, default_filters, \
+    db_records, layout_features_edl, features_edl
+from makeSyntheticGenICam import write_synthetic_genicam
+
+# The phases of makeDbAndEdl.py that are timed, in the order they run
+phases = ["sniff", "parse", "handle_node", "handle_category", "resolve_access",
+          "db", "edl", "invalidation"]
+
+# the xml files shipped with the driver
+default_xml_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "xml")
+
+# Run the phases of makeDbAndEdl.py on genicam_xml one after the other.
+# Each phase is a function of the state left by the ones before it
+def run_phases(genicam_xml, camera_name="Bench"):
+    state = {}
+    def sniff():
+        open_genicam(genicam_xml).read(1)
+    def parse():
+        state["nodes"] = list(read_nodes(genicam_xml))
+    def handle_node():
+        state["model"] = model = FeatureModel(default_filters)
+        for node in state["nodes"]:
+            model.handle_node(node)
+    def handle_category():
+        model = state["model"]
+        for category in model.categories:
+            model.handle_category(category)
+    def resolve_access():
+        state["model"].resolve_access()
+    def db():
+        with open(os.devnull, "w") as f:
+            f.writelines(db_records(state["model"], camera_name))
+    def edl():
+        with open(os.devnull, "w") as f:
+            f.writelines(features_edl(layout_features_edl(state["model"]), camera_name))
+    def invalidation():
+        state["model"].invalidated_features()
+    functions = locals()
+    for phase in phases:
+        yield phase, functions[phase], state
+
+# time each phase of genicam_xml, and if memory then measure the peak memory
+# allocated during each phase in a second run, as tracing slows it down.
+# Returns {phase: {"seconds": s, "peak_kb": kb}}
+def bench_file(genicam_xml, repeat=1, memory=True):
+    results = dict((phase, {"seconds": None}) for phase in phases)
+    # the messages about skipped features are not what is being timed
+    with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
+        for i in range(repeat):
+            for phase, function, state in run_phases(genicam_xml):
+                start = time.perf_counter()
+                function()
+                t = time.perf_counter() - start
+                if results[phase]["seconds"] is None or t < results[phase]["seconds"]:
+                    results[phase]["seconds"] = t
+            model = state["model"]
+        if memory:
+            tracemalloc.start()
+            try:
+                for phase, function, state in run_phases(genicam_xml):
+                    tracemalloc.reset_peak()
+                    before = tracemalloc.get_traced_memory()[0]
+                    function()
+                    results[phase]["peak_kb"] = (tracemalloc.get_traced_memory()[1] - before) // 1024
+                # what is still held at the end
+                total_kb = tracemalloc.get_traced_memory()[0] // 1024
+            finally:
+                tracemalloc.stop()
+    info = dict(bytes = os.path.getsize(genicam_xml),
+                nodes = len(model.lookup) + len(model.structEntries),
+                features = len(model.features),
+                seconds = sum(r["seconds"] for r in results.values()),
+                phases = results)
+    if memory:
+        info["model_kb"] = total_kb
+    return info
+
+# The slope of log(seconds) against log(features) for each phase, over the
+# runs that took long enough to time. 1 is linear, 2 is quadratic
+def scaling_exponents(runs, min_seconds=0.005):
+    exponents = {}
+    for phase in phases + ["total"]:
+        points = []
+        for run in runs:
+            t = run["seconds"] if phase == "total" else run["phases"][phase]["seconds"]
+            if t >= min_seconds and run["features"] > 0:
+                points.append((math.log(run["features"]), math.log(t)))
+        if len(points) < 2:
+            continue
+        mx = sum(x for x, y in points) / len(points)
+        my = sum(y for x, y in points) / len(points)
+        sxx = sum((x - mx) ** 2 for x, y in points)
+        if sxx == 0:
+            continue
+        exponents[phase] = sum((x - mx) * (y - my) for x, y in points) / sxx
+    return exponents
+
+def main():
+    parser = OptionParser("""%prog [options] [genicam_xml ...]
+
+This script times each phase of makeDbAndEdl.py (header sniffing, parsing,
+handle_node, handle_category, resolving access modes, writing the db, writing
+the edm screen and working out the invalidation groups) and measures the peak
+memory allocated in each. It runs on the given xml files, or the ones shipped
+in xml/, and then on synthetic xml files made by makeSyntheticGenICam.py with
+an increasing number of features.
+
+The growth of the time of each phase with the number of features is fitted
+as features**exponent. A phase whose exponent is above --max-exponent is
+reported as superlinear, and the script exits with status 1, so that a change
+that makes the generator quadratic is caught before a large vendor xml file
+hits it. The full results are written as json with --output.""")
+    parser.add_option("", "--sizes", dest="sizes", default="1000,3000,10000,30000,100000",
+                      help="comma separated feature counts of the synthetic files (default: 1000,3000,10000,30000,100000)")
+    parser.add_option("", "--depth", type="int", dest="depth", default=3,
+                      help="levels of categories in the synthetic files (default: 3)")
+    parser.add_option("", "--enum-size", type="int", dest="enum_size", default=8,
+                      help="number of entries in each synthetic Enumeration (default: 8)")
+    parser.add_option("", "--collisions", type="float", dest="collisions", default=0.05,
+                      help="fraction of synthetic feature names that collide as record names (default: 0.05)")
+    parser.add_option("-r", "--repeat", type="int", dest="repeat", default=1,
+                      help="time each file this many times and keep the fastest (default: 1)")
+    parser.add_option("", "--no-memory", action="store_false", dest="memory", default=True,
+                      help="don't measure the memory of each phase")
+    parser.add_option("", "--max-exponent", type="float", dest="max_exponent", default=1.5,
+                      help="fail if a phase grows faster than features**this (default: 1.5)")
+    parser.add_option("-o", "--output", dest="output", default=None,
+                      help="write the report as json to this file")
+    options, args = parser.parse_args()
+    if not args:
+        args = [os.path.join(default_xml_dir, f) for f in sorted(os.listdir(default_xml_dir))
+                if f.endswith(".xml")]
+    sizes = [int(n) for n in options.sizes.split(",") if n]
+
+    report = dict(python = platform.python_version(),
+                  platform = platform.platform(),
+                  generator = makeDbAndEdl.file_hash(makeDbAndEdl.__file__),
+                  files = [], synthetic = [])
+    print("%-40s %8s %8s  %s" % ("file", "features", "seconds", "  ".join("%s" % p for p in phases)))
+    def show(name, run):
+        print("%-40s %8d %8.3f  %s" % (name, run["features"], run["seconds"],
+              "  ".join("%*.3f" % (len(p), run["phases"][p]["seconds"]) for p in phases)))
+    for genicam_xml in args:
+        run = bench_file(genicam_xml, options.repeat, options.memory)
+        run["name"] = os.path.basename(genicam_xml)
+        report["files"].append(run)
+        show(run["name"], run)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for n in sizes:
+            genicam_xml = os.path.join(tmpdir, "synthetic_%d.xml" % n)
+            write_synthetic_genicam(genicam_xml, features=n, depth=options.depth,
+                                    enum_size=options.enum_size, collisions=options.collisions)
+            run = bench_file(genicam_xml, options.repeat, options.memory)
+            os.remove(genicam_xml)
+            run["name"] = "synthetic_%d" % n
+            run["size"] = n
+            report["synthetic"].append(run)
+            show(run["name"], run)
+    finally:
+        os.rmdir(tmpdir)
+
+    exponents = scaling_exponents(report["synthetic"])
+    report["scaling"] = dict((phase, dict(exponent=e, superlinear=e > options.max_exponent))
+                             for phase, e in exponents.items())
+    superlinear = [phase for phase, e in exponents.items() if e > options.max_exponent]
+    if exponents:
+        print("Scaling exponents: %s" % ", ".join("%s %.2f" % (p, exponents[p])
+                                                 for p in phases + ["total"] if p in exponents))
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if superlinear:
+        print("Superlinear phases: %s" % ", ".join(superlinear))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
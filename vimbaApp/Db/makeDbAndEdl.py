@@ -1,152 +1,609 @@
-#!/bin/env python
-import os, sys, re
-from xml.dom.minidom import parseString
+#!/bin/env python3
+import os, sys, re, copy, time, json, heapq, hashlib, threading
+from contextlib import contextmanager, nullcontext
+from io import StringIO
+from configparser import ConfigParser
+from xml.etree.ElementTree import iterparse
 from optparse import OptionParser
 
-# parse args
-parser = OptionParser("""%prog <genicam_xml> <camera_name>
-
-This script parses a genicam xml file and creates a database template and edm 
-screen to go with it. The edm screen should be used as indication of what
-the driver supports, and the generated summary screen should be edited to make
-a more sensible summary. The Db file will be generated in:
-  ../Db/<camera_name>.template
-and the edm files will be called:
-  ../op/edl/<camera_name>.edl
-  ../op/edl/<camera_name>-features.edl""")
-parser.add_option("", "--devInt64",
-                  action="store_true", dest="devInt64", default=False,
-                  help="use int64in and int64out records. Requires at least EPICS base 3.16.1 or EPICS 7.")
-options, args = parser.parse_args()
-if len(args) != 2:
-    parser.error("Incorrect number of arguments")
-if (options.devInt64):
-  GCIntegerInputRecordType = "int64in"
-  GCIntegerOutputRecordType = "int64out"
-else:
-  GCIntegerInputRecordType = "ai"
-  GCIntegerOutputRecordType = "ao"
+# top of the vimbaApp tree that Db and op/edl are written into
+default_prefix = os.path.abspath(os.path.join(os.path.dirname(__file__),".."))
+
+# strip the GenApi namespace from an ElementTree tag
+def localName(tag):
+    return tag.rpartition("}")[2]
+
+class GenICamFile(object):
+    """File-like wrapper that feeds the parser from the first line of xml,
+    so the rest of the file can be streamed straight from disk"""
+    def __init__(self, f, head):
+        self.f = f
+        self.head = head
+
+    def read(self, size=-1):
+        if self.head:
+            data, self.head = self.head, b""
+            return data
+        return self.f.read(size)
 
 # Check the first two lines of the feature xml file to see if arv-tool left
 # the camera id there, thus creating an unparsable file
 # Throw it away if it doesn't look like valid xml
 # A valid first line of an xml file will be optional whitespace followed by '<'
-genicam_lines = open(args[0]).readlines()
-try:
-    start_line = min(i for i in range(2) if genicam_lines[i].lstrip().startswith("<"))
-except:
-    print "Neither of these lines looks like valid XML:"
-    print "".join(genicam_lines[:2])
-    sys.exit(1)
-
-xml_root = parseString("".join(genicam_lines[start_line:]).lstrip())
-
-camera_name = args[1]
-prefix = os.path.abspath(os.path.join(os.path.dirname(__file__),".."))
-db_filename = os.path.join(prefix, "Db", camera_name + ".template")
-edl_filename = os.path.join(prefix, "op", "edl", camera_name + ".edl")
-edl_more_filename = os.path.join(prefix, "op", "edl", camera_name + "-features.edl")
-
-# function to read element children of a node
-def elements(node):
-    return [n for n in node.childNodes if n.nodeType == n.ELEMENT_NODE]  
-
-# a function to read the text children of a node
-def getText(node):
-    return ''.join([n.data for n in node.childNodes if n.nodeType == n.TEXT_NODE])
-
-# node lookup from nodeName -> node
-lookup = {}
-# lookup from nodeName -> recordName
-records = {}
-categories = []
-
-# function to create a lookup table of nodes
-def handle_node(node):
-    if node.nodeName == "Group":
-        for n in elements(node):
-            handle_node(n)
-    elif node.hasAttribute("Name"):
-        name = str(node.getAttribute("Name"))
-        lookup[name] = node
-        # Add a leading GC_ to the name to prevent identical record names to those in ADBase.template
-        recordName = "GC_" + name
-        if len(recordName) > 20:
-            words=re.findall('[a-zA-Z][^A-Z]*', recordName)
-            for i in range(len(words)):
-                word = words[i]
-                if (len(word) > 3):
-                    word = word[:3]
-                    words[i] = word
-                    s = ''
-                    recordName = s.join(words)
-                    if (len(recordName) <= 20): break
-        if len(recordName) > 20:
-            recordName = recordName[:20]
-        i = 0
-        while recordName in records.values():
-            recordName = recordName[:-len(str(i))] + str(i)
+def open_genicam(filename):
+    f = open(filename, "rb")
+    lines = [f.readline(), f.readline()]
+    for start_line in range(2):
+        if lines[start_line].lstrip().startswith(b"<"):
+            return GenICamFile(f, b"".join(lines[start_line:]).lstrip())
+    f.close()
+    raise ValueError("Neither of the first two lines of %s looks like valid XML:\n%s"
+                     % (filename, b"".join(lines).decode("ascii", "replace").rstrip()))
+
+class Feature(object):
+    """The parts of a GenICam node that are used to make the records and
+    screens, anything else (Address, Formula, Bit, ...) is thrown away while
+    the file is being parsed"""
+    __slots__ = ("name", "kind", "recordName", "accessMode", "imposedAccessMode",
+                 "pValue", "pVariables", "pIsLocked", "pInvalidators", "pSelected", "pLimits",
+                 "value", "access", "visibility", "streamable", "cachable", "pollingTime", "isVolatile",
+                 "pPort", "chunkID", "desc", "entries", "features", "structEntries")
+
+    def __init__(self, elem):
+        self.kind = localName(elem.tag)
+        self.name = elem.get("Name")
+        self.recordName = None
+        self.accessMode = None
+        self.imposedAccessMode = None
+        self.pValue = None
+        # inputs of a SwissKnife or Converter formula
+        self.pVariables = []
+        self.pIsLocked = None
+        # nodes whose changes invalidate this one
+        self.pInvalidators = []
+        # nodes that this selector selects between
+        self.pSelected = []
+        # pMin, pMax and pInc nodes of a number
+        self.pLimits = []
+        # constant Value of the node
+        self.value = None
+        # effective access mode, filled in by FeatureModel.resolve_access
+        self.access = None
+        # Beginner, Expert, Guru or Invisible
+        self.visibility = "Beginner"
+        # whether the feature is part of the settings saved for the camera
+        self.streamable = False
+        # how a register may be cached: NoCache, WriteThrough or WriteAround
+        self.cachable = None
+        # ms between the reads the camera suggests for a changing register
+        self.pollingTime = None
+        # whether the value can change without being written
+        self.isVolatile = False
+        # the Port a register is read through, and the ChunkID of a Port
+        # that reads the chunk data of each frame
+        self.pPort = None
+        self.chunkID = None
+        self.desc = ""
+        # [(name, value), ...] for an Enumeration
+        self.entries = []
+        # pFeature names for a Category
+        self.features = []
+        # StructEntry Features of a StructReg
+        self.structEntries = []
+        for child in elem:
+            tag = localName(child.tag)
+            if tag == "AccessMode":
+                if self.accessMode is None:
+                    self.accessMode = child.text
+            elif tag == "ImposedAccessMode":
+                self.imposedAccessMode = child.text
+            elif tag == "pValue":
+                if self.pValue is None:
+                    self.pValue = child.text or ""
+            elif tag == "pVariable":
+                self.pVariables.append(child.text)
+            elif tag == "pIsLocked":
+                self.pIsLocked = child.text
+            elif tag == "pInvalidator":
+                self.pInvalidators.append(child.text)
+            elif tag == "pSelected":
+                self.pSelected.append(child.text)
+            elif tag in ["pMin", "pMax", "pInc"]:
+                self.pLimits.append(child.text)
+            elif tag == "Value":
+                self.value = child.text
+            elif tag == "Visibility":
+                self.visibility = child.text
+            elif tag == "Streamable":
+                self.streamable = child.text == "Yes"
+            elif tag == "Cachable":
+                self.cachable = child.text
+            elif tag == "PollingTime":
+                self.pollingTime = int(child.text)
+            elif tag in ["IsVolatile", "pIsVolatile"]:
+                self.isVolatile = tag == "pIsVolatile" or child.text == "Yes"
+            elif tag == "pPort":
+                self.pPort = child.text
+            elif tag == "ChunkID":
+                self.chunkID = child.text
+            elif tag == "StructEntry":
+                self.structEntries.append(Feature(child))
+            elif tag in ["ToolTip", "Description"]:
+                self.desc = child.text or ""
+            elif tag == "pFeature":
+                self.features.append(child.text)
+            elif tag == "EnumEntry":
+                value = None
+                for n in child:
+                    if value is None and localName(n.tag) == "Value":
+                        value = n.text or ""
+                self.entries.append((child.get("Name", ""), value))
+        # StructEntries share the AccessMode, caching, invalidators and port
+        # of their StructReg by default
+        for entry in self.structEntries:
+            if entry.pPort is None:
+                entry.pPort = self.pPort
+            if entry.accessMode is None:
+                entry.accessMode = self.accessMode
+            if entry.cachable is None:
+                entry.cachable = self.cachable
+            if entry.pollingTime is None:
+                entry.pollingTime = self.pollingTime
+            entry.isVolatile = entry.isVolatile or self.isVolatile
+            entry.pInvalidators += self.pInvalidators
+
+# function to stream the nodes out of a genicam xml file, given by its name
+# or opened with open_genicam. Groups are flattened, and each node is turned
+# into a Feature and discarded from the tree as soon as it has been read, so
+# only the used parts of the file are kept in memory
+def read_nodes(source):
+    if isinstance(source, str):
+        source = open_genicam(source)
+    # stack of open elements, and whether their children are nodes
+    stack = []
+    holdsNodes = []
+    for event, elem in iterparse(source, events=("start", "end")):
+        if event == "start":
+            holdsNodes.append(not stack or (holdsNodes[-1] and localName(elem.tag) == "Group"))
+            stack.append(elem)
+            continue
+        stack.pop()
+        isContainer = holdsNodes.pop()
+        if stack and holdsNodes[-1]:
+            if not isContainer:
+                yield Feature(elem)
+            stack[-1].remove(elem)
+
+# access modes as bits, so they can be combined with &
+RO = 1
+WO = 2
+RW = RO | WO
+accessBits = {"NA": 0, "RO": RO, "WO": WO, "RW": RW}
+accessModes = ["NA", "RO", "WO", "RW"]
+
+# nodes whose access mode is that of the register itself
+registerNodes = ["IntReg", "MaskedIntReg", "FloatReg", "StringReg", "Register", "StructEntry"]
+
+# Tarjan's algorithm, without recursion, for the strongly connected parts of
+# a graph given as {node: [nodes it points to]}. Each part is returned after
+# all the parts it points to
+def strongly_connected(nodes, edges):
+    index = {}
+    low = {}
+    stack = []
+    onStack = set()
+    parts = []
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        onStack.add(root)
+        work = [(root, iter(edges[root]))]
+        while work:
+            v, children = work[-1]
+            for w in children:
+                if w not in index:
+                    index[w] = low[w] = len(index)
+                    stack.append(w)
+                    onStack.add(w)
+                    work.append((w, iter(edges[w])))
+                    break
+                elif w in onStack:
+                    low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+                if low[v] == index[v]:
+                    part = []
+                    while True:
+                        w = stack.pop()
+                        onStack.discard(w)
+                        part.append(w)
+                        if w == v:
+                            break
+                    parts.append(part)
+    return parts
+
+# Add a leading GC_ to the name to prevent identical record names to those in
+# ADBase.template, and shorten it to fit in 20 characters
+def make_record_name(name):
+    recordName = "GC_" + name
+    if len(recordName) > 20:
+        words=re.findall('[a-zA-Z][^A-Z]*', recordName)
+        for i in range(len(words)):
+            word = words[i]
+            if (len(word) > 3):
+                word = word[:3]
+                words[i] = word
+                s = ''
+                recordName = s.join(words)
+                if (len(recordName) <= 20): break
+    if len(recordName) > 20:
+        recordName = recordName[:20]
+    return recordName
+
+# GenICam visibility tiers, in the order they are shown
+visibilities = ["Beginner", "Expert", "Guru", "Invisible"]
+
+# The default filters, which leave every feature in
+default_filters = dict(visibility = "Invisible", include = [], exclude = [])
+
+class FeatureModel(object):
+    """Indexed collection of the features in a genicam file"""
+    def __init__(self, filters=default_filters):
+        # only features up to this visibility, in the include categories if
+        # there are any, and not in the exclude categories get records
+        self.filters = dict(default_filters, **filters)
+        # nodeName -> Feature
+        self.lookup = {}
+        # StructEntry name -> Feature, these are registers so don't get records
+        self.structEntries = {}
+        # recordName -> Feature
+        self.records = {}
+        # shortened name -> next number to try when it is already taken
+        self.suffixes = {}
+        # Category names in file order
+        self.categories = []
+        # features that appear in a category, in screen order, and their names
+        self.features = []
+        self.done = set()
+        # flat structure, [(title, [features...]), ...], and the categories in it
+        self.structure = []
+        # the sections of structure by the category they came from, as
+        # [(category, [(title, [features...]), ...]), ...]
+        self.pages = []
+        self.visited = set()
+        # features left out by the filters, {name: (reason, feature)}
+        self.dropped = {}
+        # what went wrong reading the file, printed with the messages of
+        # each run that uses the model
+        self.messages = []
+
+    # A record name for name that is not one of records, the record names of
+    # the model unless given, with suffixes the last alternative tried for
+    # each name
+    def allocate_record_name(self, name, records=None, suffixes=None):
+        if records is None:
+            records = self.records
+        if suffixes is None:
+            suffixes = self.suffixes
+        recordName = make_record_name(name)
+        if recordName not in records:
+            return recordName
+        # The nth alternative replaces the end of the name with n. Names are
+        # never released, so carry on from the last one tried for this name
+        short = recordName
+        i = suffixes.get(short, 0)
+        while True:
+            suffix = str(i)
+            recordName = short[:-len(suffix)] + suffix
             i += 1
-        records[name] = recordName
-        if node.nodeName == "Category":
-            categories.append(name)
-    elif node.nodeName != "StructReg":
-        print "Node has no Name attribute", node
-
-# list of all nodes    
-for node in elements(elements(xml_root)[0]):
-    handle_node(node)
-
-# Now make structure, [(title, [features...]), ...]
-structure = []
-doneNodes = []
-def handle_category(category):
-    # making flat structure, so if its already there then don't do anything
-    if category in [x[0] for x in structure]:
-        return
-    node = lookup[category]
-    # for each child feature of this node
-    features = []
-    cgs = []
-    for feature in elements(node):        
-        if feature.nodeName == "pFeature":
-            featureName = str(getText(feature))
-            featureNode = lookup[featureName]
-            if str(featureNode.nodeName) == "Category":
-                cgs.append(featureName)
+            if recordName not in records:
+                break
+        suffixes[short] = i
+        return recordName
+
+    # function to add a node to the lookup tables
+    def handle_node(self, node):
+        if node.name is not None:
+            self.lookup[node.name] = node
+            node.recordName = self.allocate_record_name(node.name)
+            self.records[node.recordName] = node
+            if node.kind == "Category":
+                self.categories.append(node.name)
+        elif node.kind != "StructReg":
+            self.messages.append("Node has no Name attribute %s" % node.kind)
+        for entry in node.structEntries:
+            self.structEntries[entry.name] = entry
+
+    # find a node or StructEntry by name
+    def node(self, name):
+        node = self.lookup.get(name)
+        if node is None:
+            node = self.structEntries.get(name)
+        return node
+
+    # the nodes whose access mode the access mode of node depends on
+    def access_inputs(self, node):
+        names = node.pVariables + [node.pValue, node.pIsLocked]
+        return [self.node(name) for name in names if name is not None]
+
+    # Work out the access mode of every node, so it can be looked up with
+    # node.access. Each node is only resolved once, and the graph is walked
+    # without recursion so long pValue chains and loops are handled
+    def resolve_access(self):
+        for node in list(self.lookup.values()) + list(self.structEntries.values()):
+            if node.access is not None:
+                continue
+            stack = [(node, False)]
+            # nodes on the path that is currently being resolved
+            visiting = set()
+            while stack:
+                n, inputsDone = stack.pop()
+                if n.access is not None:
+                    continue
+                if inputsDone:
+                    visiting.discard(n)
+                    n.access = self.node_access(n)
+                    continue
+                visiting.add(n)
+                stack.append((n, True))
+                for i in self.access_inputs(n):
+                    if i is None or i.access is not None:
+                        continue
+                    if i in visiting:
+                        self.messages.append("Circular reference from %s to %s, %s will not be readable or writable"
+                                             % (n.name, i.name, i.name))
+                        i.access = "NA"
+                    else:
+                        stack.append((i, False))
+
+    # access mode of node, once the access modes of its inputs are known
+    def node_access(self, node):
+        if node.kind in registerNodes:
+            # registers are read only unless they say otherwise
+            access = accessBits.get(node.accessMode or "RO", RW)
+        elif node.kind in ["SwissKnife", "IntSwissKnife"]:
+            # a formula can only be read
+            access = RO
+        elif node.pValue is not None:
+            target = self.node(node.pValue)
+            if target is None:
+                access = RO
             else:
-                if featureNode not in doneNodes:
-                    features.append(featureNode)   
-                    doneNodes.append(featureNode)
-    if features:
-        if len(features) > 32:
-            i = 1
-            while features:
-                structure.append((category+str(i), features[:32]))
-                i += 1
-                features = features[32:]
-        else:            
-            structure.append((category, features))
-    for category in cgs:
-        handle_category(category)
-
-for category in categories:
-    handle_category(category)
-    
-# Spit out a database file
-db_file = open(db_filename, "w")
-stdout = sys.stdout
-sys.stdout = db_file
-
-# print a header
-print '# Macros:'
-print '#% macro, P, Device Prefix'
-print '#% macro, R, Device Suffix'
-print '#% macro, PORT, Asyn Port name'
-print '#% macro, TIMEOUT, Timeout, default=1'
-print '#% macro, ADDR, Asyn Port address, default=0'
-print '#%% gui, $(PORT), edmtab, %s.edl, P=$(P),R=$(R)' % camera_name
-print 
+                access = accessBits[target.access]
+        else:
+            # the value is stored in the node itself
+            access = accessBits.get(node.accessMode or "RW", RW)
+        # a formula can only be read if all its inputs can
+        for variable in self.access_inputs(node):
+            if variable.name in node.pVariables and not accessBits[variable.access] & RO:
+                access &= WO
+        if node.imposedAccessMode:
+            access &= accessBits.get(node.imposedAccessMode, RW)
+        # a node locked by a constant that can't be changed can't be written
+        if node.pIsLocked is not None:
+            lock = self.node(node.pIsLocked)
+            if lock is not None and not accessBits[lock.access] & WO and \
+                    lock.value not in (None, "0"):
+                access &= RO
+        return accessModes[access]
+
+    # Work out which features have to be read again after each writable
+    # feature is written. Writing a feature writes the nodes on its pValue
+    # chain, and a change to a node changes the nodes that use it as pValue,
+    # pVariable, pMin, pMax or pInc, that it selects, or that list it as a
+    # pInvalidator. Returns [(feature, [features...]), ...] for the writable
+    # features in screen order
+    def invalidated_features(self):
+        nodes = list(self.lookup.values()) + list(self.structEntries.values())
+        # node name -> names of the nodes that change when it does
+        changes = dict((node.name, []) for node in nodes)
+        for node in nodes:
+            sources = node.pInvalidators + node.pVariables + node.pLimits
+            if node.pValue is not None:
+                sources.append(node.pValue)
+            for source in sources:
+                if source in changes:
+                    changes[source].append(node.name)
+            for selected in node.pSelected:
+                if selected in changes:
+                    changes[node.name].append(selected)
+        # features that have records are tracked by their index
+        indexes = dict((feature.name, i) for i, feature in enumerate(self.features))
+        # Find the loops in the graph, which are then treated as one node.
+        # The loops come out with the ones they change first, so the
+        # features each one changes can be added up as they go. A loop that
+        # only passes on the changes of one other shares its set
+        reaches = {}
+        empty = frozenset()
+        for loop in strongly_connected(list(changes), changes):
+            own = [indexes[name] for name in loop if name in indexes]
+            changed = {}
+            for name in loop:
+                for c in changes[name]:
+                    reach = reaches.get(c)
+                    if reach:
+                        changed[id(reach)] = reach
+            if not own and len(changed) <= 1:
+                reach = changed.popitem()[1] if changed else empty
+            else:
+                reach = frozenset(own).union(*changed.values())
+            for name in loop:
+                reaches[name] = reach
+        invalidated = []
+        for feature in self.features:
+            if not accessBits[feature.access] & WO:
+                continue
+            # the nodes written when feature is
+            reach = set()
+            node = feature
+            written = set()
+            while node is not None and node.name not in written:
+                written.add(node.name)
+                reach.update(reaches[node.name])
+                node = self.node(node.pValue) if node.pValue is not None else None
+            reach.discard(indexes[feature.name])
+            invalidated.append((feature, [self.features[i] for i in sorted(reach)]))
+        return invalidated
+
+    # function to add a category, and then its sub categories, to structure.
+    # Features in categories that are filtered out, or that are beyond the
+    # visibility filter, go in dropped instead
+    def handle_category(self, category):
+        include = self.filters["include"]
+        exclude = self.filters["exclude"]
+        maxVisibility = visibilities.index(self.filters["visibility"])
+        todo = [(category, None if not include else "not in included categories")]
+        while todo:
+            category, reason = todo.pop()
+            # making flat structure, so if its already there then don't do anything
+            if category in self.visited:
+                continue
+            self.visited.add(category)
+            if category in exclude:
+                reason = "category %s" % category
+            elif category in include:
+                reason = None
+            # for each child feature of this node
+            features = []
+            cgs = []
+            for featureName in self.lookup[category].features:
+                featureNode = self.lookup[featureName]
+                if featureNode.kind == "Category":
+                    cgs.append((featureName, reason))
+                elif featureName in self.done:
+                    pass
+                elif reason is not None:
+                    self.dropped.setdefault(featureName, (reason, featureNode))
+                elif featureNode.visibility in visibilities[maxVisibility + 1:]:
+                    self.dropped.setdefault(featureName, ("visibility %s" % featureNode.visibility, featureNode))
+                else:
+                    features.append(featureNode)
+                    self.features.append(featureNode)
+                    self.done.add(featureName)
+            if len(features) > 32:
+                sections = [(category + str(i // 32 + 1), features[i:i + 32])
+                            for i in range(0, len(features), 32)]
+            elif features:
+                sections = [(category, features)]
+            else:
+                sections = []
+            if sections:
+                self.structure += sections
+                self.pages.append((category, sections))
+            todo.extend(reversed(cgs))
+
+# function to parse a genicam xml file into a FeatureModel of all its nodes,
+# with their record names and access modes, before any filters are applied.
+# The phases are timed in stats, if it is given
+def parse_model(genicam_xml, stats=None):
+    model = FeatureModel()
+
+    with timed(stats, "sniff"):
+        f = open_genicam(genicam_xml)
+    with timed(stats, "parse"):
+        nodes = list(read_nodes(f))
+    # list of all nodes
+    with timed(stats, "index"):
+        for node in nodes:
+            model.handle_node(node)
+
+    # and work out which nodes can be written
+    with timed(stats, "access"):
+        model.resolve_access()
+    return model
+
+# The parsed model of a genicam xml file is cached next to it. The cache is
+# json, so reading it can't run anything: it is as trusted as the xml itself
+def model_cache_filename(genicam_xml):
+    return genicam_xml + ".model.json"
+
+# the slots of a Feature as json values, with its StructEntries by name
+def feature_values(node):
+    values = [getattr(node, slot) for slot in Feature.__slots__]
+    values[Feature.__slots__.index("structEntries")] = [entry.name for entry in node.structEntries]
+    return values
+
+# a Feature from feature_values, with its StructEntries looked up in structEntries
+def values_feature(values, structEntries):
+    node = Feature.__new__(Feature)
+    for slot, value in zip(Feature.__slots__, values):
+        setattr(node, slot, value)
+    node.entries = [tuple(entry) for entry in node.entries]
+    node.structEntries = [structEntries[name] for name in node.structEntries]
+    return node
+
+# the parsed model as json values, before any filters are applied
+def model_values(model):
+    return dict(nodes = [feature_values(node) for node in model.lookup.values()],
+                structEntries = [feature_values(entry) for entry in model.structEntries.values()],
+                suffixes = model.suffixes, messages = model.messages)
+
+# a FeatureModel from model_values
+def values_model(values):
+    model = FeatureModel()
+    for entryValues in values["structEntries"]:
+        entry = values_feature(entryValues, {})
+        model.structEntries[entry.name] = entry
+    for nodeValues in values["nodes"]:
+        node = values_feature(nodeValues, model.structEntries)
+        model.lookup[node.name] = node
+        model.records[node.recordName] = node
+        if node.kind == "Category":
+            model.categories.append(node.name)
+    model.suffixes = values["suffixes"]
+    model.messages = values["messages"]
+    return model
+
+# parse_model, through the cache of genicam_xml. The cache holds its key,
+# the hashes of the xml file and this script, and the model, which is only
+# used if the key matches. Otherwise the xml is parsed and the cache
+# written again, if it can be
+def load_model(genicam_xml, cache=True, stats=None):
+    if not cache:
+        return parse_model(genicam_xml, stats)
+    with timed(stats, "cache"):
+        key = dict(xml = file_hash(genicam_xml), generator = file_hash(os.path.abspath(__file__)))
+        cache_filename = model_cache_filename(genicam_xml)
+        try:
+            with open(cache_filename) as f:
+                cached = json.load(f)
+            if cached["key"] == key:
+                return values_model(cached["model"])
+        except Exception:
+            # a missing or unreadable cache is made again
+            pass
+    model = parse_model(genicam_xml, stats)
+    with timed(stats, "cache"):
+        try:
+            with open_output(cache_filename) as f:
+                json.dump(dict(key = key, model = model_values(model)), f, separators=(",", ":"))
+        except (IOError, OSError) as e:
+            model.messages.append("Can't cache the model of %s: %s" % (genicam_xml, e))
+    return model
+
+# function to read a genicam xml file into a FeatureModel, keeping the
+# features that pass filters. With cache the parsed model is kept in
+# <genicam_xml>.model.json for the next run
+def read_model(genicam_xml, filters=default_filters, cache=False, stats=None):
+    model = load_model(genicam_xml, cache, stats)
+    model.filters = dict(default_filters, **filters)
+    for category in model.filters["include"] + model.filters["exclude"]:
+        if category not in model.lookup:
+            model.messages.append("Category %s is not in %s" % (category, genicam_xml))
+
+    # Now make structure
+    with timed(stats, "categories"):
+        for category in model.categories:
+            model.handle_category(category)
+        # features that are in the structure after all
+        for name in model.done:
+            model.dropped.pop(name, None)
+    return model
 
 a_autosaveFields		= 'DESC LOLO LOW HIGH HIHI LLSV LSV HSV HHSV EGU TSE PREC'
 b_autosaveFields		= 'DESC ZSV OSV TSE'
@@ -154,189 +611,1012 @@ long_autosaveFields		= 'DESC LOLO LOW HIGH HIHI LLSV LSV HSV HHSV EGU TSE'
 mbb_autosaveFields		= 'DESC ZRSV ONSV TWSV THSV FRSV FVSV SXSV SVSV EISV NISV TESV ELSV TVSV TTSV FTSV FFSV TSE'
 string_autosaveFields	        = 'DESC TSE'
 
-# Create CamModel and CamType related PV's for navigation and labeling
-print 'record(stringin, "$(P)$(R)CamModel") {'
-print '  field(VAL,   "%s")' % camera_name
-print '  field(PINI,  "YES")'
-print '}'
-print
-print 'record(stringin, "$(P)$(R)CamModelScreen") {'
-print '  field(VAL,   "vimbaScreens/%s")' % camera_name
-print '  field(PINI,  "YES")'
-print '}'
-print
-print 'record(stringin, "$(P)$(R)CamType") {'
-print '  field(VAL,   "$(TYPE=vimba)")'
-print '  field(PINI,  "YES")'
-print '}'
-print
-print 'record(stringin, "$(P)$(R)CamTypeScreen") {'
-print '  field(VAL,   "vimbaScreens/$(TYPE=vimba)CamType.edl")'
-print '  field(PINI,  "YES")'
-print '}'
-print
-
 def	isNodeReadOnly( node ):
-    for n in elements(node):
-        if str(n.nodeName) == "AccessMode" and getText(n) == "RO":
-            return True
-        elif str(n.nodeName) == "pValue":
-            try:
-                regNode = lookup[getText(n)]
-            except:
-                regNode = None
-            if not regNode:
-                return True
-            return isNodeReadOnly( regNode )
-    return False
+    return node.access in ["RO", "NA"]
 
 ADGenICam_nodes = ['AcquisitionFrameRate', 'AcquisitionFrameRateEnable',
                    'TriggerSource', 'TriggerOverlap', 'TriggerSoftware',
                    'TriggerMode', 'ExposureMode', 'ExposureAuto', 'GainAuto',
                    'PixelFormat']
 
-# for each node
-for node in doneNodes:
-    nodeName = str(node.getAttribute("Name"))
-    if nodeName in ADGenICam_nodes:
-        print >>sys.stderr, "Skipping %s" % nodeName
-        continue
-    ro = isNodeReadOnly( node )
-    if node.nodeName in ["Integer", "IntConverter", "IntSwissKnife"]:
-        print('record(%s, "$(P)$(R)%s_RBV") {' % (GCIntegerInputRecordType, records[nodeName]))
-        print '  field(DTYP, "asynInt64")'
-        print '  field(INP,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_I_%s")' % nodeName
-        print '  field(SCAN, "I/O Intr")'
-        print '  field(DISA, "0")'        
-        print '  info( autosaveFields, "%s" )' % long_autosaveFields
-        print '}'
-        print
-        if ro:
-            continue        
-        print('record(%s, "$(P)$(R)%s") {' % (GCIntegerOutputRecordType, records[nodeName]))
-        print '  field(DTYP, "asynInt64")'
-        print '  field(OUT,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_I_%s")' % nodeName
-        print '  field(DISA, "0")'
-        print '  info( autosaveFields, "%s PINI VAL" )' % long_autosaveFields
-        print '}'
-        print        
-    elif node.nodeName in ["Boolean"]:
-        print 'record(bi, "$(P)$(R)%s_RBV") {' % records[nodeName]
-        print '  field(DTYP, "asynInt32")'
-        print '  field(INP,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_B_%s")' % nodeName
-        print '  field(SCAN, "I/O Intr")'
-        print '  field(ZNAM, "No")'
-        print '  field(ONAM, "Yes")'                        
-        print '  field(DISA, "0")'
-        print '  info( autosaveFields, "%s" )' % b_autosaveFields
-        print '}'
-        print
-        if ro:
-            continue        
-        print 'record(bo, "$(P)$(R)%s") {' % records[nodeName]
-        print '  field(DTYP, "asynInt32")'
-        print '  field(OUT,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_B_%s")' % nodeName
-        print '  field(ZNAM, "No")'
-        print '  field(ONAM, "Yes")'                                
-        print '  field(DISA, "0")'
-        print '  info( autosaveFields, "%s PINI VAL" )' % b_autosaveFields
-        print '}'
-        print           
-    elif node.nodeName in ["Float", "Converter", "SwissKnife"]:
-        print 'record(ai, "$(P)$(R)%s_RBV") {' % records[nodeName]
-        print '  field(DTYP, "asynFloat64")'
-        print '  field(INP,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_D_%s")' % nodeName
-        print '  field(PREC, "3")'        
-        print '  field(SCAN, "I/O Intr")'
-        print '  field(DISA, "0")'
-        print '  info( autosaveFields, "%s" )' % a_autosaveFields
-        print '}'
-        print    
-        if ro:
-            continue    
-        print 'record(ao, "$(P)$(R)%s") {' % records[nodeName]
-        print '  field(DTYP, "asynFloat64")'
-        print '  field(OUT,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_D_%s")' % nodeName
-        print '  field(PREC, "3")'
-        print '  field(DISA, "0")'
-        print '  info( autosaveFields, "%s PINI VAL" )' % a_autosaveFields
-        print '}'
-        print
-    elif node.nodeName in ["StringReg", "String"]:
-        print 'record(stringin, "$(P)$(R)%s_RBV") {' % records[nodeName]
-        print '  field(DTYP, "asynOctetRead")'
-        print '  field(INP,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_S_%s")' % nodeName
-        print '  field(SCAN, "I/O Intr")'
-        print '  field(DISA, "0")'
-        print '  info( autosaveFields, "%s" )' % string_autosaveFields
-        print '}'
-        print
-    elif node.nodeName in ["Command"]:
-        print 'record(longout, "$(P)$(R)%s") {' % records[nodeName]
-        print '  field(DTYP, "asynInt32")'
-        print '  field(OUT,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_C_%s")' % nodeName
-        print '  field(DISA, "0")'
-        print '  info( autosaveFields, "%s" )' % long_autosaveFields
-        print '}'
-        print         
-    elif node.nodeName in ["Enumeration"]:
-        enumerations = ""
-        i = 0
-        defaultVal = "0"
-        epicsId = ["ZR", "ON", "TW", "TH", "FR", "FV", "SX", "SV", "EI", "NI", "TE", "EL", "TV", "TT", "FT", "FF"]
-        for n in elements(node):
-            if str(n.nodeName) == "EnumEntry":
-                if i >= len(epicsId):
-                    print >> sys.stderr, "More than 16 enum entries for %s mbbi record, discarding additional options." % nodeName
-                    print >> sys.stderr, "   If needed, edit the Enumeration tag for %s to select the 16 you want." % nodeName
-                    break
-                name = str(n.getAttribute("Name"))
-                enumerations += '  field(%sST, "%s")\n' %(epicsId[i], name[:16])  #MCB 25
-                value = [x for x in elements(n) if str(x.nodeName) == "Value"]
-                assert value, "EnumEntry %s in node %s doesn't have a value" %(name, nodeName)                
-                if i == 0:
-                    defaultVal = getText(value[0])
-                enumerations += '  field(%sVL, "%s")\n' %(epicsId[i], getText(value[0]))
-                i += 1                
-        print 'record(mbbi, "$(P)$(R)%s_RBV") {' % records[nodeName]
-        print '  field(DTYP, "asynInt32")'
-        print '  field(INP,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_E_%s")' % nodeName
-        print enumerations,
-        print '  field(SCAN, "I/O Intr")'
-        print '  field(DISA, "0")'
-        print '  info( autosaveFields, "%s" )' % mbb_autosaveFields
-        print '}'
-        print
-        if ro:
-            continue        
-        print 'record(mbbo, "$(P)$(R)%s") {' % records[nodeName]
-        print '  field(DTYP, "asynInt32")'
-        print '  field(OUT,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_E_%s")' % nodeName
-        print '  field(DOL,  "%s")' % defaultVal
-        print enumerations,       
-        print '  field(DISA, "0")'
-        print '  info( autosaveFields, "%s PINI VAL" )' % mbb_autosaveFields
-        print '}'
-        print          
+# sha1 of the contents of a file, or None if it doesn't exist
+def file_hash(filename):
+    if not os.path.exists(filename):
+        return None
+    sha = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+# Write an output file through a temporary file next to it, which is then
+# renamed over it only if the contents have changed. This means the file is
+# never seen half written, and its mtime only changes when it has to
+@contextmanager
+def open_output(filename, mode="w", **kwargs):
+    tmp_filename = "%s.%d.%d.tmp" % (filename, os.getpid(), threading.get_ident())
+    try:
+        with open(tmp_filename, mode, **kwargs) as f:
+            yield f
+        if file_hash(tmp_filename) != file_hash(filename):
+            os.replace(tmp_filename, filename)
+    finally:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+# the peak resident memory of the process in kB, or None where it isn't known
+def max_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS gives bytes, Linux kB
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+class RunStats(object):
+    """Wall time and memory of each phase of a run, and counts of what it made"""
+    def __init__(self, traceMemory=False):
+        # {phase: {"seconds": s, "calls": n, "blocks": b}} in the order the
+        # phases first ran, where blocks is how many more blocks python has
+        # allocated at the end of the phase than at the start
+        self.phases = {}
+        # from model_counts
+        self.counts = {}
+        # with traceMemory the peak kB allocated in each phase is measured
+        # too, which makes the run several times slower. Only one run at a
+        # time can trace its memory
+        self.traceMemory = traceMemory
+
+    # time the body of a with statement as a phase, adding to any earlier
+    # run of the same phase. The blocks are those of the whole process, so
+    # they include what other threads allocate at the same time
+    @contextmanager
+    def phase(self, name):
+        trace = False
+        if self.traceMemory:
+            import tracemalloc
+            trace = not tracemalloc.is_tracing()
+            if trace:
+                tracemalloc.start()
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            p = self.phases.setdefault(name, dict(seconds = 0.0, calls = 0, blocks = 0))
+            p["seconds"] += seconds
+            p["calls"] += 1
+            p["blocks"] += sys.getallocatedblocks() - blocks
+            if trace:
+                p["peak_kb"] = max(p.get("peak_kb", 0), tracemalloc.get_traced_memory()[1] // 1024)
+                tracemalloc.stop()
+
+    # the stats as a dict that can be written as json
+    def as_dict(self):
+        return dict(seconds = sum(p["seconds"] for p in self.phases.values()),
+                    phases = [dict(p, name = name) for name, p in self.phases.items()],
+                    counts = self.counts,
+                    maxRssKb = max_rss_kb())
+
+# stats.phase(name), or nothing if there are no stats
+def timed(stats, name):
+    return nullcontext() if stats is None else stats.phase(name)
+
+# The header of a database, and the records for the camera model and for
+# each kind of feature. Readbacks are _RBV records scanned by the class of
+# their feature, demands carry the same fields and also save PINI and VAL
+db_header = '''# Macros:
+#%% macro, P, Device Prefix
+#%% macro, R, Device Suffix
+#%% macro, PORT, Asyn Port name
+#%% macro, TIMEOUT, Timeout, default=1
+#%% macro, ADDR, Asyn Port address, default=0
+#%% gui, $(PORT), edmtab, %(camera_name)s.edl, P=$(P),R=$(R)
+
+'''
+
+db_camera = '''record(stringin, "$(P)$(R)CamModel") {
+  field(VAL,   "%(camera_name)s")
+  field(PINI,  "YES")
+}
+
+record(stringin, "$(P)$(R)CamModelScreen") {
+  field(VAL,   "vimbaScreens/%(camera_name)s")
+  field(PINI,  "YES")
+}
+
+record(stringin, "$(P)$(R)CamType") {
+  field(VAL,   "$(TYPE=vimba)")
+  field(PINI,  "YES")
+}
+
+record(stringin, "$(P)$(R)CamTypeScreen") {
+  field(VAL,   "vimbaScreens/$(TYPE=vimba)CamType.edl")
+  field(PINI,  "YES")
+}
+
+'''
+
+db_integer_in = '''record(%(recordType)s, "$(P)$(R)%(recordName)s_RBV") {
+  field(DTYP, "asynInt64")
+  field(INP,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_I_%(nodeName)s")
+%(scanFields)s  field(DISA, "0")
+  info( autosaveFields, "%(autosaveFields)s" )
+}
+
+'''
+
+db_integer_out = '''record(%(recordType)s, "$(P)$(R)%(recordName)s") {
+  field(DTYP, "asynInt64")
+  field(OUT,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_I_%(nodeName)s")
+  field(DISA, "0")
+  info( autosaveFields, "%(autosaveFields)s PINI VAL" )
+}
+
+'''
+
+db_boolean_in = '''record(bi, "$(P)$(R)%(recordName)s_RBV") {
+  field(DTYP, "asynInt32")
+  field(INP,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_B_%(nodeName)s")
+%(scanFields)s  field(ZNAM, "No")
+  field(ONAM, "Yes")
+  field(DISA, "0")
+  info( autosaveFields, "%(autosaveFields)s" )
+}
+
+'''
+
+db_boolean_out = '''record(bo, "$(P)$(R)%(recordName)s") {
+  field(DTYP, "asynInt32")
+  field(OUT,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_B_%(nodeName)s")
+  field(ZNAM, "No")
+  field(ONAM, "Yes")
+  field(DISA, "0")
+  info( autosaveFields, "%(autosaveFields)s PINI VAL" )
+}
+
+'''
+
+db_float_in = '''record(ai, "$(P)$(R)%(recordName)s_RBV") {
+  field(DTYP, "asynFloat64")
+  field(INP,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_D_%(nodeName)s")
+  field(PREC, "3")
+%(scanFields)s  field(DISA, "0")
+  info( autosaveFields, "%(autosaveFields)s" )
+}
+
+'''
+
+db_float_out = '''record(ao, "$(P)$(R)%(recordName)s") {
+  field(DTYP, "asynFloat64")
+  field(OUT,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_D_%(nodeName)s")
+  field(PREC, "3")
+  field(DISA, "0")
+  info( autosaveFields, "%(autosaveFields)s PINI VAL" )
+}
+
+'''
+
+db_string_in = '''record(stringin, "$(P)$(R)%(recordName)s_RBV") {
+  field(DTYP, "asynOctetRead")
+  field(INP,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_S_%(nodeName)s")
+%(scanFields)s  field(DISA, "0")
+  info( autosaveFields, "%(autosaveFields)s" )
+}
+
+'''
+
+db_command_out = '''record(longout, "$(P)$(R)%(recordName)s") {
+  field(DTYP, "asynInt32")
+  field(OUT,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_C_%(nodeName)s")
+  field(DISA, "0")
+  info( autosaveFields, "%(autosaveFields)s" )
+}
+
+'''
+
+db_enum_in = '''record(mbbi, "$(P)$(R)%(recordName)s_RBV") {
+  field(DTYP, "asynInt32")
+  field(INP,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_E_%(nodeName)s")
+%(enumerations)s%(scanFields)s  field(DISA, "0")
+  info( autosaveFields, "%(autosaveFields)s" )
+}
+
+'''
+
+db_enum_out = '''record(mbbo, "$(P)$(R)%(recordName)s") {
+  field(DTYP, "asynInt32")
+  field(OUT,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_E_%(nodeName)s")
+  field(DOL,  "%(defaultVal)s")
+%(enumerations)s  field(DISA, "0")
+  info( autosaveFields, "%(autosaveFields)s PINI VAL" )
+}
+
+'''
+
+db_enum_fields = '''  field(%(epicsId)sST, "%(name)s")
+  field(%(epicsId)sVL, "%(value)s")
+'''
+
+epicsIds = ["ZR", "ON", "TW", "TH", "FR", "FV", "SX", "SV", "EI", "NI", "TE", "EL", "TV", "TT", "FT", "FF"]
+
+# The shape of the records made for each kind of feature
+record_shapes = {
+    "Integer": "Integer", "IntConverter": "Integer", "IntSwissKnife": "Integer",
+    "Boolean": "Boolean",
+    "Float": "Float", "Converter": "Float", "SwissKnife": "Float",
+    "StringReg": "String", "String": "String",
+    "Command": "Command",
+    "Enumeration": "Enum"}
+
+# (readback template, demand template, autosaveFields) for each shape of
+# record. Commands always get their demand record, and features that are
+# read only only get their readback
+db_shapes = dict(
+    Integer = (db_integer_in, db_integer_out, long_autosaveFields),
+    Boolean = (db_boolean_in, db_boolean_out, b_autosaveFields),
+    Float = (db_float_in, db_float_out, a_autosaveFields),
+    String = (db_string_in, None, string_autosaveFields),
+    Command = (None, db_command_out, long_autosaveFields),
+    Enum = (db_enum_in, db_enum_out, mbb_autosaveFields))
+
+# The shape of the records for a feature and whether it has a demand record,
+# or (None, False) if it doesn't get any
+def feature_shape(node):
+    shape = record_shapes.get(node.kind)
+    if shape is None:
+        return None, False
+    readback, demand, autosaveFields = db_shapes[shape]
+    return shape, demand is not None and (shape == "Command" or not isNodeReadOnly( node ))
+
+# The classes of feature whose readbacks are scanned differently. A settable
+# feature changes when it is written, a status one when a feature it is
+# worked out from is written, a constant never does, telemetry like a
+# temperature drifts by itself, and a statistic counts frames or packets
+scan_classes = ["settable", "status", "constant", "telemetry", "statistic"]
+
+# The SCAN of the readbacks of each class, and the features that are put in
+# another class than the one worked out from the xml, which a site can
+# change in the [scan] section of a --config file. Passive readbacks are
+# read once, when the IOC starts
+default_scan_policy = dict(
+    scans = dict(settable = "I/O Intr", status = "I/O Intr", constant = "Passive",
+                 telemetry = "5 second", statistic = "1 second"),
+    features = {})
+
+# the periodic scans of EPICS base, fastest first
+scan_periods = [(0.1, ".1 second"), (0.2, ".2 second"), (0.5, ".5 second"), (1.0, "1 second"),
+                (2.0, "2 second"), (5.0, "5 second"), (10.0, "10 second")]
+
+# Whether each node can change without being written, the shortest
+# PollingTime of the registers behind it, and whether writing another node
+# changes it, following the pValue and pVariable nodes it is worked out from.
+# Returns {name: (volatile, pollingTime, invalidated)}
+def node_dynamics(model):
+    dynamics = {}
+    for start in list(model.lookup.values()) + list(model.structEntries.values()):
+        stack = [(start, False)]
+        while stack:
+            node, inputsDone = stack.pop()
+            if node.name in dynamics and not inputsDone:
+                continue
+            inputs = [model.node(name) for name in [node.pValue] + node.pVariables if name is not None]
+            inputs = [i for i in inputs if i is not None]
+            if not inputsDone:
+                # None until the inputs are done, which cuts any loop
+                dynamics[node.name] = None
+                stack.append((node, True))
+                stack.extend((i, False) for i in inputs if i.name not in dynamics)
+                continue
+            volatile = node.isVolatile or node.cachable == "NoCache" or node.pollingTime is not None
+            pollingTimes = [node.pollingTime] if node.pollingTime is not None else []
+            invalidated = bool(node.pInvalidators)
+            for i in inputs:
+                if dynamics.get(i.name) is not None:
+                    v, p, inv = dynamics[i.name]
+                    volatile = volatile or v
+                    pollingTimes += [p] if p is not None else []
+                    invalidated = invalidated or inv
+            dynamics[node.name] = (volatile, min(pollingTimes) if pollingTimes else None, invalidated)
+    return dynamics
+
+# The scan class of each feature of model that gets a readback, as
+# {name: (class, pollingTime)}
+def feature_scan_classes(model, scan=default_scan_policy):
+    dynamics = node_dynamics(model)
+    categories = {}
+    for category, sections in model.pages:
+        for title, nodes in sections:
+            for node in nodes:
+                categories[node.name] = category
+    # chunk values change with every frame, like the statistics
+    chunks = set(node.name for node in chunk_features(model))
+    classes = {}
+    for node in model.features:
+        shape, hasDemand = feature_shape(node)
+        if shape is None or db_shapes[shape][0] is None:
+            continue
+        volatile, pollingTime, invalidated = dynamics.get(node.name) or (False, None, False)
+        if node.name in scan["features"]:
+            scanClass = scan["features"][node.name]
+        elif hasDemand:
+            scanClass = "settable"
+        elif node.name.startswith("Stat") or "Statistic" in categories.get(node.name, "") or \
+                node.name in chunks:
+            scanClass = "statistic"
+        elif volatile:
+            scanClass = "telemetry"
+        elif invalidated:
+            scanClass = "status"
+        else:
+            scanClass = "constant"
+        classes[node.name] = (scanClass, pollingTime)
+    return classes
+
+# The SCAN of the readback of a feature of scanClass. Telemetry is scanned as
+# often as the PollingTime of its registers asks, if that is faster than
+# the policy
+def readback_scan(scanClass, pollingTime, scan=default_scan_policy):
+    value = scan["scans"][scanClass]
+    periods = dict((name, seconds) for seconds, name in scan_periods)
+    if scanClass == "telemetry" and pollingTime is not None and value in periods:
+        for seconds, name in scan_periods:
+            if seconds >= pollingTime / 1000.0 and seconds < periods[value]:
+                value = name
+                break
+    return value
+
+# The SCAN of the readback of each feature of model, as {name: SCAN}
+def readback_scans(model, scan=default_scan_policy):
+    return dict((name, readback_scan(scanClass, pollingTime, scan))
+                for name, (scanClass, pollingTime) in feature_scan_classes(model, scan).items())
+
+# the SCAN field of a readback, and PINI for one that is only read at init
+def scan_fields(value):
+    text = '  field(SCAN, "%s")\n' % value
+    if value == "Passive":
+        text += '  field(PINI, "YES")\n'
+    return text
+
+# The number of records and asyn parameters that a feature gets
+def feature_cost(node):
+    shape, hasDemand = feature_shape(node)
+    if shape is None or node.name in ADGenICam_nodes:
+        return 0, 0
+    return (db_shapes[shape][0] is not None) + hasDemand, 1
+
+# print message to log, or when there is no log to stderr if it is an error
+# and to stdout if not. A run that is given a log keeps its messages to
+# itself, so runs for other cameras can go on in the same process
+def say(log, message, error=False):
+    print(message, file=log or (sys.stderr if error else sys.stdout))
+
+# print how many records and parameters each filter took out of model
+def report_filters(model, camera_name, log=None):
+    if not model.dropped:
+        return
+    removed = {}
+    for reason, node in model.dropped.values():
+        records, params = removed.get(reason, (0, 0))
+        cost = feature_cost(node)
+        removed[reason] = (records + cost[0], params + cost[1])
+    say(log, "%s: filters removed %d records and %d parameters" % (camera_name,
+        sum(r for r, p in removed.values()), sum(p for r, p in removed.values())))
+    for reason in sorted(removed):
+        say(log, "  %-40s %4d records %4d parameters" % ((reason,) + removed[reason]))
+
+# The features that get records, as (node, shape, has demand, enum entries)
+# where the enum entries are [(epicsId, string, value)...]. The features
+# that are left out, and the entries, are in feature_messages
+def feature_records(model):
+    for node in model.features:
+        nodeName = node.name
+        if nodeName in ADGenICam_nodes:
+            continue
+        shape, hasDemand = feature_shape(node)
+        if shape is None:
+            continue
+        entries = []
+        if shape == "Enum":
+            for i, (name, value) in enumerate(node.entries[:len(epicsIds)]):
+                assert value is not None, "EnumEntry %s in node %s doesn't have a value" %(name, nodeName)
+                entries.append((epicsIds[i], name[:16], value))  #MCB 25
+        yield node, shape, hasDemand, entries
+
+# The messages about the features of model that feature_records leaves out,
+# and the enums that lose entries
+def feature_messages(model):
+    messages = []
+    for node in model.features:
+        nodeName = node.name
+        shape, hasDemand = feature_shape(node)
+        if nodeName in ADGenICam_nodes:
+            messages.append("Skipping %s" % nodeName)
+        elif shape is None:
+            messages.append("Don't know what to do with %s (%s)" % (nodeName, node.kind))
+        elif shape == "Enum" and len(node.entries) > len(epicsIds):
+            messages.append("More than 16 enum entries for %s mbbi record, discarding additional options." % nodeName)
+            messages.append("   If needed, edit the Enumeration tag for %s to select the 16 you want." % nodeName)
+    return messages
+
+# Counts of what went into and came out of model: its nodes by kind, the
+# features that get records by shape, the ones that don't and why, the
+# record names that had to be changed to be unique, and the enums that lose
+# entries
+def model_counts(model):
+    def add(counts, key):
+        counts[key] = counts.get(key, 0) + 1
+    nodes = {}
+    for node in list(model.lookup.values()) + list(model.structEntries.values()):
+        add(nodes, node.kind)
+    emitted = {}
+    for node, shape, hasDemand, entries in feature_records(model):
+        add(emitted, shape)
+    skipped = {}
+    for node in model.features:
+        if node.name in ADGenICam_nodes:
+            add(skipped, "handled by ADGenICam")
+        elif feature_shape(node)[0] is None:
+            add(skipped, "no record for %s" % node.kind)
+    for reason, node in model.dropped.values():
+        add(skipped, reason)
+    costs = [feature_cost(node) for node in model.features]
+    return dict(nodes = sum(nodes.values()),
+                nodeKinds = dict(sorted(nodes.items())),
+                features = sum(emitted.values()),
+                featureShapes = dict(sorted(emitted.items())),
+                skipped = sum(skipped.values()),
+                skippedReasons = dict(sorted(skipped.items())),
+                records = sum(records for records, params in costs),
+                params = sum(params for records, params in costs),
+                renamed = len([node for node in model.lookup.values()
+                               if node.recordName != make_record_name(node.name)]),
+                truncatedEnums = [node.name for node in model.features
+                                  if node.name not in ADGenICam_nodes and feature_shape(node)[0] == "Enum"
+                                  and len(node.entries) > len(epicsIds)])
+
+# print the messages about reading model and about its features
+def report_messages(model, log=None):
+    for message in model.messages + feature_messages(model):
+        say(log, message, error=True)
+
+# Spit out a database file
+def write_db(model, camera_name, db_filename, devInt64=False, scan=default_scan_policy):
+    with open_output(db_filename) as db_file:
+        db_file.writelines(db_records(model, camera_name, devInt64, scan))
+
+# The text of the database for a camera, a record at a time
+def db_records(model, camera_name, devInt64=False, scan=default_scan_policy):
+    # the header, and CamModel and CamType related PV's for navigation and
+    # labeling
+    yield db_header % dict(camera_name=camera_name)
+    yield db_camera % dict(camera_name=camera_name)
+    # for each node
+    for node, text in feature_db(model, devInt64, scan):
+        yield text
+
+# The records of each feature that gets them, as (node, text)
+def feature_db(model, devInt64=False, scan=default_scan_policy):
+    if (devInt64):
+      GCIntegerInputRecordType = "int64in"
+      GCIntegerOutputRecordType = "int64out"
     else:
-        print >> sys.stderr, "Don't know what to do with %s (%s)" % (nodeName, node.nodeName)
-    
-# tidy up
-db_file.close()     
-sys.stdout = stdout
-
-# Spit out a feature screen
-edl_file = open(edl_more_filename, "w")
-w = 300
-h = 40
-x = 4
-y = 48
-text = ""
-defFontClass	= "helvetica"
-defFgColorCtrl	= 25
-defBgColorCtrl	= 5
-defFgColorMon	= 15
-defBgColorMon	= 12
+      GCIntegerInputRecordType = "ai"
+      GCIntegerOutputRecordType = "ao"
+
+    scans = readback_scans(model, scan)
+    for node, shape, hasDemand, entries in feature_records(model):
+        readback, demand, autosaveFields = db_shapes[shape]
+        fields = dict(recordName=node.recordName, nodeName=node.name, autosaveFields=autosaveFields,
+                      scanFields=scan_fields(scans.get(node.name, "I/O Intr")),
+                      enumerations="".join(db_enum_fields % dict(epicsId=epicsId, name=name, value=value)
+                                           for epicsId, name, value in entries),
+                      defaultVal=entries[0][2] if entries else "0")
+        text = ""
+        if readback:
+            text += readback % dict(fields, recordType=GCIntegerInputRecordType)
+        if hasDemand:
+            text += demand % dict(fields, recordType=GCIntegerOutputRecordType)
+        yield node, text
+
+# The header of the templates shared by all cameras in --substitutions mode
+db_shared_header = '''# Shared by the <camera_name>.substitutions files made by makeDbAndEdl.py
+# Macros:
+#%% macro, P, Device Prefix
+#%% macro, R, Device Suffix
+#%% macro, PORT, Asyn Port name
+#%% macro, TIMEOUT, Timeout, default=1
+#%% macro, ADDR, Asyn Port address, default=0
+%(macros)s
+'''
+
+# Quote a macro value in a substitutions file
+def quoteMacro(value):
+    return '"%s"' % value.replace("\\", "\\\\").replace('"', '\\"')
+
+# The name and text of the template shared by every feature with the same
+# shape of records, with the record and feature names as macros
+def shared_template(shape, hasDemand, devInt64=False):
+    readback, demand, autosaveFields = db_shapes[shape]
+    name = shape
+    if shape == "Integer" and devInt64:
+        name = "Int64"
+    if readback and demand and not hasDemand:
+        name += "RO"
+    macros = ["#% macro, NAME, Record name", "#% macro, FEATURE, GenICam feature name"]
+    fields = dict(recordName="$(NAME)", nodeName="$(FEATURE)", autosaveFields=autosaveFields,
+                  scanFields='  field(SCAN, "$(SCAN=I/O Intr)")\n  field(PINI, "$(PINI=NO)")\n')
+    if readback:
+        macros.append("#% macro, SCAN, Scan of the readback, default=I/O Intr")
+        macros.append("#% macro, PINI, Read the readback at init, default=NO")
+    if shape == "Enum":
+        # unused states get the mbbi/mbbo defaults
+        fields["enumerations"] = "".join(
+            db_enum_fields % dict(epicsId=epicsId, name="$(%sST=)" % epicsId, value="$(%sVL=0)" % epicsId)
+            for epicsId in epicsIds)
+        fields["defaultVal"] = "$(DOL=0)"
+        macros.append("#% macro, ZRST..FFST, ZRVL..FFVL, Enum strings and values, default=unused")
+        if hasDemand:
+            macros.append("#% macro, DOL, Initial value, default=0")
+    text = [db_shared_header % dict(macros="\n".join(macros))]
+    if readback:
+        text.append(readback % dict(fields, recordType="int64in" if name.startswith("Int64") else "ai"))
+    if hasDemand:
+        text.append(demand % dict(fields, recordType="int64out" if name.startswith("Int64") else "ao"))
+    return "vimbaFeature%s.template" % name, "".join(text)
+
+# Spit out a substitutions file that loads the shared templates once for each
+# feature, which expands to the same records as write_db. The shared templates
+# are written next to it. Returns the filenames of the shared templates
+def write_substitutions(model, camera_name, substitutions_filename, devInt64=False,
+                        scan=default_scan_policy):
+    directory = os.path.dirname(substitutions_filename)
+    camera_template = "vimbaFeatureCamera.template"
+    templates = {camera_template: db_shared_header % dict(macros="#% macro, CAMERA, Camera model")
+                                  + db_camera % dict(camera_name="$(CAMERA)")}
+    # template filename -> [{macro: value}...] in the order they first appear
+    rows = {camera_template: [dict(CAMERA=camera_name)]}
+    scans = readback_scans(model, scan)
+    for node, shape, hasDemand, entries in feature_records(model):
+        template, text = shared_template(shape, hasDemand, devInt64)
+        templates[template] = text
+        row = dict(NAME=node.recordName, FEATURE=node.name)
+        if scans.get(node.name, "I/O Intr") != "I/O Intr":
+            row["SCAN"] = scans[node.name]
+            if scans[node.name] == "Passive":
+                row["PINI"] = "YES"
+        if shape == "Enum":
+            if hasDemand:
+                row["DOL"] = entries[0][2] if entries else "0"
+            for epicsId, name, value in entries:
+                row[epicsId + "ST"] = name
+                row[epicsId + "VL"] = value
+        rows.setdefault(template, []).append(row)
+    for template, text in templates.items():
+        with open_output(os.path.join(directory, template)) as f:
+            f.write(text)
+    with open_output(substitutions_filename) as f:
+        f.write(db_header % dict(camera_name=camera_name))
+        for template, macros in rows.items():
+            f.write('file "%s" {\n' % template)
+            if all(list(row) == ["NAME", "FEATURE"] for row in macros):
+                f.write("  pattern { NAME, FEATURE }\n")
+                f.writelines("  { %s, %s }\n" % (quoteMacro(row["NAME"]), quoteMacro(row["FEATURE"]))
+                             for row in macros)
+            else:
+                f.writelines("  { %s }\n" % ", ".join("%s=%s" % (k, quoteMacro(v)) for k, v in row.items())
+                             for row in macros)
+            f.write("}\n\n")
+    return [os.path.join(directory, template) for template in templates]
+
+# Spit out the features that have to be read again after each writable
+# feature is written, as {feature: [features...]}, and print how many each one
+# invalidates
+def write_invalidation(model, camera_name, json_filename, invalidated=None, log=None):
+    if invalidated is None:
+        invalidated = model.invalidated_features()
+    with open_output(json_filename) as f:
+        f.write("{\n")
+        for i, (feature, features) in enumerate(invalidated):
+            f.write('  %s: %s%s\n' % (json.dumps(feature.name), json.dumps([x.name for x in features]),
+                                      "," if i < len(invalidated) - 1 else ""))
+        f.write("}\n")
+    if not invalidated:
+        return
+    fanouts = sorted(((len(features), feature.name) for feature, features in invalidated),
+                     key=lambda x: -x[0])
+    total = sum(n for n, name in fanouts)
+    say(log, "%s: writing any of %d features invalidates %.1f others on average, %d invalidate none"
+        % (camera_name, len(fanouts), float(total) / len(fanouts), len([n for n, name in fanouts if n == 0])))
+    say(log, "  largest fan-out: %s" % ", ".join("%s %d" % (name, n) for n, name in fanouts[:5]))
+
+# the node that writing node ends up writing, at the end of its pValue chain
+def written_node(model, node):
+    seen = set()
+    while node.pValue is not None and node.name not in seen:
+        seen.add(node.name)
+        target = model.node(node.pValue)
+        if target is None:
+            break
+        node = target
+    return node
+
+# The writable features that autosave should restore, in an order where each
+# one comes after the features whose writes change it, by the links that
+# invalidated_features follows, so an offset comes after the width that sets
+# its pMax. Features that change each other are kept in screen order. Only
+# the features the xml marks as Streamable are restored, or every writable
+# one if it marks none. A feature that writes the same node as one before it is
+# left out, as restoring both would write it twice. Returns (features,
+# loops, aliases) where loops are the lists of features that change each
+# other and aliases are (feature, the feature it is the same as)
+def settings_order(model, invalidated=None):
+    if invalidated is None:
+        invalidated = model.invalidated_features()
+    features = []
+    aliases = []
+    writers = {}
+    streamable = any(node.streamable for node in model.features)
+    for node in model.features:
+        if node.name in ADGenICam_nodes or (streamable and not node.streamable):
+            continue
+        shape, hasDemand = feature_shape(node)
+        if not hasDemand or shape == "Command":
+            continue
+        target = written_node(model, node).name
+        if target in writers:
+            aliases.append((node, writers[target]))
+            continue
+        writers[target] = node
+        features.append(node)
+    indexes = dict((node.name, i) for i, node in enumerate(features))
+    edges = dict((node.name, []) for node in features)
+    for feature, changed in invalidated:
+        if feature.name in edges:
+            edges[feature.name] = [node.name for node in changed if node.name in indexes]
+    # restore the loops as one, as soon as all the features that change them
+    # have been, taking the first in screen order when there is a choice
+    loops = [sorted(loop, key=indexes.get) for loop in strongly_connected(list(edges), edges)]
+    loopOf = {}
+    for i, loop in enumerate(loops):
+        for name in loop:
+            loopOf[name] = i
+    after = [set() for loop in loops]
+    waiting = [0] * len(loops)
+    for name, changed in edges.items():
+        for c in changed:
+            if loopOf[c] != loopOf[name] and loopOf[c] not in after[loopOf[name]]:
+                after[loopOf[name]].add(loopOf[c])
+                waiting[loopOf[c]] += 1
+    ready = [(indexes[loop[0]], i) for i, loop in enumerate(loops) if not waiting[i]]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        first, i = heapq.heappop(ready)
+        order += [features[indexes[name]] for name in loops[i]]
+        for j in after[i]:
+            waiting[j] -= 1
+            if not waiting[j]:
+                heapq.heappush(ready, (indexes[loops[j][0]], j))
+    loops = [[features[indexes[name]] for name in loop] for loop in loops if len(loop) > 1]
+    return order, loops, aliases
+
+settings_req_header = """# Autosave request file for the %(camera_name)s features, made by makeDbAndEdl.py.
+# Only the writable features that are Streamable are listed, each after the
+# features whose writes change it, so that restoring them in this order writes
+# each one once.
+# Load it with
+#   file "%(camera_name)s_settings.req", P=$(P), R=cam1:
+"""
+
+# Spit out an autosave request file for the writable features
+def write_settings_req(model, camera_name, req_filename, invalidated=None):
+    order, loops, aliases = settings_order(model, invalidated)
+    loopOf = dict((node.name, loop) for loop in loops for node in loop)
+    with open_output(req_filename) as f:
+        f.write(settings_req_header % dict(camera_name=camera_name))
+        for node in order:
+            loop = loopOf.get(node.name)
+            if loop is not None and node is loop[0]:
+                f.write("# these change each other: %s\n" % ", ".join(n.name for n in loop))
+            f.write("$(P)$(R)%s\n" % node.recordName)
+        for node, same in aliases:
+            f.write("# %s writes the same node as %s\n" % (node.name, same.name))
+
+# The features that switch chunk data on and pick the chunks, by their SFNC
+# names
+chunk_controls = ["ChunkModeActive", "ChunkSelector", "ChunkEnable"]
+
+# The features of model whose values come with each frame as chunk data
+# instead of being read from the camera: the ones read from a register on a
+# Port with a ChunkID, and the Chunk<entry> feature of each entry of the
+# ChunkSelector. Returns them in file order
+def chunk_features(model):
+    chunkPorts = set(node.name for node in model.lookup.values() if node.kind == "Port" and node.chunkID is not None)
+    chunks = set()
+    selector = model.lookup.get("ChunkSelector")
+    if selector is not None:
+        chunks.update("Chunk" + name for name, value in selector.entries)
+    for node in model.lookup.values() if chunkPorts else []:
+        if node.kind not in record_shapes:
+            continue
+        # follow the pValue chain and formula variables to the registers
+        seen = set()
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n is None or n.name in seen:
+                continue
+            seen.add(n.name)
+            if n.pPort in chunkPorts:
+                chunks.add(node.name)
+                break
+            stack += [model.node(name) for name in n.pVariables + [n.pValue] if name]
+    return [node for node in model.lookup.values()
+            if node.name in chunks and node.name not in chunk_controls and node.kind in record_shapes]
+
+# The header of the records that switch chunk data on and pick the chunks
+db_chunk_header = '''# Records that pick the chunks %(camera_name)s sends with each frame,
+# made by makeDbAndEdl.py. Load it with %(camera_name)s.template, and use
+# %(camera_name)s-chunk-attributes.xml as the NDAttributesFile to put the
+# chunk values in the attributes of each frame
+# Macros:
+#%% macro, P, Device Prefix
+#%% macro, R, Device Suffix
+#%% macro, PORT, Asyn Port name
+#%% macro, TIMEOUT, Timeout, default=1
+#%% macro, ADDR, Asyn Port address, default=0
+
+'''
+
+# Whether to send one chunk. As ChunkEnable is selected by ChunkSelector,
+# the chunks are written one after the other along a chain that selects each
+# chunk and then writes whether it is sent, each write starting when the
+# one before it has finished. Changing any chunk runs the whole chain, as
+# does iocInit once autosave has restored the choices
+db_chunk_enable = '''record(bo, "$(P)$(R)%(recordName)s_En") {
+  field(DESC, "%(desc)s")
+  field(ZNAM, "No")
+  field(ONAM, "Yes")
+  field(FLNK, "$(P)$(R)%(firstName)s_EnGo")
+  info( autosaveFields, "VAL" )
+}
+
+record(seq, "$(P)$(R)%(recordName)s_EnGo") {
+  field(SELM, "All")
+  field(DOL1, "%(value)s")
+  field(LNK1, "$(P)$(R)%(recordName)s_EnSel.VAL PP")
+%(pini)s}
+
+record(longout, "$(P)$(R)%(recordName)s_EnSel") {
+  field(DTYP, "asynInt32")
+  field(OUT,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_E_ChunkSelector")
+  field(FLNK, "$(P)$(R)%(recordName)s_EnSet")
+}
+
+record(bo, "$(P)$(R)%(recordName)s_EnSet") {
+  field(DTYP, "asynInt32")
+  field(OUT,  "@asyn($(PORT),$(ADDR=0),$(TIMEOUT=1))GC_B_ChunkEnable")
+  field(OMSL, "closed_loop")
+  field(DOL,  "$(P)$(R)%(recordName)s_En NPP")
+  field(ZNAM, "No")
+  field(ONAM, "Yes")
+%(next)s}
+
+'''
+
+# The NDAttributes file of the chunk values of a camera
+chunk_attributes_header = '''<?xml version="1.0" standalone="no" ?>
+<!-- The chunk data features of %(camera_name)s, made by makeDbAndEdl.py.
+     With ChunkModeActive on and the chunks picked with the records of
+     %(camera_name)s-chunk.template, these are sent with each frame -->
+<Attributes
+    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+    xsi:noNamespaceSchemaLocation="../../../../../ADCore/XML_schema/NDAttributes.xsd"
+    >
+'''
+
+chunk_attribute = '''    <Attribute name="%(name)s" type="PARAM" source="%(source)s" addr="0" datatype="%(datatype)s" description="%(desc)s"/>
+'''
+
+# The asyn parameter prefix and NDAttribute datatype of each shape of record
+chunk_attribute_types = dict(Integer = ("GC_I", "INT64"), Boolean = ("GC_B", "INT"), Float = ("GC_D", "DOUBLE"),
+                             String = ("GC_S", "STRING"), Enum = ("GC_E", "INT"))
+
+# The records that pick the chunks of model, if it has a writable
+# ChunkSelector that selects ChunkEnable, as (entry, recordName, text)
+def chunk_enable_records(model):
+    selector = model.lookup.get("ChunkSelector")
+    enable = model.lookup.get("ChunkEnable")
+    if selector is None or enable is None or "ChunkEnable" not in selector.pSelected or \
+            isNodeReadOnly(selector) or isNodeReadOnly(enable):
+        return []
+    # the names are kept from the records of the features, and from each
+    # other, without adding to the model, which can be shared by other runs
+    usedNames = set(model.records)
+    suffixes = dict(model.suffixes)
+    picks = []
+    for name, value in selector.entries:
+        chunk = model.lookup.get("Chunk" + name)
+        if chunk is not None and chunk.recordName is not None:
+            recordName = chunk.recordName
+        else:
+            recordName = model.allocate_record_name("Chunk" + name, usedNames, suffixes)
+            usedNames.add(recordName)
+        try:
+            value = int(value, 0)
+        except ValueError:
+            pass
+        picks.append((name, recordName, value))
+    records = []
+    for i, (name, recordName, value) in enumerate(picks):
+        nextName = picks[i + 1][1] if i + 1 < len(picks) else None
+        records.append((name, recordName, db_chunk_enable % dict(
+            recordName = recordName, firstName = picks[0][1], value = value,
+            desc = ("Send the %s chunk" % name)[:40],
+            pini = '  field(PINI, "YES")\n' if i == 0 else "",
+            next = '  field(FLNK, "$(P)$(R)%s_EnGo")\n' % nextName if nextName else "")))
+    return records
+
+# Spit out the records that pick the chunks of model to
+# <prefix>/Db/<camera_name>-chunk.template, with the records of the chunk
+# features and controls that the filters left out of the db, and an
+# NDAttributes file of the chunk values to
+# <prefix>/Db/<camera_name>-chunk-attributes.xml. Nothing is written for a
+# camera without chunk features. Returns the filenames written
+def write_chunk_files(model, camera_name, prefix=default_prefix, devInt64=False, scan=default_scan_policy,
+                      log=None):
+    chunks = chunk_features(model)
+    picks = chunk_enable_records(model)
+    if not chunks and not picks:
+        if "ChunkModeActive" in model.lookup:
+            say(log, "%s: ChunkModeActive, but no chunk features in the xml" % camera_name)
+        return []
+    inDb = set(node.name for node, shape, hasDemand, entries in feature_records(model))
+    controls = [model.lookup[name] for name in chunk_controls if name in model.lookup]
+    view = copy.copy(model)
+    view.features = [node for node in controls + chunks
+                     if node.name not in inDb and node.name not in ADGenICam_nodes
+                     and feature_shape(node)[0] is not None]
+    db_filename = os.path.join(prefix, "Db", camera_name + "-chunk.template")
+    with open_output(db_filename) as f:
+        f.write(db_chunk_header % dict(camera_name=camera_name))
+        f.writelines(text for node, text in feature_db(view, devInt64, scan))
+        f.writelines(text for name, recordName, text in picks)
+    xml_filename = os.path.join(prefix, "Db", camera_name + "-chunk-attributes.xml")
+    with open_output(xml_filename) as f:
+        f.write(chunk_attributes_header % dict(camera_name=camera_name))
+        for node in chunks:
+            shape = feature_shape(node)[0]
+            if shape not in chunk_attribute_types or node.name in ADGenICam_nodes:
+                continue
+            source, datatype = chunk_attribute_types[shape]
+            f.write(chunk_attribute % dict(name=node.name, source="%s_%s" % (source, node.name),
+                                           datatype=datatype, desc=xml_escape(" ".join(node.desc.split()))))
+        f.write("</Attributes>\n")
+    say(log, "%s: %d chunk features, %d chunks to pick, %d records added for features the filters left out"
+        % (camera_name, len(chunks), len(picks), len(view.features)))
+    return [db_filename, xml_filename]
+
+# Rough bytes of IOC memory taken by a record of each type on a 64 bit host,
+# with its record node and the private data of its asyn device support
+record_bytes = dict(ai=1250, ao=1300, bi=1000, bo=1050, longin=1000, longout=1000,
+                    int64in=1050, int64out=1050, mbbi=1850, mbbo=1900, stringin=1100)
+# and by an asyn parameter, with its name and the GenICam feature behind it
+param_bytes = 400
+
+# the asyn parameters by the kind of feature they are for
+param_kinds = dict(GC_I = "integer", GC_B = "boolean", GC_D = "float", GC_S = "string",
+                   GC_E = "enum", GC_C = "command")
+
+# What the db of camera_name costs the IOC that loads it: the records by
+# type, how many are I/O Intr, how many have each SCAN, the asyn parameters by kind, the enums that
+# lose entries, the estimated memory, and how many features ADGenICam reads
+# on each read of all features, which is every one with a parameter except
+# the commands
+def db_cost(model, camera_name, devInt64=False, scan=default_scan_policy):
+    records = {}
+    ioIntr = 0
+    scans = {}
+    params = set()
+    # the db is made as it would be written
+    db = "".join(db_records(model, camera_name, devInt64, scan))
+    for m in re.finditer(r'record\((\w+), "[^"]*"\) \{(.*?)\n\}', db, re.S):
+        recordType, body = m.groups()
+        records[recordType] = records.get(recordType, 0) + 1
+        if 'field(SCAN, "I/O Intr")' in body:
+            ioIntr += 1
+        scanField = re.search(r'field\(SCAN, "([^"]*)"\)', body)
+        if scanField:
+            scans[scanField.group(1)] = scans.get(scanField.group(1), 0) + 1
+        param = re.search(r'\)(GC_\w)_(\S+)"\)', body)
+        if param:
+            params.add(param.groups())
+    kinds = dict((kind, 0) for kind in sorted(param_kinds.values()))
+    for prefix, name in params:
+        kinds[param_kinds[prefix]] += 1
+    truncated = [node.name for node in model.features
+                 if node.name not in ADGenICam_nodes and feature_shape(node)[0] == "Enum" and len(node.entries) > len(epicsIds)]
+    recordMemory = sum(record_bytes.get(t, 1000) * n for t, n in records.items())
+    return dict(camera = camera_name,
+                records = sum(records.values()),
+                recordTypes = dict(sorted(records.items())),
+                ioIntr = ioIntr,
+                scans = dict(sorted(scans.items())),
+                params = len(params),
+                paramKinds = kinds,
+                truncatedEnums = truncated,
+                memory = dict(records = recordMemory, params = len(params) * param_bytes,
+                              total = recordMemory + len(params) * param_bytes),
+                readAll = len(params) - kinds["command"])
+
+# add up the costs of the cameras that one IOC loads
+def total_cost(costs):
+    total = dict(camera = "total", records = 0, recordTypes = {}, ioIntr = 0, scans = {}, params = 0,
+                 paramKinds = {}, truncatedEnums = [], memory = dict(records = 0, params = 0, total = 0),
+                 readAll = 0)
+    for cost in costs:
+        for key in ["records", "ioIntr", "params", "readAll"]:
+            total[key] += cost[key]
+        for key in ["recordTypes", "scans", "paramKinds", "memory"]:
+            for k, v in cost[key].items():
+                total[key][k] = total[key].get(k, 0) + v
+        total["truncatedEnums"] += ["%s:%s" % (cost["camera"], name) for name in cost["truncatedEnums"]]
+    return total
+
+# print a cost from db_cost, to log if it is given
+def report_cost(cost, log=None):
+    say(log, "%s: %d records, %d I/O Intr, %d asyn parameters, %d features read on each read all, %.1f kB"
+             % (cost["camera"], cost["records"], cost["ioIntr"], cost["params"], cost["readAll"],
+                cost["memory"]["total"] / 1024.0))
+    say(log, "  records:    %s" % ", ".join("%s %d" % x for x in sorted(cost["recordTypes"].items())))
+    say(log, "  scans:      %s" % ", ".join("%s %d" % x for x in sorted(cost["scans"].items())))
+    say(log, "  parameters: %s" % ", ".join("%s %d" % x for x in sorted(cost["paramKinds"].items())))
+    say(log, "  memory:     records %.1f kB, parameters %.1f kB" % (cost["memory"]["records"] / 1024.0,
+                                                                 cost["memory"]["params"] / 1024.0))
+    if cost["truncatedEnums"]:
+        say(log, "  enums with more than %d entries: %s" % (len(epicsIds), ", ".join(cost["truncatedEnums"])))
+
+# print the cost of each camera in todo, [(genicam_xml, camera_name)...], and
+# their total, and write them as json to json_filename. Returns False if the
+# total is over max_records or max_params
+def run_cost_report(todo, devInt64=False, filters=default_filters, cache=True, json_filename=None,
+                    max_records=None, max_params=None, scan=default_scan_policy, log=None):
+    costs = []
+    for genicam_xml, camera_name in todo:
+        cost = db_cost(read_model(genicam_xml, filters, cache), camera_name, devInt64, scan)
+        report_cost(cost, log)
+        costs.append(cost)
+    total = total_cost(costs)
+    if len(costs) > 1:
+        report_cost(total, log)
+    over = []
+    if max_records is not None and total["records"] > max_records:
+        over.append("%d records is over the budget of %d" % (total["records"], max_records))
+    if max_params is not None and total["params"] > max_params:
+        over.append("%d asyn parameters is over the budget of %d" % (total["params"], max_params))
+    for message in over:
+        say(log, message)
+    if json_filename:
+        with open_output(json_filename) as f:
+            json.dump(dict(cameras = costs, total = total, over = over), f, indent=2, sort_keys=True)
+            f.write("\n")
+    return not over
+
+# defaults for the edm screens
+edlDefaults = dict(
+    defFontClass = "helvetica",
+    defFgColorCtrl = 25,
+    defBgColorCtrl = 5,
+    defFgColorMon = 15,
+    defBgColorMon = 12)
+
+# Fill in the edlDefaults of an edm widget template once, when it is defined,
+# leaving the fields that change from widget to widget
+def compile_edl(template):
+    return re.sub(r"%\((def\w+)\)[sd]", lambda m: str(edlDefaults[m.group(1)]), template)
 
 def quoteString(string):
     escape_list = ["\\","{","}",'"']
@@ -345,8 +1625,11 @@ def quoteString(string):
     string = string.replace("\n", "").replace(",", ";")
     return string
 
-def make_box():
-    return """# (Rectangle)
+# escape string for xml text or a double quoted attribute
+def xml_escape(string):
+    return string.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+edl_box = compile_edl("""# (Rectangle)
 object activeRectangleClass
 beginObjectProperties
 major 4
@@ -361,10 +1644,9 @@ fill
 fillColor index 5
 endObjectProperties
 
-""" % globals()
+""")
 
-def make_box_label():
-    return """# (Static Text)
+edl_box_label = compile_edl("""# (Static Text)
 object activeXTextClass
 beginObjectProperties
 major 4
@@ -384,10 +1666,9 @@ value {
 autoSize
 border
 endObjectProperties
-""" % globals()
+""")
 
-def make_description():
-    return """# (Related Display)
+edl_description = compile_edl("""# (Related Display)
 object relatedDisplayClass
 beginObjectProperties
 major 4
@@ -419,10 +1700,9 @@ symbols {
 }
 endObjectProperties
 
-""" % globals()
+""")
 
-def make_label():
-    return """
+edl_label = compile_edl("""
 # (Static Text)
 object activeXTextClass
 beginObjectProperties
@@ -442,10 +1722,9 @@ value {
 }
 endObjectProperties
 
-""" % globals()             
+""")
 
-def make_ro():
-    return """# (Text Update)
+edl_ro = compile_edl("""# (Text Update)
 object TextupdateClass
 beginObjectProperties
 major 10
@@ -464,10 +1743,9 @@ font "%(defFontClass)s-bold-r-12.0"
 fontAlign "center"
 endObjectProperties
 
-""" % globals()         
+""")
 
-def make_demand():
-    return """# (Text Control)
+edl_demand = compile_edl("""# (Text Control)
 object activeXTextDspClass
 beginObjectProperties
 major 4
@@ -492,10 +1770,9 @@ newPos
 objType "controls"
 endObjectProperties
 
-""" % globals()
+""")
 
-def make_rbv():
-    return """# (Textupdate)
+edl_rbv = compile_edl("""# (Textupdate)
 object TextupdateClass
 beginObjectProperties
 major 10
@@ -514,10 +1791,9 @@ font "%(defFontClass)s-bold-r-12.0"
 fontAlign "center"
 endObjectProperties
 
-""" % globals() 
+""")
 
-def make_menu():
-    return """# (Menu Button)
+edl_menu = compile_edl("""# (Menu Button)
 object activeMenuButtonClass
 beginObjectProperties
 major 4
@@ -537,10 +1813,9 @@ indicatorPv "$(P)$(R)%(recordName)s_RBV"
 font "%(defFontClass)s-bold-r-12.0"
 endObjectProperties
 
-""" % globals()
+""")
 
-def make_cmd():
-    return """# (Message Button)
+edl_cmd = compile_edl("""# (Message Button)
 object activeMessageButtonClass
 beginObjectProperties
 major 4
@@ -563,80 +1838,9 @@ offLabel "%(nodeName)s"
 font "%(defFontClass)s-bold-r-12.0"
 endObjectProperties
 
-""" % globals()
-
-label_w = 132
-# Write each section
-for name, nodes in structure:
-    # write box
-    boxh = len(nodes) * 24 + 8
-    boxw = label_w + 156
-    if (boxh + y > 940):
-        y = 44
-        w += boxw + 8
-        x += boxw + 8
-    laby = y - 8      
-    text += make_box()
-    y += 8
-    h = max(y, h)    
-    for node in nodes:
-        nodeName = str(node.getAttribute("Name"))
-        if nodeName in ADGenICam_nodes:
-            print >>sys.stderr, "Skipping %s" % nodeName
-            continue
-        recordName = records[nodeName]
-        ro = isNodeReadOnly( node )
-        desc = ""
-        for n in elements(node):
-            if str(n.nodeName) in ["ToolTip", "Description"]:
-                desc = getText(n)
-        descs = ["%s: "% nodeName, "", "", "", "", ""]
-        i = 0
-        for word in desc.split():
-            if len(descs[i]) + len(word) > 80:
-                i += 1
-                if i >= len(descs):
-                    break
-            descs[i] += word + " "
-        for i in range(6):
-            if descs[i]:
-                globals()["desc%d" % i] = quoteString(descs[i])
-            else:
-                globals()["desc%d" % i] = "''"
-        nx = x + 4
-        text += make_description()   
-        nx += 20
-        text += make_label()
-        nx += label_w + 4            
-        if node.nodeName in ["StringReg", "String"] or ro:
-            text += make_ro()
-        elif node.nodeName in ["Integer", "Float", "Converter", "IntConverter", "IntSwissKnife", "SwissKnife"]:  
-            text += make_demand()
-            nx += 68 
-            text += make_rbv() 
-        elif node.nodeName in ["Enumeration", "Boolean"]:
-            text += make_menu()
-        elif node.nodeName in ["Command"]:
-            text += make_cmd()
-        else:
-            print "Don't know what to do with %s (%s)" % (nodeName, node.nodeName)
-        y += 24
-    y += 16
-    h = max(y, h)
-
-    # Put the label on the box last so it's on top
-    text += make_box_label()
-    # End of write box
-# End of Write each section
-
-# tidy up
-w += 4
-exitX = w - 100
-exitY = h - min(28, h - y)
-h = exitY + 28
-
-# Write edl file header
-edl_file.write("""4 0 1
+""")
+
+edl_header = compile_edl("""4 0 1
 beginScreenProperties
 major 4
 minor 0
@@ -657,7 +1861,7 @@ ctlBgColor1 index %(defBgColorMon)d
 ctlBgColor2 index %(defBgColorCtrl)d
 topShadowColor index 1
 botShadowColor index 11
-title "%(camera_name)s features - $(P)$(R)"
+title "%(title)s - $(P)$(R)"
 showGrid
 snapToGrid
 gridSize 4
@@ -731,7 +1935,7 @@ fontAlign "center"
 fgColor index 14
 bgColor index 48
 value {
-  "%(camera_name)s features - $(P)$(R)"
+  "%(title)s - $(P)$(R)"
 }
 endObjectProperties
 
@@ -764,13 +1968,9 @@ endGroup
 
 endObjectProperties
 
-""" %globals())
-
-# Write edl file widgets
-edl_file.write(text.encode('ascii', 'replace'))
+""")
 
-# Write edl file exit button
-edl_file.write("""# (Exit Button)
+edl_exit_button = compile_edl("""# (Exit Button)
 object activeExitButtonClass
 beginObjectProperties
 major 4
@@ -788,12 +1988,9 @@ label "EXIT"
 font "%(defFontClass)s-bold-r-14.0"
 3d
 endObjectProperties
-""" % globals())
-edl_file.close()
-    
-# write the summary screen
-if not os.path.exists(edl_filename):
-    open(edl_filename, "w").write("""4 0 1
+""")
+
+edl_summary = compile_edl("""4 0 1
 beginScreenProperties
 major 4
 minor 0
@@ -886,5 +2083,1046 @@ setPosition {
   0 "parentWindow"
 }
 endObjectProperties
-""" % globals() )
+""")
+
+edl_page_button = compile_edl("""# (Related Display)
+object relatedDisplayClass
+beginObjectProperties
+major 4
+minor 4
+release 0
+x %(x)d
+y %(y)d
+w %(buttonw)d
+h 20
+fgColor index 43
+bgColor index 3
+topShadowColor index 1
+botShadowColor index 11
+font "%(defFontClass)s-bold-r-12.0"
+buttonLabel "%(label)s"
+numPvs 4
+numDsps 1
+displayFileName {
+  0 "vimbaScreens/%(page)s.edl"
+}
+endObjectProperties
+
+""")
+
+# Place a button for each features page on the index screen, in columns
+def layout_index_edl(model, camera_name):
+    buttonw = 240
+    x = 4
+    y = 40
+    w = buttonw + 8
+    h = 40
+    widgets = []
+    for category, sections in model.pages:
+        if y + 24 > 940:
+            y = 40
+            x += buttonw + 8
+            w += buttonw + 8
+        n = len([node for name, nodes in sections for node in nodes if node.name not in ADGenICam_nodes])
+        widgets.append(("page_button", dict(x=x, y=y, buttonw=buttonw, label="%s (%d)" % (category, n),
+                                            page=page_name(camera_name, category))))
+        y += 24
+        h = max(y, h)
+    w = max(w, 204)
+    exitX = w - 100
+    exitY = h + 4
+    return dict(w=w, h=exitY + 28, exitX=exitX, exitY=exitY), widgets
+
+# Place the widgets of a feature screen of sections, by default all of them.
+# The size of the screen goes in its header, so all the widgets are placed
+# before any are written out. Returns the size of the screen, where its exit
+# button goes and a list of (kind, fields) for the widgets, which each
+# ScreenEmitter writes in its own format
+def layout_features_edl(model, sections=None):
+    if sections is None:
+        sections = model.structure
+    w = 300
+    h = 40
+    x = 4
+    y = 48
+    widgets = []
+    label_w = 132
+    # Write each section
+    for name, nodes in sections:
+        # write box
+        boxh = len(nodes) * 24 + 8
+        boxw = label_w + 156
+        if (boxh + y > 940):
+            y = 44
+            w += boxw + 8
+            x += boxw + 8
+        laby = y - 8
+        widgets.append(("box", dict(x=x, y=y, boxw=boxw, boxh=boxh)))
+        y += 8
+        h = max(y, h)
+        for node in nodes:
+            nodeName = node.name
+            if nodeName in ADGenICam_nodes:
+                continue
+            ro = isNodeReadOnly( node )
+            nx = x + 4
+            widgets.append(("description", dict(nx=nx, y=y, nodeName=nodeName, desc=node.desc)))
+            nx += 20
+            widgets.append(("label", dict(nx=nx, y=y, label_w=label_w, nodeName=nodeName, desc=node.desc)))
+            nx += label_w + 4
+            fields = dict(nx=nx, y=y, recordName=node.recordName, nodeName=nodeName)
+            if node.kind in ["StringReg", "String"] or ro:
+                widgets.append(("ro", fields))
+            elif node.kind in ["Integer", "Float", "Converter", "IntConverter", "IntSwissKnife", "SwissKnife"]:
+                widgets.append(("demand", fields))
+                widgets.append(("rbv", dict(fields, nx=nx + 68)))
+            elif node.kind in ["Enumeration", "Boolean"]:
+                widgets.append(("menu", fields))
+            elif node.kind in ["Command"]:
+                widgets.append(("cmd", fields))
+            y += 24
+        y += 16
+        h = max(y, h)
+
+        # Put the label on the box last so it's on top
+        widgets.append(("box_label", dict(x=x, laby=laby, name=name)))
+        # End of write box
+    # End of Write each section
+
+    # tidy up
+    w += 4
+    exitX = w - 100
+    exitY = h - min(28, h - y)
+    h = exitY + 28
+    return dict(w=w, h=h, exitX=exitX, exitY=exitY), widgets
+
+# The text of an edm feature screen laid out by layout_features_edl, or the
+# index laid out by layout_index_edl, a widget at a time
+def features_edl(layout, camera_name, category=None):
+    return emitters["edl"].screen(layout, screen_title(camera_name, category), page_name(camera_name, category))
+
+# The name of the features page of category, or of the index of them, to
+# which each format adds its extension
+def page_name(camera_name, category=None):
+    if category is None:
+        return "%s-features" % camera_name
+    return "%s-features-%s" % (camera_name, category)
+
+# The title of the features page of category, or of the index of them
+def screen_title(camera_name, category=None):
+    if category is None:
+        return "%s features" % camera_name
+    return "%s %s" % (camera_name, category)
+
+class ScreenEmitter(object):
+    """Writes the screens laid out by layout_features_edl and layout_index_edl
+    in one display format. The layouts are lists of (kind, fields) and
+    templates has the template each kind of widget is written with, kinds
+    without one are left out of the format"""
+    # the --formats name, the extension and the directory under op/
+    format = None
+    header = ""
+    footer = ""
+    templates = {}
+    # what open_output does with characters that aren't ascii
+    errors = "replace"
+    # the fields that are text, which are quoted for the format
+    text = ["title", "nodeName", "name", "label", "desc"]
+
+    def quote(self, string):
+        return string
+
+    def fields(self, kind, fields):
+        for key in self.text:
+            if key in fields:
+                fields[key] = self.quote(fields[key])
+        return fields
+
+    # The text of a screen, a widget at a time
+    def screen(self, layout, title, name):
+        size, widgets = layout
+        yield self.header % self.fields("header", dict(size, title=title, name=name))
+        for n, (kind, fields) in enumerate(widgets):
+            template = self.templates.get(kind)
+            if template is not None:
+                yield template % self.fields(kind, dict(fields, n=n))
+        yield self.footer % size
+
+class EdlEmitter(ScreenEmitter):
+    """edm screens"""
+    format = "edl"
+    header = edl_header
+    footer = edl_exit_button
+    templates = dict(box = edl_box, box_label = edl_box_label, description = edl_description,
+                     label = edl_label, ro = edl_ro, demand = edl_demand, rbv = edl_rbv,
+                     menu = edl_menu, cmd = edl_cmd, page_button = edl_page_button)
+
+    # the description goes in the macros of a help screen, in lines of up
+    # to 80 characters
+    def fields(self, kind, fields):
+        if kind == "description":
+            descs = ["%s: " % fields["nodeName"], "", "", "", "", ""]
+            i = 0
+            for word in fields["desc"].split():
+                if len(descs[i]) + len(word) > 80:
+                    i += 1
+                    if i >= len(descs):
+                        break
+                descs[i] += word + " "
+            fields.update(("desc%d" % i, quoteString(d) if d else "''") for i, d in enumerate(descs))
+        return fields
+
+bob_header = '''<?xml version="1.0" encoding="UTF-8"?>
+<display version="2.0.0">
+  <name>%(title)s</name>
+  <x>50</x>
+  <y>50</y>
+  <width>%(w)d</width>
+  <height>%(h)d</height>
+  <background_color>
+    <color red="187" green="187" blue="187">
+    </color>
+  </background_color>
+  <grid_visible>false</grid_visible>
+  <widget type="label" version="2.0.0">
+    <name>title</name>
+    <text>%(title)s - $(P)$(R)</text>
+    <y>2</y>
+    <width>%(w)d</width>
+    <height>24</height>
+    <font>
+      <font family="Liberation Sans" style="BOLD" size="18.0">
+      </font>
+    </font>
+    <horizontal_alignment>1</horizontal_alignment>
+  </widget>
+'''
+
+bob_box = '''  <widget type="rectangle" version="2.0.0">
+    <name>box #%(n)d</name>
+    <x>%(x)d</x>
+    <y>%(y)d</y>
+    <width>%(boxw)d</width>
+    <height>%(boxh)d</height>
+    <line_width>1</line_width>
+    <line_color>
+      <color red="0" green="0" blue="0">
+      </color>
+    </line_color>
+    <transparent>true</transparent>
+  </widget>
+'''
+
+bob_box_label = '''  <widget type="label" version="2.0.0">
+    <name>box label #%(n)d</name>
+    <text>%(name)s</text>
+    <x>%(x)d</x>
+    <y>%(laby)d</y>
+    <width>150</width>
+    <height>14</height>
+    <horizontal_alignment>1</horizontal_alignment>
+    <background_color>
+      <color red="218" green="218" blue="218">
+      </color>
+    </background_color>
+    <transparent>false</transparent>
+  </widget>
+'''
+
+bob_label = '''  <widget type="label" version="2.0.0">
+    <name>label #%(n)d</name>
+    <text>%(nodeName)s</text>
+    <x>%(nx)d</x>
+    <y>%(y)d</y>
+    <width>%(label_w)d</width>
+    <tooltip>%(desc)s</tooltip>
+  </widget>
+'''
+
+bob_ro = '''  <widget type="textupdate" version="2.0.0">
+    <name>readback #%(n)d</name>
+    <pv_name>$(P)$(R)%(recordName)s_RBV</pv_name>
+    <x>%(nx)d</x>
+    <y>%(y)d</y>
+    <width>124</width>
+    <foreground_color>
+      <color red="10" green="0" blue="184">
+      </color>
+    </foreground_color>
+    <horizontal_alignment>1</horizontal_alignment>
+  </widget>
+'''
+
+bob_demand = '''  <widget type="textentry" version="3.0.0">
+    <name>demand #%(n)d</name>
+    <pv_name>$(P)$(R)%(recordName)s</pv_name>
+    <x>%(nx)d</x>
+    <y>%(y)d</y>
+    <width>60</width>
+    <background_color>
+      <color red="115" green="223" blue="255">
+      </color>
+    </background_color>
+  </widget>
+'''
+
+bob_rbv = '''  <widget type="textupdate" version="2.0.0">
+    <name>readback #%(n)d</name>
+    <pv_name>$(P)$(R)%(recordName)s_RBV</pv_name>
+    <x>%(nx)d</x>
+    <y>%(y)d</y>
+    <width>60</width>
+    <foreground_color>
+      <color red="10" green="0" blue="184">
+      </color>
+    </foreground_color>
+    <horizontal_alignment>1</horizontal_alignment>
+  </widget>
+'''
+
+bob_menu = '''  <widget type="combo" version="2.0.0">
+    <name>menu #%(n)d</name>
+    <pv_name>$(P)$(R)%(recordName)s</pv_name>
+    <x>%(nx)d</x>
+    <y>%(y)d</y>
+    <width>124</width>
+    <background_color>
+      <color red="115" green="223" blue="255">
+      </color>
+    </background_color>
+  </widget>
+'''
+
+bob_cmd = '''  <widget type="action_button" version="3.0.0">
+    <name>command #%(n)d</name>
+    <actions>
+      <action type="write_pv">
+        <pv_name>$(P)$(R)%(recordName)s.PROC</pv_name>
+        <value>1</value>
+        <description>%(nodeName)s</description>
+      </action>
+    </actions>
+    <text>%(nodeName)s</text>
+    <x>%(nx)d</x>
+    <y>%(y)d</y>
+    <width>124</width>
+    <background_color>
+      <color red="115" green="223" blue="255">
+      </color>
+    </background_color>
+  </widget>
+'''
+
+bob_page_button = '''  <widget type="action_button" version="3.0.0">
+    <name>page #%(n)d</name>
+    <actions>
+      <action type="open_display">
+        <file>%(page)s.bob</file>
+        <target>tab</target>
+        <description>%(label)s</description>
+      </action>
+    </actions>
+    <text>%(label)s</text>
+    <x>%(x)d</x>
+    <y>%(y)d</y>
+    <width>%(buttonw)d</width>
+  </widget>
+'''
+
+class BobEmitter(ScreenEmitter):
+    """Phoebus display builder screens"""
+    format = "bob"
+    header = bob_header
+    footer = "</display>\n"
+    templates = dict(box = bob_box, box_label = bob_box_label, label = bob_label, ro = bob_ro,
+                     demand = bob_demand, rbv = bob_rbv, menu = bob_menu, cmd = bob_cmd,
+                     page_button = bob_page_button)
+    errors = "xmlcharrefreplace"
+
+    def quote(self, string):
+        return xml_escape(string)
+
+# the properties of every caQtDM widget, with its position
+ui_geometry = '''            <property name="geometry">
+                <rect>
+                    <x>%(x)s</x>
+                    <y>%(y)s</y>
+                    <width>%(w)s</width>
+                    <height>%(h)s</height>
+                </rect>
+            </property>
+'''
+
+def ui_widget(widgetClass, name, x, y, w, h, properties):
+    return '''        <widget class="%s" name="%s">
+%s%s        </widget>
+''' % (widgetClass, name, ui_geometry % dict(x=x, y=y, w=w, h=h), properties)
+
+def ui_property(name, kind, value):
+    return '''            <property name="%s">
+                <%s>%s</%s>
+            </property>
+''' % (name, kind, value, kind)
+
+def ui_color(name, red, green, blue):
+    return '''            <property name="%s">
+                <color alpha="255">
+                    <red>%d</red>
+                    <green>%d</green>
+                    <blue>%d</blue>
+                </color>
+            </property>
+''' % (name, red, green, blue)
+
+ui_header = '''<?xml version="1.0" encoding="UTF-8"?>
+<ui version="4.0">
+<class>MainWindow</class>
+<widget class="QMainWindow" name="MainWindow">
+    <property name="geometry">
+        <rect>
+            <x>50</x>
+            <y>50</y>
+            <width>%(w)d</width>
+            <height>%(h)d</height>
+        </rect>
+    </property>
+    <property name="windowTitle">
+        <string>%(title)s</string>
+    </property>
+    <widget class="QWidget" name="centralWidget">
+''' + ui_widget("caLabel", "caLabel_title", 0, 2, "%(w)d", 24,
+                ui_property("text", "string", "%(title)s - $(P)$(R)") +
+                ui_property("alignment", "set", "Qt::AlignAbsolute|Qt::AlignHCenter|Qt::AlignVCenter"))
+
+ui_footer = '''    </widget>
+</widget>
+</ui>
+'''
+
+ui_control = ui_color("foreground", 0, 0, 0) + ui_color("background", 115, 223, 255)
+ui_monitor = ui_color("foreground", 10, 0, 184) + ui_color("background", 187, 187, 187)
+
+ui_templates = dict(
+    box = ui_widget("caGraphics", "caRectangle_%(n)d", "%(x)d", "%(y)d", "%(boxw)d", "%(boxh)d",
+                    ui_property("form", "enum", "caGraphics::Rectangle") +
+                    ui_color("lineColor", 0, 0, 0) +
+                    ui_property("linestyle", "enum", "Solid")),
+    box_label = ui_widget("caLabel", "caLabel_%(n)d", "%(x)d", "%(laby)d", 150, 14,
+                          ui_property("text", "string", "%(name)s") +
+                          ui_color("background", 218, 218, 218) +
+                          ui_property("alignment", "set", "Qt::AlignAbsolute|Qt::AlignHCenter|Qt::AlignVCenter")),
+    label = ui_widget("caLabel", "caLabel_%(n)d", "%(nx)d", "%(y)d", "%(label_w)d", 20,
+                      ui_property("text", "string", "%(nodeName)s") +
+                      ui_property("toolTip", "string", "%(desc)s")),
+    ro = ui_widget("caLineEdit", "caLineEdit_%(n)d", "%(nx)d", "%(y)d", 124, 20,
+                   ui_property("channel", "string", "$(P)$(R)%(recordName)s_RBV") + ui_monitor +
+                   ui_property("alignment", "set", "Qt::AlignAbsolute|Qt::AlignHCenter|Qt::AlignVCenter")),
+    demand = ui_widget("caTextEntry", "caTextEntry_%(n)d", "%(nx)d", "%(y)d", 60, 20,
+                       ui_property("channel", "string", "$(P)$(R)%(recordName)s") + ui_control),
+    rbv = ui_widget("caLineEdit", "caLineEdit_%(n)d", "%(nx)d", "%(y)d", 60, 20,
+                    ui_property("channel", "string", "$(P)$(R)%(recordName)s_RBV") + ui_monitor +
+                    ui_property("alignment", "set", "Qt::AlignAbsolute|Qt::AlignHCenter|Qt::AlignVCenter")),
+    menu = ui_widget("caMenu", "caMenu_%(n)d", "%(nx)d", "%(y)d", 124, 20,
+                     ui_property("channel", "string", "$(P)$(R)%(recordName)s") + ui_control),
+    cmd = ui_widget("caMessageButton", "caMessageButton_%(n)d", "%(nx)d", "%(y)d", 124, 20,
+                    ui_property("channel", "string", "$(P)$(R)%(recordName)s.PROC") + ui_control +
+                    ui_property("label", "string", "%(nodeName)s") +
+                    ui_property("pressMessage", "string", "1")),
+    page_button = ui_widget("caRelatedDisplay", "caRelatedDisplay_%(n)d", "%(x)d", "%(y)d", "%(buttonw)d", 20,
+                            ui_control +
+                            ui_property("label", "string", "%(label)s") +
+                            ui_property("labels", "string", "%(label)s") +
+                            ui_property("files", "string", "%(page)s.ui") +
+                            ui_property("args", "string", "P=$(P),R=$(R)")))
+
+class UiEmitter(ScreenEmitter):
+    """caQtDM screens"""
+    format = "ui"
+    header = ui_header
+    footer = ui_footer
+    templates = ui_templates
+    errors = "xmlcharrefreplace"
+
+    def quote(self, string):
+        # ; separates the entries of a related display
+        return xml_escape(string.replace(";", ","))
+
+# the colour map of the medm screens, which the clr and bclr of each widget
+# index
+adl_colors = """ffffff ececec dadada c8c8c8 bbbbbb aeaeae 9e9e9e 919191 858585 787878
+696969 5a5a5a 464646 2d2d2d 000000 00d800 1ebb00 339900 2d7f00 216c00
+fd0000 de1309 be190b a01207 820400 5893ff 597ee1 4b6ec7 3a5eab 27548d
+fbf34a f9da3c eeb62b e19015 cd6100 ffb0ff d67fe2 ae4ebc 8b1a96 610a75
+a4aaff 8793e2 6a73c1 4d52a4 343386 c7bb6d b79d5c a47e3c 7d5627 58340f
+99ffff 73dfff 4ea5f9 2a63e4 0a00b8 ebf1b5 d4db9d bbc187 a6a462 8b8239
+73ff6b 52da3b 3cb420 289315 1a7309""".split()
+
+adl_header = '''file {
+	name="%%(name)s.adl"
+	version=030109
+}
+display {
+	object {
+		x=50
+		y=50
+		width=%%(w)d
+		height=%%(h)d
+	}
+	clr=14
+	bclr=4
+	cmap=""
+	gridSpacing=5
+	gridOn=0
+	snapToGrid=0
+}
+"color map" {
+	ncolors=%d
+	colors {
+%s	}
+}
+rectangle {
+	object {
+		x=0
+		y=2
+		width=%%(w)d
+		height=24
+	}
+	"basic attribute" {
+		clr=2
+	}
+}
+text {
+	object {
+		x=0
+		y=4
+		width=%%(w)d
+		height=20
+	}
+	"basic attribute" {
+		clr=54
+	}
+	textix="%%(title)s - $(P)$(R)"
+	align="horiz. centered"
+}
+''' % (len(adl_colors), "".join("\t\t%s,\n" % c for c in adl_colors))
+
+adl_object = '''	object {
+		x=%(x)s
+		y=%(y)s
+		width=%(w)s
+		height=%(h)s
+	}
+'''
+
+def adl_widget(widgetType, x, y, w, h, body):
+    return '%s {\n%s%s}\n' % (widgetType, adl_object % dict(x=x, y=y, w=w, h=h), body)
+
+adl_templates = dict(
+    box = adl_widget("rectangle", "%(x)d", "%(y)d", "%(boxw)d", "%(boxh)d",
+                     '\t"basic attribute" {\n\t\tclr=14\n\t\tfill="outline"\n\t}\n'),
+    box_label = adl_widget("rectangle", "%(x)d", "%(laby)d", 150, 14,
+                           '\t"basic attribute" {\n\t\tclr=2\n\t}\n') +
+                adl_widget("text", "%(x)d", "%(laby)d", 150, 14,
+                           '\t"basic attribute" {\n\t\tclr=14\n\t}\n\ttextix="%(name)s"\n\talign="horiz. centered"\n'),
+    label = adl_widget("text", "%(nx)d", "%(y)d", "%(label_w)d", 14,
+                       '\t"basic attribute" {\n\t\tclr=14\n\t}\n\ttextix="%(nodeName)s"\n'),
+    ro = adl_widget('"text update"', "%(nx)d", "%(y)d", 124, 20,
+                    '\tmonitor {\n\t\tchan="$(P)$(R)%(recordName)s_RBV"\n\t\tclr=54\n\t\tbclr=4\n\t}\n'
+                    '\talign="horiz. centered"\n\tlimits {\n\t}\n'),
+    demand = adl_widget('"text entry"', "%(nx)d", "%(y)d", 60, 20,
+                        '\tcontrol {\n\t\tchan="$(P)$(R)%(recordName)s"\n\t\tclr=14\n\t\tbclr=51\n\t}\n'
+                        '\tlimits {\n\t}\n'),
+    rbv = adl_widget('"text update"', "%(nx)d", "%(y)d", 60, 20,
+                     '\tmonitor {\n\t\tchan="$(P)$(R)%(recordName)s_RBV"\n\t\tclr=54\n\t\tbclr=4\n\t}\n'
+                     '\talign="horiz. centered"\n\tlimits {\n\t}\n'),
+    menu = adl_widget("menu", "%(nx)d", "%(y)d", 124, 20,
+                      '\tcontrol {\n\t\tchan="$(P)$(R)%(recordName)s"\n\t\tclr=14\n\t\tbclr=51\n\t}\n'),
+    cmd = adl_widget('"message button"', "%(nx)d", "%(y)d", 124, 20,
+                     '\tcontrol {\n\t\tchan="$(P)$(R)%(recordName)s.PROC"\n\t\tclr=14\n\t\tbclr=51\n\t}\n'
+                     '\tlabel="%(nodeName)s"\n\tpress_msg="1"\n'),
+    page_button = adl_widget('"related display"', "%(x)d", "%(y)d", "%(buttonw)d", 20,
+                             '\tdisplay[0] {\n\t\tlabel="%(label)s"\n\t\tname="%(page)s.adl"\n'
+                             '\t\targs="P=$(P),R=$(R)"\n\t}\n\tclr=14\n\tbclr=51\n\tlabel="-%(label)s"\n'))
+
+class AdlEmitter(ScreenEmitter):
+    """medm screens"""
+    format = "adl"
+    header = adl_header
+    templates = adl_templates
+
+    def quote(self, string):
+        return string.replace('"', "'")
+
+    # medm text is as high as its widget, so the label is made smaller and
+    # moved down to line up with the text of the widgets next to it
+    def fields(self, kind, fields):
+        fields = ScreenEmitter.fields(self, kind, fields)
+        if kind == "label":
+            fields["y"] += 3
+        return fields
+
+# The formats screens can be written in, by their --formats name
+emitters = dict((e.format, e()) for e in [EdlEmitter, BobEmitter, UiEmitter, AdlEmitter])
+default_formats = ["edl"]
+
+# The filename of a screen in op/<format>
+def screen_filename(prefix, emitter, name):
+    return os.path.join(prefix, "op", emitter.format, "%s.%s" % (name, emitter.format))
+
+# Spit out a feature screen for each category with features in it, and an
+# index of them, in each of formats, so that only the PVs of the pages that
+# are opened are connected. Returns the filenames of the screens
+def write_feature_screens(model, camera_name, prefix=default_prefix, formats=default_formats):
+    # the layout of each screen is shared by the formats
+    screens = [(layout_features_edl(model, sections), category) for category, sections in model.pages]
+    screens.append((layout_index_edl(model, camera_name), None))
+    filenames = []
+    for format in formats:
+        emitter = emitters[format]
+        for layout, category in screens:
+            name = page_name(camera_name, category)
+            filename = screen_filename(prefix, emitter, name)
+            with open_output(filename, encoding="ascii", errors=emitter.errors) as f:
+                f.writelines(emitter.screen(layout, screen_title(camera_name, category), name))
+            filenames.append(filename)
+    return filenames
+
+# write the summary screen
+def write_summary_edl(camera_name, edl_filename):
+    if not os.path.exists(edl_filename):
+        with open_output(edl_filename) as f:
+            f.write(edl_summary % dict(camera_name=camera_name))
+
+# The hashes of everything that goes into the generated files for a camera.
+# The generator version is the hash of this script
+def input_hashes(genicam_xml, devInt64, substitutions=False, filters=default_filters,
+                 formats=default_formats, scan=default_scan_policy):
+    return dict(xml = file_hash(genicam_xml),
+                generator = file_hash(os.path.abspath(__file__)),
+                options = dict(devInt64 = devInt64, substitutions = substitutions,
+                               filters = dict(default_filters, **filters), formats = list(formats),
+                               scan = scan),
+                skip = ADGenICam_nodes)
+
+# The hashes of the generated files, by their path relative to prefix
+def output_hashes(outputs, prefix):
+    return dict((os.path.relpath(f, prefix), file_hash(f)) for f in outputs)
+
+# The input hashes are saved with the hashes of the generated files in
+# Db/<camera_name>.genicam.json. The camera is up to date if they all match,
+# including any other files that were generated with it last time
+def is_up_to_date(hash_filename, inputs, outputs, prefix):
+    try:
+        hashes = json.load(open(hash_filename))
+    except (IOError, ValueError):
+        return False
+    if hashes.get("inputs") != inputs:
+        return False
+    recorded = hashes.get("outputs", {})
+    if not all(os.path.relpath(f, prefix) in recorded for f in outputs):
+        return False
+    return recorded == output_hashes([os.path.join(prefix, f) for f in recorded], prefix)
+
+# remove the feature screens recorded in hash_filename by the last run that
+# have not been written again, as their category or format has gone
+def remove_stale_screens(hash_filename, screens, camera_name, prefix):
+    try:
+        recorded = json.load(open(hash_filename)).get("outputs", {})
+    except (IOError, ValueError):
+        return
+    keep = set(os.path.relpath(f, prefix) for f in screens)
+    for f in recorded:
+        if f.startswith("op" + os.sep) and os.path.basename(f).startswith(page_name(camera_name)) and \
+                f not in keep and os.path.exists(os.path.join(prefix, f)):
+            os.remove(os.path.join(prefix, f))
+
+# parse a genicam xml file and write the db and feature screens in each of
+# formats for the features that pass filters. With substitutions a
+# .substitutions file for the shared templates is written instead of the db.
+# With incremental it is skipped if nothing has changed since the last run.
+# The messages go to log, see say, and with stats, a RunStats, each phase is
+# timed and what was made is counted. Returns True if the files were
+# generated, False if they were up to date
+def make_db_and_edl(genicam_xml, camera_name, devInt64=False, prefix=default_prefix, incremental=False,
+                    substitutions=False, filters=default_filters, formats=default_formats, cache=True,
+                    scan=default_scan_policy, log=None, stats=None):
+    if substitutions:
+        db_filename = os.path.join(prefix, "Db", camera_name + ".substitutions")
+    else:
+        db_filename = os.path.join(prefix, "Db", camera_name + ".template")
+    edl_filename = os.path.join(prefix, "op", "edl", camera_name + ".edl")
+    invalidation_filename = os.path.join(prefix, "Db", camera_name + "-invalidation.json")
+    req_filename = os.path.join(prefix, "Db", camera_name + "_settings.req")
+    hash_filename = os.path.join(prefix, "Db", camera_name + ".genicam.json")
+    # the index screens, the pages are found when they are written
+    outputs = [db_filename, invalidation_filename, req_filename] + \
+        [screen_filename(prefix, emitters[format], page_name(camera_name)) for format in formats]
+    with timed(stats, "check"):
+        inputs = input_hashes(genicam_xml, devInt64, substitutions, filters, formats, scan)
+        generate = not (incremental and is_up_to_date(hash_filename, inputs, outputs, prefix))
+    if generate:
+        model = read_model(genicam_xml, filters, cache, stats)
+        report_messages(model, log)
+        report_filters(model, camera_name, log)
+        with timed(stats, "db"):
+            if substitutions:
+                outputs += write_substitutions(model, camera_name, db_filename, devInt64, scan)
+            else:
+                write_db(model, camera_name, db_filename, devInt64, scan)
+        with timed(stats, "screens"):
+            screens = write_feature_screens(model, camera_name, prefix, formats)
+            remove_stale_screens(hash_filename, screens, camera_name, prefix)
+        outputs = [f for f in outputs if f not in screens] + screens
+        with timed(stats, "invalidation"):
+            invalidated = model.invalidated_features()
+            write_invalidation(model, camera_name, invalidation_filename, invalidated, log)
+        with timed(stats, "settings"):
+            write_settings_req(model, camera_name, req_filename, invalidated)
+        with timed(stats, "chunks"):
+            outputs += write_chunk_files(model, camera_name, prefix, devInt64, scan, log)
+        with timed(stats, "hashes"):
+            hashes = dict(inputs = inputs,
+                          outputs = output_hashes(outputs, prefix))
+            with open_output(hash_filename) as f:
+                json.dump(hashes, f, indent=2, sort_keys=True)
+                f.write("\n")
+        if stats is not None:
+            stats.counts = model_counts(model)
+    write_summary_edl(camera_name, edl_filename)
+    return generate
+
+# print the stats of a run for camera_name, from RunStats.as_dict
+def report_stats(camera_name, stats, log=None):
+    say(log, "%s: %.3fs%s" % (camera_name, stats["seconds"],
+        ", peak rss %.1f MB" % (stats["maxRssKb"] / 1024.0) if stats["maxRssKb"] else ""))
+    for p in stats["phases"]:
+        say(log, "  %-12s %8.3fs %8d blocks%s" % (p["name"], p["seconds"], p["blocks"],
+            " %8d kB peak" % p["peak_kb"] if "peak_kb" in p else ""))
+    counts = stats["counts"]
+    if not counts:
+        return
+    for title, total, parts in [("nodes", "nodes", "nodeKinds"), ("features", "features", "featureShapes"),
+                                ("skipped", "skipped", "skippedReasons")]:
+        say(log, "  %-12s %5d  %s" % (title, counts[total], ", ".join("%s %d" % x for x in counts[parts].items())))
+    say(log, "  %-12s %5d records, %d asyn parameters, %d record names changed to be unique, %d enums truncated"
+        % ("made", counts["records"], counts["params"], counts["renamed"], len(counts["truncatedEnums"])))
+
+# write the stats of runs, [(camera_name, genicam_xml, stats)...] with the
+# stats from RunStats.as_dict, as json
+def write_stats_json(json_filename, runs):
+    with open_output(json_filename) as f:
+        json.dump(dict(python = sys.version.split()[0],
+                       generator = file_hash(os.path.abspath(__file__)),
+                       cameras = [dict(stats, camera = camera_name, xml = genicam_xml)
+                                  for camera_name, genicam_xml, stats in runs]),
+                  f, indent=2, sort_keys=True)
+        f.write("\n")
+
+# read the (genicam_xml, camera_name) pairs to generate in batch mode. This is
+# a manifest file with a "<genicam_xml> <camera_name>" pair on each line, or a
+# directory with a manifest.txt in it, or else every .xml file in a directory
+# named after the file
+def read_manifest(path):
+    if os.path.isdir(path):
+        if os.path.exists(os.path.join(path, "manifest.txt")):
+            return read_manifest(os.path.join(path, "manifest.txt"))
+        return [(os.path.join(path, f), f[:-len(".xml")])
+                for f in sorted(os.listdir(path)) if f.endswith(".xml")]
+    jobs = []
+    for line in open(path):
+        line = line.split("#")[0].strip()
+        if line:
+            genicam_xml, camera_name = line.split()
+            jobs.append((os.path.join(os.path.dirname(path), genicam_xml), camera_name))
+    return jobs
+
+# generate one camera model of a batch, returning (time, status, log, stats)
+# where log is what a single run would have printed, and stats is from
+# RunStats.as_dict if profile is given, or else None
+def batch_job(genicam_xml, camera_name, devInt64, prefix, incremental, substitutions, filters, formats,
+              cache, scan, profile=False, traceMemory=False):
+    log = StringIO()
+    stats = RunStats(traceMemory) if profile else None
+    start = time.time()
+    try:
+        if make_db_and_edl(genicam_xml, camera_name, devInt64, prefix, incremental, substitutions,
+                           filters, formats, cache, scan, log, stats):
+            status = "ok"
+        else:
+            status = "up to date"
+    except Exception as e:
+        status = "FAILED %s: %s" % (e.__class__.__name__, e)
+    return time.time() - start, status, log.getvalue(), stats and stats.as_dict()
+
+# generate all the camera models in a manifest over a pool of processes, and
+# print the log of each in manifest order. With profile the stats of each
+# camera are printed too, and with stats_json they are written as json.
+# Returns the number of failures
+def run_batch(manifest, devInt64=False, jobs=None, prefix=default_prefix, incremental=False,
+              substitutions=False, filters=default_filters, formats=default_formats, cache=True,
+              scan=default_scan_policy, profile=False, trace_memory=False, stats_json=None):
+    # only a batch needs the pool, so it isn't imported with the module
+    from concurrent.futures import ProcessPoolExecutor
+    todo = read_manifest(manifest)
+    start = time.time()
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = [pool.submit(batch_job, genicam_xml, camera_name, devInt64, prefix, incremental,
+                               substitutions, filters, formats, cache, scan, profile or bool(stats_json),
+                               trace_memory)
+                   for genicam_xml, camera_name in todo]
+        results = [f.result() for f in futures]
+    failures = 0
+    for (genicam_xml, camera_name), (t, status, log, stats) in zip(todo, results):
+        if log:
+            print("%s:" % camera_name)
+            print(log, end="")
+    print("Generated %d camera models in %.2fs:" % (len(todo), time.time() - start))
+    for (genicam_xml, camera_name), (t, status, log, stats) in zip(todo, results):
+        if status.startswith("FAILED"):
+            failures += 1
+        print("  %-30s %7.2fs  %s" % (camera_name, t, status))
+    runs = [(camera_name, genicam_xml, stats)
+            for (genicam_xml, camera_name), (t, status, log, stats) in zip(todo, results) if stats]
+    if profile:
+        for camera_name, genicam_xml, stats in runs:
+            report_stats(camera_name, stats)
+    if stats_json:
+        write_stats_json(stats_json, runs)
+    return failures
+
+# The header of the template of the features shared by a fleet of cameras
+db_common_header = '''# Records of the features that the cameras
+%(cameras)s# share with the same records, made by makeDbAndEdl.py --fleet. Load it for
+# each camera along with its <camera_name>-delta.template
+# Macros:
+#%% macro, P, Device Prefix
+#%% macro, R, Device Suffix
+#%% macro, PORT, Asyn Port name
+#%% macro, TIMEOUT, Timeout, default=1
+#%% macro, ADDR, Asyn Port address, default=0
+
+'''
+
+# A copy of model with only the features in names, for the screens
+def model_view(model, names):
+    view = copy.copy(model)
+    view.features = [node for node in model.features if node.name in names]
+    view.structure = []
+    view.pages = []
+    for category, sections in model.pages:
+        sections = [(title, [node for node in nodes if node.name in names]) for title, nodes in sections]
+        sections = [(title, nodes) for title, nodes in sections if nodes]
+        if sections:
+            view.structure += sections
+            view.pages.append((category, sections))
+    return view
+
+# Write the features that all the cameras in a manifest share, with exactly
+# the same records, to Db/<common_name>.template and its screens, and the
+# rest of the records of each camera to Db/<camera_name>-delta.template and
+# screens named <camera_name>-delta. The records have the same names as
+# they do in <camera_name>.template, which is the common template and the
+# delta of the camera put together. The messages go to log, see say
+def make_fleet(manifest, devInt64=False, prefix=default_prefix, filters=default_filters,
+               formats=default_formats, cache=True, common_name="GenICamCommon", scan=default_scan_policy,
+               log=None):
+    cameras = []
+    for genicam_xml, camera_name in read_manifest(manifest):
+        model = read_model(genicam_xml, filters, cache)
+        report_messages(model, log)
+        cameras.append((camera_name, model, list(feature_db(model, devInt64, scan))))
+    if len(cameras) < 2:
+        raise ValueError("A fleet needs at least two cameras, %s has %d" % (manifest, len(cameras)))
+    texts = [dict((node.name, text) for node, text in records) for camera_name, model, records in cameras]
+    camera_name, model, records = cameras[0]
+    common = [(node, text) for node, text in records if all(t.get(node.name) == text for t in texts[1:])]
+    shared = set(node.name for node, text in common)
+    with open_output(os.path.join(prefix, "Db", common_name + ".template")) as f:
+        f.write(db_common_header % dict(cameras="".join("#   %s\n" % c[0] for c in cameras)))
+        f.writelines(text for node, text in common)
+    write_feature_screens(model_view(model, shared), common_name, prefix, formats)
+    say(log, "%s: %d features shared by %d cameras" % (common_name, len(common), len(cameras)))
+    for camera_name, model, records in cameras:
+        delta = [(node, text) for node, text in records if node.name not in shared]
+        with open_output(os.path.join(prefix, "Db", camera_name + "-delta.template")) as f:
+            f.write(db_header % dict(camera_name=camera_name))
+            f.write(db_camera % dict(camera_name=camera_name))
+            f.writelines(text for node, text in delta)
+        write_feature_screens(model_view(model, set(node.name for node, text in delta)),
+                              camera_name + "-delta", prefix, formats)
+        say(log, "  %-30s %4d features of its own" % (camera_name, len(delta)))
+
+# read the filters from the [filters] section of a config file, like
+#   [filters]
+#   visibility = Expert
+#   exclude = EngineeringTest FileAccessControl
+# then add the ones given on the command line
+def read_filters(options):
+    filters = dict(default_filters)
+    if options.config:
+        config = ConfigParser()
+        if not config.read(options.config):
+            raise IOError("Can't read config file %s" % options.config)
+        if config.has_section("filters"):
+            section = config["filters"]
+            filters["visibility"] = section.get("visibility", filters["visibility"])
+            filters["include"] = section.get("include", "").split()
+            filters["exclude"] = section.get("exclude", "").split()
+    if options.visibility:
+        filters["visibility"] = options.visibility
+    filters["include"] = filters["include"] + (options.include or [])
+    filters["exclude"] = filters["exclude"] + (options.exclude or [])
+    if filters["visibility"] not in visibilities:
+        raise ValueError("Visibility %s is not one of %s" % (filters["visibility"], ", ".join(visibilities)))
+    return filters
+
+# read the scan policy from the [scan] section of a config file, like
+#   [scan]
+#   telemetry = 10 second
+#   DeviceTemperature = statistic
+# where a class name sets the SCAN of the readbacks of that class, and a
+# feature name puts the feature in a class
+def read_scan_policy(options):
+    scan = dict(scans = dict(default_scan_policy["scans"]), features = {})
+    if options.config:
+        config = ConfigParser()
+        # feature names are case sensitive
+        config.optionxform = str
+        if not config.read(options.config):
+            raise IOError("Can't read config file %s" % options.config)
+        if config.has_section("scan"):
+            for key, value in config["scan"].items():
+                if key in scan_classes:
+                    scan["scans"][key] = value
+                elif value in scan_classes:
+                    scan["features"][key] = value
+                else:
+                    raise ValueError("Scan class %s of %s is not one of %s" % (value, key, ", ".join(scan_classes)))
+    return scan
+
+def main():
+    # parse args
+    parser = OptionParser("""%prog <genicam_xml> <camera_name>
+       %prog --batch <xml_dir_or_manifest>
+
+This script parses a genicam xml file and creates a database template and edm
+screens to go with it, in ../Db/<camera_name>.template and
+../op/edl/<camera_name>*.edl. See README.md in this directory for the other
+files it writes and what the options do.""")
+    parser.add_option("", "--devInt64",
+                      action="store_true", dest="devInt64", default=False,
+                      help="use int64in and int64out records. Requires at least EPICS base 3.16.1 or EPICS 7.")
+    parser.add_option("", "--substitutions",
+                      action="store_true", dest="substitutions", default=False,
+                      help="write a .substitutions file for the shared vimbaFeature*.template files instead of a .template")
+    parser.add_option("", "--visibility", dest="visibility", default=None, choices=visibilities,
+                      help="leave out features above this visibility: %s (default: Invisible)" % ", ".join(visibilities))
+    parser.add_option("", "--include-category", dest="include", action="append", metavar="CATEGORY",
+                      help="only make features in this category and its sub categories, may be repeated")
+    parser.add_option("", "--exclude-category", dest="exclude", action="append", metavar="CATEGORY",
+                      help="leave out features in this category and its sub categories, may be repeated")
+    parser.add_option("", "--formats", dest="formats", default=",".join(default_formats),
+                      help="comma separated formats of the feature screens: %s (default: %s)"
+                      % (", ".join(sorted(emitters)), ",".join(default_formats)))
+    parser.add_option("", "--config", dest="config", default=None,
+                      help="read the [filters] and [scan] sections of this config file")
+    parser.add_option("", "--no-cache", action="store_false", dest="cache", default=True,
+                      help="parse the xml file again instead of using <genicam_xml>.model.json")
+    parser.add_option("", "--cost", action="store_true", dest="cost", default=False,
+                      help="report what the db would cost the IOC instead of writing anything")
+    parser.add_option("", "--cost-json", dest="cost_json", default=None,
+                      help="with --cost, also write the report as json to this file")
+    parser.add_option("", "--max-records", type="int", dest="max_records", default=None,
+                      help="with --cost, exit with status 1 if there are more records than this in total")
+    parser.add_option("", "--max-params", type="int", dest="max_params", default=None,
+                      help="with --cost, exit with status 1 if there are more asyn parameters than this in total")
+    parser.add_option("", "--fleet", action="store_true", dest="fleet", default=False,
+                      help="with --batch, write the features all the cameras share to GenICamCommon.template and the rest to a delta for each")
+    parser.add_option("", "--batch", dest="batch", default=None,
+                      help="generate every camera in this directory or manifest")
+    parser.add_option("", "--incremental",
+                      action="store_true", dest="incremental", default=False,
+                      help="only regenerate cameras whose inputs have changed since the last run")
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", default=None,
+                      help="number of processes to use with --batch (default: number of cpus)")
+    parser.add_option("", "--profile", action="store_true", dest="profile", default=False,
+                      help="print the time and memory of each phase and counts of what was made")
+    parser.add_option("", "--profile-memory", action="store_true", dest="profile_memory", default=False,
+                      help="with --profile or --stats-json, also trace the peak memory of each phase, which is slow")
+    parser.add_option("", "--stats-json", dest="stats_json", default=None,
+                      help="write the stats of --profile as json to this file")
+    parser.add_option("", "--cprofile", dest="cprofile", default=None,
+                      help="write cProfile stats of a single camera to this file, for pstats or snakeviz")
+    options, args = parser.parse_args()
+    profiling = options.profile or options.stats_json or options.cprofile or options.profile_memory
+    if profiling and (options.cost or options.fleet):
+        parser.error("--profile, --stats-json and --cprofile can't be used with --cost or --fleet")
+    if options.cprofile and options.batch:
+        parser.error("--cprofile profiles a single camera, not a --batch")
+    try:
+        filters = read_filters(options)
+        scan = read_scan_policy(options)
+    except (IOError, ValueError) as e:
+        parser.error(str(e))
+    formats = [f for f in options.formats.split(",") if f]
+    for format in formats:
+        if format not in emitters:
+            parser.error("Format %s is not one of %s" % (format, ", ".join(sorted(emitters))))
+    if options.cost:
+        if options.batch and not args:
+            todo = read_manifest(options.batch)
+        elif len(args) == 2 and not options.batch:
+            todo = [(args[0], args[1])]
+        else:
+            parser.error("Incorrect number of arguments")
+        try:
+            if not run_cost_report(todo, options.devInt64, filters, options.cache, options.cost_json,
+                                   options.max_records, options.max_params, scan):
+                sys.exit(1)
+        except ValueError as e:
+            sys.exit(str(e))
+        return
+    if options.fleet:
+        if not options.batch or args:
+            parser.error("--fleet needs --batch and no other arguments")
+        try:
+            make_fleet(options.batch, options.devInt64, filters=filters, formats=formats, cache=options.cache,
+                       scan=scan)
+        except ValueError as e:
+            parser.error(str(e))
+        return
+    if options.batch:
+        if args:
+            parser.error("Incorrect number of arguments")
+        if run_batch(options.batch, options.devInt64, options.jobs, incremental=options.incremental,
+                     substitutions=options.substitutions, filters=filters, formats=formats,
+                     cache=options.cache, scan=scan, profile=options.profile,
+                     trace_memory=options.profile_memory, stats_json=options.stats_json):
+            sys.exit(1)
+        return
+    if len(args) != 2:
+        parser.error("Incorrect number of arguments")
+    stats = RunStats(options.profile_memory) if options.profile or options.stats_json else None
+    if options.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        generated = make_db_and_edl(args[0], args[1], options.devInt64, incremental=options.incremental,
+                                    substitutions=options.substitutions, filters=filters, formats=formats,
+                                    cache=options.cache, scan=scan, stats=stats)
+    except ValueError as e:
+        sys.exit(str(e))
+    finally:
+        if options.cprofile:
+            profiler.disable()
+            profiler.dump_stats(options.cprofile)
+    if not generated:
+        print("%s is up to date" % args[1])
+    if options.profile:
+        report_stats(args[1], stats.as_dict())
+    if options.stats_json:
+        write_stats_json(options.stats_json, [(args[1], args[0], stats.as_dict())])
 
+if __name__ == "__main__":
+    main()
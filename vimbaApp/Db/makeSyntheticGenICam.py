@@ -0,0 +1,264 @@
+#!/bin/env python3
+import random
+from optparse import OptionParser
+
+# words that feature names are made of
+words = ["Acquisition", "Exposure", "Gain", "Black", "Level", "Trigger",
+         "Line", "Counter", "Timer", "Sequencer", "Chunk", "Device", "Stream",
+         "Sensor", "Shutter", "Binning", "Decimation", "Offset", "Width",
+         "Height", "Pixel", "Format", "Color", "Transformation", "Gamma",
+         "Contrast", "Hue", "Saturation", "User", "Set", "File", "Event",
+         "Temperature", "Link", "Throughput", "Limit", "Auto", "Mode",
+         "Selector", "Source", "Activation", "Delay", "Duration", "Value"]
+
+# the prefix shared by the names that are meant to collide once they are
+# shortened to 20 character record names
+collidingPrefix = "SensorTemperatureStatusSelectorChannel"
+
+# The kinds of feature made, in turn
+kinds = ["Integer", "Float", "Enumeration", "Boolean", "Integer", "Float",
+         "Command", "StringReg", "Converter", "IntSwissKnife"]
+
+visibilities = ["Beginner", "Expert", "Guru", "Invisible"]
+
+# number of features whose registers can invalidate each other
+blockSize = 20
+
+xml_header = """<?xml version="1.0" encoding="utf-8"?>
+<RegisterDescription
+    ModelName="Synthetic_%(features)d"
+    VendorName="Synthetic"
+    ToolTip="Synthetic GenICam description with %(features)d features"
+    StandardNameSpace="None"
+    SchemaMajorVersion="1"
+    SchemaMinorVersion="1"
+    SchemaSubMinorVersion="0"
+    MajorVersion="1"
+    MinorVersion="0"
+    SubMinorVersion="0"
+    ProductGuid="00000000-0000-0000-0000-000000000000"
+    VersionGuid="00000000-0000-0000-0000-000000000000"
+    xmlns="http://www.genicam.org/GenApi/Version_1_1">
+"""
+
+# a register behind a feature
+register_xml = """    <%(regKind)s Name="%(register)s">
+        <Address>0x%(address)x</Address>
+        <Length>%(length)d</Length>
+        <AccessMode>%(accessMode)s</AccessMode>
+        <pPort>Device</pPort>
+%(invalidators)s%(extra)s    </%(regKind)s>
+"""
+
+# The chunk data of a camera: ChunkModeActive, ChunkSelector and
+# ChunkEnable on the Device port, and a feature for each entry of the
+# ChunkSelector but the last, read from the ChunkPort that has a ChunkID,
+# as (entry, kind, register kind, register length) of the chunk values
+chunk_values = [("Timestamp", "Integer", "IntReg", 8), ("ExposureTime", "Float", "FloatReg", 8),
+                ("LineStatusAll", "Integer", "IntReg", 4), ("Crc", None, None, 0)]
+
+chunk_xml = """    <Category Name="ChunkDataControl">
+        <pFeature>ChunkModeActive</pFeature>
+        <pFeature>ChunkSelector</pFeature>
+        <pFeature>ChunkEnable</pFeature>
+%(features)s    </Category>
+    <Boolean Name="ChunkModeActive">
+        <ToolTip>Sends chunk data with each frame</ToolTip>
+        <pValue>RegChunkModeActive</pValue>
+    </Boolean>
+    <IntReg Name="RegChunkModeActive">
+        <Address>0xf000</Address>
+        <Length>4</Length>
+        <AccessMode>RW</AccessMode>
+        <pPort>Device</pPort>
+    </IntReg>
+    <Enumeration Name="ChunkSelector">
+        <ToolTip>Selects the chunk that ChunkEnable sends</ToolTip>
+%(entries)s        <pValue>RegChunkSelector</pValue>
+        <pSelected>ChunkEnable</pSelected>
+    </Enumeration>
+    <IntReg Name="RegChunkSelector">
+        <Address>0xf004</Address>
+        <Length>4</Length>
+        <AccessMode>RW</AccessMode>
+        <pPort>Device</pPort>
+    </IntReg>
+    <Boolean Name="ChunkEnable">
+        <ToolTip>Sends the selected chunk with each frame</ToolTip>
+        <pValue>RegChunkEnable</pValue>
+    </Boolean>
+    <IntReg Name="RegChunkEnable">
+        <Address>0xf008</Address>
+        <Length>4</Length>
+        <AccessMode>RW</AccessMode>
+        <pPort>Device</pPort>
+        <pInvalidator>RegChunkSelector</pInvalidator>
+    </IntReg>
+%(values)s    <Port Name="ChunkPort">
+        <ToolTip>Port to the chunk data of each frame</ToolTip>
+        <ChunkID>1000</ChunkID>
+    </Port>
+"""
+
+# the chunk data features of a camera
+def chunk_genicam():
+    features = entries = values = ""
+    for i, (entry, kind, regKind, length) in enumerate(chunk_values):
+        entries += '        <EnumEntry Name="%s">\n            <Value>%d</Value>\n        </EnumEntry>\n' % (entry, i)
+        if kind is None:
+            continue
+        features += "        <pFeature>Chunk%s</pFeature>\n" % entry
+        values += '    <%s Name="Chunk%s">\n        <ToolTip>%s of the frame</ToolTip>\n' % (kind, entry, entry)
+        values += "        <pValue>RegChunk%s</pValue>\n    </%s>\n" % (entry, kind)
+        values += '    <%s Name="RegChunk%s">\n        <Address>0x%x</Address>\n' % (regKind, entry, 8 * i)
+        values += "        <Length>%d</Length>\n        <AccessMode>RO</AccessMode>\n" % length
+        values += "        <pPort>ChunkPort</pPort>\n    </%s>\n" % regKind
+    return chunk_xml % dict(features=features, entries=entries, values=values)
+
+# Make the names of n features, some fraction of which collide once shortened
+def feature_names(n, collisions, rng):
+    names = []
+    used = set()
+    for i in range(n):
+        if rng.random() < collisions:
+            name = "%s%s%d" % (collidingPrefix, rng.choice(words), i)
+        else:
+            name = "".join(rng.choice(words) for j in range(rng.randint(2, 4)))
+            if name in used:
+                name += str(i)
+        used.add(name)
+        names.append(name)
+    return names
+
+# The category tree, as [(name, [children...])...] with the features split
+# between the leaves in order. depth is the number of levels under Root
+def category_tree(names, depth, perLeaf=20):
+    leaves = max(1, (len(names) + perLeaf - 1) // perLeaf)
+    # same number of branches at each level
+    branches = 2
+    while branches ** depth < leaves:
+        branches += 1
+    categories = []
+    level = ["Root"]
+    for d in range(depth):
+        nextLevel = []
+        for parent in level:
+            children = ["%sC%d" % ("" if parent == "Root" else parent, i) for i in range(branches)]
+            categories.append((parent, children))
+            nextLevel += children
+        level = nextLevel
+    for i, leaf in enumerate(level):
+        chunk = names[i * len(names) // len(level):(i + 1) * len(names) // len(level)]
+        categories.append((leaf, chunk))
+    return categories
+
+# The xml for a synthetic camera, in pieces
+def synthetic_genicam(features=1000, depth=3, enum_size=8, collisions=0.05, seed=0, arv_header=False,
+                      chunks=False):
+    rng = random.Random(seed)
+    if arv_header:
+        yield "arv-tool-0.8 synthetic genicam\n"
+    yield xml_header % dict(features=features)
+    names = feature_names(features, collisions, rng)
+    for category, children in category_tree(names, depth):
+        yield '    <Category Name="%s">\n' % category
+        for child in children:
+            yield "        <pFeature>%s</pFeature>\n" % child
+        if chunks and category == "Root":
+            yield "        <pFeature>ChunkDataControl</pFeature>\n"
+        yield "    </Category>\n"
+    registers = []
+    for i, name in enumerate(names):
+        kind = kinds[i % len(kinds)]
+        register = "Reg" + name
+        accessMode = rng.choice(["RW", "RW", "RW", "RO"])
+        visibility = visibilities[min(int(rng.expovariate(1.0)), 3)]
+        yield '    <%s Name="%s">\n' % (kind, name)
+        yield "        <ToolTip>Synthetic %s feature %d</ToolTip>\n" % (kind, i)
+        yield "        <Visibility>%s</Visibility>\n" % visibility
+        regKind = "IntReg"
+        extra = ""
+        length = 4
+        if kind == "Enumeration":
+            for j in range(enum_size):
+                yield '        <EnumEntry Name="%sValue%d">\n            <Value>%d</Value>\n        </EnumEntry>\n' % (name[:12], j, j)
+            yield "        <pValue>%s</pValue>\n" % register
+        elif kind == "Boolean":
+            yield "        <pValue>%s</pValue>\n        <OnValue>1</OnValue>\n        <OffValue>0</OffValue>\n" % register
+            regKind = "MaskedIntReg"
+            extra = "        <Bit>%d</Bit>\n" % (i % 32)
+        elif kind == "Float":
+            yield "        <pValue>%s</pValue>\n" % register
+            regKind = "FloatReg"
+            length = 8
+        elif kind == "Command":
+            yield "        <pValue>%s</pValue>\n        <CommandValue>1</CommandValue>\n" % register
+            accessMode = "WO"
+        elif kind == "StringReg":
+            yield "        <Address>0x%x</Address>\n        <Length>32</Length>\n" % (0x10000 + 0x40 * i)
+            yield "        <AccessMode>%s</AccessMode>\n        <pPort>Device</pPort>\n" % accessMode
+            register = None
+        elif kind == "Converter":
+            yield '        <pVariable Name="SCALE">%s</pVariable>\n' % registers[-1]
+            yield "        <FormulaTo>FROM * SCALE</FormulaTo>\n        <FormulaFrom>TO / SCALE</FormulaFrom>\n"
+            yield "        <pValue>%s</pValue>\n" % register
+        elif kind == "IntSwissKnife":
+            yield '        <pVariable Name="A">%s</pVariable>\n' % registers[-1]
+            yield '        <pVariable Name="B">%s</pVariable>\n' % registers[-2]
+            yield "        <Formula>A + B</Formula>\n"
+            register = None
+        else:
+            yield "        <pValue>%s</pValue>\n" % register
+        yield "    </%s>\n" % kind
+        if register is None:
+            continue
+        # some registers are invalidated by the ones written before them in
+        # the same block of features, like the features of a category
+        block = registers[len(registers) - i % blockSize:]
+        invalidators = "".join("        <pInvalidator>%s</pInvalidator>\n" % r
+                               for r in rng.sample(block, min(len(block), rng.choice([0, 0, 1, 2]))))
+        yield register_xml % dict(regKind=regKind, register=register, address=0x1000 + 8 * i,
+                                  length=length, accessMode=accessMode, invalidators=invalidators, extra=extra)
+        registers.append(register)
+    if chunks:
+        yield chunk_genicam()
+    yield '    <Port Name="Device">\n        <ToolTip>Port to the camera</ToolTip>\n    </Port>\n'
+    yield "</RegisterDescription>\n"
+
+# write a synthetic camera to filename
+def write_synthetic_genicam(filename, **kwargs):
+    with open(filename, "w") as f:
+        f.writelines(synthetic_genicam(**kwargs))
+
+def main():
+    parser = OptionParser("""%prog [options] <output_xml>
+
+This script writes a synthetic GenICam xml file to test how makeDbAndEdl.py
+scales. It has the given number of features of every kind that makeDbAndEdl.py
+makes records for, each with the registers behind it, spread over a tree of
+categories, with pInvalidator links between the registers. A fraction of the
+feature names are made to collide once they are shortened to record names.
+With --chunks it also has chunk data features.""")
+    parser.add_option("-n", "--features", type="int", dest="features", default=1000,
+                      help="number of features (default: 1000)")
+    parser.add_option("", "--depth", type="int", dest="depth", default=3,
+                      help="levels of categories under Root (default: 3)")
+    parser.add_option("", "--enum-size", type="int", dest="enum_size", default=8,
+                      help="number of entries in each Enumeration (default: 8)")
+    parser.add_option("", "--collisions", type="float", dest="collisions", default=0.05,
+                      help="fraction of feature names that collide as record names (default: 0.05)")
+    parser.add_option("", "--seed", type="int", dest="seed", default=0,
+                      help="random seed (default: 0)")
+    parser.add_option("", "--arv-header", action="store_true", dest="arv_header", default=False,
+                      help="start the file with a line of arv-tool output, like the xml it dumps")
+    parser.add_option("", "--chunks", action="store_true", dest="chunks", default=False,
+                      help="add ChunkSelector, ChunkEnable and chunk data features on a port with a ChunkID")
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error("Incorrect number of arguments")
+    write_synthetic_genicam(args[0], features=options.features, depth=options.depth,
+                            enum_size=options.enum_size, collisions=options.collisions,
+                            seed=options.seed, arv_header=options.arv_header, chunks=options.chunks)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+#!/bin/env python3
+import os, re, json, math
+from optparse import OptionParser
+
+from makeDbAndEdl import default_prefix, read_model, read_manifest, feature_records, open_output
+from simulateGenICam import SimulatedCamera, GenICamError
+
+# Bytes a second of the links cameras are connected with, and the bytes of
+# the packets their streams are sent in, 0 where the stream isn't split into
+# packets with their own headers
+link_presets = {"gige": (125000000, 1500), "10gige": (1250000000, 9000), "usb3": (400000000, 0)}
+
+# The IP, UDP and GVSP headers of each packet of a GigE Vision stream
+packet_header_bytes = 36
+
+# The link_presets entry of each DeviceTLType, the others have no preset
+transport_links = {"GigEVision": "gige", "USB3Vision": "usb3"}
+
+# Features only a GigE Vision camera has, as they are its network settings
+gige_features = ["GevMACAddress", "GevCurrentIPAddress"]
+
+# The ROIs planned for a camera whose sensor size isn't known
+default_rois = "640x480,1280x720,1280x1024,1920x1080,1920x1200,2448x2048,4096x3000"
+
+# The largest value a register of the simulated camera is given, which is
+# what a maximum that only the real camera knows reads as
+unknown_max = 2 ** 31 - 1
+
+# Bits of each pixel of a PixelFormat, PFNC names like Mono10p and the
+# GigE Vision 1 names like Mono12Packed, or None for a format that isn't
+# known. Unpacked formats of more than 8 bits take 16 bits a channel, the
+# p formats and the packed mono and Bayer ones take just the bits of the
+# depth, and the packed RGB ones are really unpacked
+def pixel_bits(name):
+    chroma = re.match(r"(YUV|YCbCr)(411|422|444)?", name)
+    if chroma:
+        return {"411": 12, "422": 16}.get(chroma.group(2), 24)
+    m = re.match(r"(Mono|Bayer[A-Z]{2}|RGBA|BGRA|RGBa|BGRa|RGB|BGR)(\d+)(p|Packed)?$", name)
+    if not m:
+        return None
+    kind, depth, packed = m.group(1), int(m.group(2)), m.group(3)
+    channels = 4 if kind[3:] in ("A", "a") else 3 if kind in ("RGB", "BGR") else 1
+    if packed == "p" or (packed == "Packed" and channels == 1):
+        return depth * channels
+    return channels * (8 if depth <= 8 else 16)
+
+# The bytes of a frame of width x height pixels of bits each, and the bytes
+# it takes on the link with the headers of its packets
+def frame_bytes(width, height, bits, packet_size=0):
+    payload = (width * height * bits + 7) // 8
+    if packet_size <= packet_header_bytes:
+        return payload, payload
+    packets = -(-payload // (packet_size - packet_header_bytes))
+    return payload, payload + packets * packet_header_bytes
+
+# the value of feature in camera if it is one the xml, or --values, knows
+def known_value(camera, feature):
+    try:
+        value = camera.get(feature)
+    except (GenICamError, KeyError):
+        return None
+    return value if isinstance(value, (int, float)) and 0 < value < unknown_max else None
+
+# the Max of feature in camera if the xml, or --values, knows it
+def known_max(camera, feature):
+    try:
+        value = camera.limits(camera.node(feature))[1]
+    except (GenICamError, KeyError, ValueError):
+        return None
+    return value if math.isfinite(value) and 0 < value < unknown_max else None
+
+# The link_presets entry of the transport layer of camera and where it
+# comes from: DeviceTLType if it has a value, or else gige for a camera with
+# the network features of GigE Vision, and usb3 for one without them. Vimba
+# streams every other camera without GigE Vision packets, so it is the one
+# with no overhead. The entry is None for a transport layer without a preset
+def link_type(camera):
+    try:
+        transport = camera.get("DeviceTLType")
+    except (GenICamError, KeyError):
+        transport = None
+    if isinstance(transport, str):
+        return transport_links.get(transport), "DeviceTLType"
+    if any(name in camera.nodes for name in gige_features):
+        return "gige", "GigE Vision features"
+    return "usb3", "no GigE Vision features"
+
+# The size of the sensor in the IMAGE_XSIZE and IMAGE_YSIZE of the .env file
+# of a camera, or None if it hasn't got them
+def env_sensor(env):
+    if not env or not os.path.exists(env):
+        return None
+    sizes = dict(re.findall(r'epicsEnvSet\(\s*"(IMAGE_[XY]SIZE)"\s*,\s*"(\d+)"\s*\)', open(env).read()))
+    if "IMAGE_XSIZE" not in sizes or "IMAGE_YSIZE" not in sizes:
+        return None
+    return int(sizes["IMAGE_XSIZE"]), int(sizes["IMAGE_YSIZE"])
+
+# the Inc of feature in camera, 1 if it hasn't got one
+def increment(camera, feature):
+    try:
+        return max(1, int(camera.value_or_getter(camera.node(feature), "Inc", 1)()))
+    except (GenICamError, KeyError, ValueError):
+        return 1
+
+# parse "<width>x<height>"
+def parse_roi(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+# The ROIs to plan, each rounded down to the increments of Width and Height:
+# rois if they are given, or else the sensor and halves of it down to an
+# eighth, or default_rois if its size isn't known. Those larger than the
+# sensor are left out
+def plan_rois(sensor, rois, inc):
+    if rois:
+        sizes = [parse_roi(roi) for roi in rois.split(",") if roi]
+    elif sensor:
+        sizes = [(sensor[0] // n, sensor[1] // n) for n in (1, 2, 4, 8)]
+    else:
+        sizes = [parse_roi(roi) for roi in default_rois.split(",")]
+    planned = []
+    for width, height in sizes:
+        roi = (width - width % inc[0], height - height % inc[1])
+        if sensor and (roi[0] > sensor[0] or roi[1] > sensor[1]):
+            continue
+        if roi[0] > 0 and roi[1] > 0 and roi not in planned:
+            planned.append(roi)
+    return planned
+
+# The bandwidth plan of genicam_xml: for each PixelFormat its bits per pixel
+# and, for each ROI, the bytes of a frame, the bytes on the link and the
+# highest frame rate the link carries. The sensor size and the link come
+# from the xml, or values, if they are there, or else from sensor, "<w>x<h>",
+# or the IMAGE_XSIZE and IMAGE_YSIZE of the .env file env, and link, the
+# name of a link_presets entry or bytes a second. A sensor size that isn't
+# WidthMax and HeightMax is divided by the binning. Only a GigE link has
+# packets with headers
+def bandwidth_plan(genicam_xml, values=None, sensor=None, link=None, packet_size=None, rois=None, env=None):
+    camera = SimulatedCamera(genicam_xml)
+    if values:
+        camera.load_values(values)
+    sensorSize = tuple(known_value(camera, name) for name in ("WidthMax", "HeightMax"))
+    sensorSource = "xml"
+    if sensor:
+        sensorSize, sensorSource = parse_roi(sensor), "--sensor"
+    elif None in sensorSize:
+        sensorSize, sensorSource = env_sensor(env), "env"
+        if sensorSize is None:
+            sensorSource = "unknown"
+    if sensorSize and sensorSource != "xml":
+        binning = [known_value(camera, name) or 1 for name in ("BinningHorizontal", "BinningVertical")]
+        sensorSize = (sensorSize[0] // binning[0], sensorSize[1] // binning[1])
+    linkType, typeSource = link_type(camera)
+    if link in link_presets:
+        linkType, typeSource = link, "--link"
+    linkBytes = known_max(camera, "DeviceLinkThroughputLimit")
+    if linkBytes is not None:
+        linkSource = "DeviceLinkThroughputLimit"
+    elif link is not None and link not in link_presets:
+        linkBytes, linkSource = float(link), "--link"
+    elif linkType is not None:
+        linkBytes, linkSource = link_presets[linkType][0], linkType
+    else:
+        raise ValueError("The link of %s has no preset, give --link" % genicam_xml)
+    if linkType is None or not link_presets[linkType][1]:
+        packet_size = 0
+    elif packet_size is None:
+        packet_size = known_value(camera, "GevSCPSPacketSize") or link_presets[linkType][1]
+    inc = (increment(camera, "Width"), increment(camera, "Height"))
+    formats = {}
+    names = camera.entries("PixelFormat") if "PixelFormat" in camera.nodes else []
+    for name in names:
+        bits = pixel_bits(name)
+        if bits is None:
+            continue
+        rows = []
+        for width, height in plan_rois(sensorSize, rois, inc):
+            payload, onLink = frame_bytes(width, height, bits, packet_size)
+            rows.append(dict(width = width, height = height, bytes = payload, linkBytes = onLink,
+                             maxFrameRate = round(linkBytes / onLink, 2)))
+        formats[name] = dict(bitsPerPixel = bits, rois = rows)
+    return dict(sensor = dict(width = sensorSize[0], height = sensorSize[1], source = sensorSource)
+                         if sensorSize else dict(source = sensorSource),
+                link = dict(bytesPerSecond = linkBytes, source = linkSource, packetSize = packet_size,
+                            type = linkType, typeSource = typeSource),
+                increments = dict(width = inc[0], height = inc[1]),
+                unknownFormats = [name for name in names if pixel_bits(name) is None],
+                formats = formats)
+
+# print the frame rate ceiling of each pixel format at each ROI
+def report_plan(camera_name, plan):
+    link = plan["link"]
+    print("%s: %s link %.0f MB/s (%s), %s, sensor %s" % (camera_name, link["type"] or "other",
+          link["bytesPerSecond"] / 1e6, link["source"],
+          "packets of %d bytes" % link["packetSize"] if link["packetSize"] else "no packet headers",
+          "%(width)dx%(height)d (%(source)s)" % plan["sensor"] if "width" in plan["sensor"] else "unknown"))
+    if not plan["formats"]:
+        return
+    rois = next(iter(plan["formats"].values()))["rois"]
+    print("  %-24s %4s  %s" % ("fps", "bits", "  ".join("%10s" % ("%dx%d" % (r["width"], r["height"]))
+                                                         for r in rois)))
+    for name, f in plan["formats"].items():
+        print("  %-24s %4d  %s" % (name, f["bitsPerPixel"], "  ".join("%10.1f" % r["maxFrameRate"]
+                                                                       for r in f["rois"])))
+    if plan["unknownFormats"]:
+        print("  formats whose size isn't known: %s" % ", ".join(plan["unknownFormats"]))
+
+# The records that show the frame rate ceiling of the link live, worked out
+# from the PayloadSize the camera reports, and the lookup table of the
+# formats at the largest ROI as waveforms
+db_bandwidth = '''# The frame rate the link of %(camera_name)s can carry, made by
+# planBandwidth.py. Load it with %(camera_name)s.template
+# Macros:
+#%% macro, P, Device Prefix
+#%% macro, R, Device Suffix
+
+record(calc, "$(P)$(R)GC_LinkMaxFrameRate") {
+  field(DESC, "Frame rate ceiling of the link")
+  field(INPA, "%(link)s")
+  field(INPB, "%(payload)s")
+  field(INPC, "%(packet)s")
+  field(CALC, "B>0?A/(B+(C>%(header)d?CEIL(B/(C-%(header)d))*%(header)d:0)):0")
+  field(EGU,  "fps")
+  field(PREC, "1")
+}
+
+record(waveform, "$(P)$(R)GC_LinkFormats") {
+  field(DESC, "Pixel formats of GC_LinkFormatRates")
+  field(FTVL, "STRING")
+  field(NELM, "%(count)d")
+  field(INP,  {const: [%(names)s]})
+}
+
+record(waveform, "$(P)$(R)GC_LinkFormatRates") {
+  field(DESC, "Frame rate ceilings at %(roi)s")
+  field(FTVL, "DOUBLE")
+  field(NELM, "%(count)d")
+  field(EGU,  "fps")
+  field(PREC, "1")
+  field(INP,  {const: [%(rates)s]})
+}
+'''
+
+# the input link of a calc record to the readback of feature if it gets
+# records, or else the constant it is planned with
+def readback_link(model, feature, constant):
+    for node, shape, hasDemand, entries in feature_records(model):
+        if node.name == feature and shape != "Command":
+            return "$(P)$(R)%s_RBV CP" % node.recordName
+    return "%g" % constant
+
+# Write the bandwidth plan of genicam_xml to <prefix>/Db/<camera_name>-bandwidth.json,
+# and with records the records that show the ceiling live to
+# <prefix>/Db/<camera_name>-bandwidth.template. A sensor size that isn't in
+# the xml is read from <prefix>/Db/<camera_name>.env. Returns the filenames
+def write_bandwidth_plan(genicam_xml, camera_name, prefix=default_prefix, records=False, **options):
+    options.setdefault("env", os.path.join(prefix, "Db", camera_name + ".env"))
+    plan = bandwidth_plan(genicam_xml, **options)
+    report_plan(camera_name, plan)
+    filenames = [os.path.join(prefix, "Db", camera_name + "-bandwidth.json")]
+    with open_output(filenames[0]) as f:
+        json.dump(dict(plan, camera = camera_name), f, indent=1, sort_keys=True)
+        f.write("\n")
+    if records and plan["formats"]:
+        model = read_model(genicam_xml)
+        link = plan["link"]
+        # the largest ROI of each format
+        rois = [max(f["rois"], key=lambda r: r["width"] * r["height"]) for f in plan["formats"].values()]
+        filenames.append(os.path.join(prefix, "Db", camera_name + "-bandwidth.template"))
+        with open_output(filenames[1]) as f:
+            f.write(db_bandwidth % dict(camera_name = camera_name,
+                link = readback_link(model, "DeviceLinkThroughputLimit", link["bytesPerSecond"]),
+                payload = readback_link(model, "PayloadSize", rois[0]["bytes"]),
+                packet = readback_link(model, "GevSCPSPacketSize", link["packetSize"])
+                         if link["packetSize"] else "0",
+                header = packet_header_bytes, count = len(rois), roi = "%dx%d" % (rois[0]["width"], rois[0]["height"]),
+                names = ", ".join(json.dumps(name) for name in plan["formats"]),
+                rates = ", ".join("%g" % r["maxFrameRate"] for r in rois)))
+    return filenames
+
+def main():
+    parser = OptionParser("""%prog [options] <genicam_xml> <camera_name>
+       %prog [options] --batch <xml_dir_or_manifest>
+
+This script plans the frame rate the link can carry for each PixelFormat and
+ROI, in ../Db/<camera_name>-bandwidth.json. See README.md in this directory.""")
+    parser.add_option("", "--values", dest="values", default=None,
+                      help="json file of {feature: value} of the camera, like simulateGenICam.py --dump")
+    parser.add_option("", "--sensor", dest="sensor", default=None,
+                      help="size of the sensor as <width>x<height>, if it isn't in the xml")
+    parser.add_option("", "--link", dest="link", default=None,
+                      help="%s or bytes a second, if DeviceLinkThroughputLimit isn't known "
+                           "(default: that of the transport layer)" % ", ".join(sorted(link_presets)))
+    parser.add_option("", "--packet-size", type="int", dest="packet_size", default=None,
+                      help="bytes of each GigE stream packet (default: GevSCPSPacketSize, or that of the link)")
+    parser.add_option("", "--rois", dest="rois", default=None,
+                      help="comma separated ROIs to plan (default: the sensor and halves of it, or %s)"
+                           % default_rois)
+    parser.add_option("", "--records", action="store_true", dest="records", default=False,
+                      help="also write the records that show the ceiling live")
+    parser.add_option("", "--batch", dest="batch", default=None,
+                      help="plan every camera in this directory or manifest")
+    options, args = parser.parse_args()
+    if options.batch and not args:
+        todo = read_manifest(options.batch)
+    elif len(args) == 2 and not options.batch:
+        todo = [(args[0], args[1])]
+    else:
+        parser.error("Incorrect number of arguments")
+    if options.link is not None and options.link not in link_presets:
+        try:
+            float(options.link)
+        except ValueError:
+            parser.error("--link %s is not one of %s or a number" % (options.link, ", ".join(sorted(link_presets))))
+    values = json.load(open(options.values)) if options.values else None
+    for genicam_xml, camera_name in todo:
+        write_bandwidth_plan(genicam_xml, camera_name, records=options.records, values=values,
+                             sensor=options.sensor, link=options.link, packet_size=options.packet_size,
+                             rois=options.rois)
+
+if __name__ == "__main__":
+    main()
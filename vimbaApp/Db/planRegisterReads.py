@@ -0,0 +1,174 @@
+#!/bin/env python3
+import os, json
+from optparse import OptionParser
+
+from makeDbAndEdl import default_prefix, read_model, read_manifest, feature_records, open_output
+from simulateGenICam import read_sim_nodes, registerKinds, compile_formula, parse_int
+
+# The transport layer statistics that ADVimba::processFrame reads on every
+# frame, from TLStatisticsFeatureNames_
+statistics_features = ["StatFrameDelivered", "StatFrameDropped", "StatFrameUnderrun",
+                       "StatPacketErrors", "StatPacketMissed", "StatPacketReceived",
+                       "StatPacketRequested", "StatPacketResent"]
+
+# The links that are followed from a node to the nodes that are read with it
+read_links = ["pValue", "pIsImplemented", "pIsAvailable", "pIsLocked", "pLength"]
+
+# The names of the registers that are read to read feature, following its
+# pValue chain, the variables of its formulas, the selectors of indexed
+# registers and the nodes that say whether it can be read
+def feature_registers(nodes, feature):
+    registers = []
+    seen = set()
+    stack = [feature]
+    while stack:
+        name = stack.pop()
+        node = nodes.get(name)
+        if name in seen or node is None:
+            continue
+        seen.add(name)
+        if node.kind in registerKinds:
+            registers.append(name)
+        stack += [node.text[link] for link in read_links if link in node.text]
+        stack += [target for variable, target in node.pVariables]
+        for tag, value, offset in node.addresses:
+            if tag != "Address":
+                stack.append(value)
+            if isinstance(offset, str):
+                stack.append(offset)
+    return registers
+
+# (port, address, length) of a register, or None if its address or length
+# depends on the value of another node, like a register with a pIndex
+def register_range(nodes, node):
+    if "Length" not in node.text:
+        return None
+    address = 0
+    for tag, value, offset in node.addresses:
+        if tag == "Address":
+            address += value
+        elif tag == "pIndex" or value not in nodes or nodes[value].pVariables or \
+                not nodes[value].kind.endswith("SwissKnife"):
+            return None
+        else:
+            # an offset that is a formula of no variables
+            address += int(compile_formula(nodes[value].text["Formula"], (),
+                                           nodes[value].kind == "IntSwissKnife")())
+    return node.text.get("pPort", "Device"), address, parse_int(node.text["Length"])
+
+# Merge the ranges of registers, {register: (port, address, length)}, that
+# are on the same port and overlap, touch, or are at most max_gap bytes
+# apart into blocks of at most max_block bytes. Returns the blocks as
+# [(port, address, length, [registers...])...] in address order
+def merge_ranges(ranges, max_block=512, max_gap=0):
+    blocks = []
+    for name, (port, address, length) in sorted(ranges.items(), key=lambda x: x[1]):
+        if blocks:
+            p, start, n, names = blocks[-1]
+            end = max(start + n, address + length)
+            if p == port and address <= start + n + max_gap and end - start <= max_block:
+                blocks[-1] = (p, start, end - start, names + [name])
+                continue
+        blocks.append((port, address, length, [name]))
+    return blocks
+
+# The plan for reading features: the blocks that cover their registers at
+# fixed addresses, the registers that have to be read alone, and how many
+# transactions it takes one feature at a time, one register at a time and
+# with the plan
+def read_plan(nodes, features, max_block=512, max_gap=0):
+    ranges = {}
+    indexed = {}
+    perFeature = 0
+    registersOf = {}
+    for feature in features:
+        registers = [r for r in feature_registers(nodes, feature)
+                     if nodes[r].text.get("AccessMode", "RO") != "WO"]
+        registersOf[feature] = registers
+        perFeature += len(registers)
+        for r in registers:
+            place = register_range(nodes, nodes[r])
+            if place is None:
+                indexed.setdefault(feature, []).append(r)
+            else:
+                ranges[r] = place
+    blocks = merge_ranges(ranges, max_block, max_gap)
+    blockOf = {}
+    for i, (port, address, length, names) in enumerate(blocks):
+        for name in names:
+            blockOf[name] = i
+    alone = set(r for registers in indexed.values() for r in registers)
+    return dict(features = len(features),
+                blocks = [dict(port = port, address = "0x%x" % address, length = length, registers = names)
+                          for port, address, length, names in blocks],
+                featureBlocks = dict((f, sorted(set(blockOf[r] for r in registers if r in blockOf)))
+                                     for f, registers in registersOf.items()),
+                indexed = indexed,
+                transactions = dict(perFeature = perFeature,
+                                    perRegister = len(ranges) + len(alone),
+                                    planned = len(blocks) + len(alone)))
+
+# print the summary of a plan for a set of features
+def report_plan(camera_name, title, plan):
+    t = plan["transactions"]
+    saved = t["perFeature"] - t["planned"]
+    print("%s %s: %d features, %d reads one feature at a time, %d registers, %d reads with the plan, "
+          "%d saved (%.0f%%)" % (camera_name, title, plan["features"], t["perFeature"], t["perRegister"],
+                                 t["planned"], saved, 100.0 * saved / t["perFeature"] if t["perFeature"] else 0))
+
+# Write the read plan of the features of genicam_xml that get records to
+# <prefix>/Db/<camera_name>-readplan.json, with the plan for the statistics
+# that are read on each frame alongside. Returns the filename
+def write_read_plan(genicam_xml, camera_name, prefix=default_prefix, max_block=512, max_gap=0,
+                    statistics=statistics_features):
+    nodes, categories = read_sim_nodes(genicam_xml)
+    model = read_model(genicam_xml)
+    features = [node.name for node, shape, hasDemand, entries in feature_records(model)
+                if shape != "Command"]
+    full = read_plan(nodes, features, max_block, max_gap)
+    present = [name for name in statistics if name in nodes]
+    stats = read_plan(nodes, present, max_block, max_gap)
+    report_plan(camera_name, "full readback", full)
+    if present:
+        report_plan(camera_name, "statistics", stats)
+    else:
+        print("%s statistics: none of the %d features are in this xml, they come from the transport layer"
+              % (camera_name, len(statistics)))
+    filename = os.path.join(prefix, "Db", camera_name + "-readplan.json")
+    with open_output(filename) as f:
+        json.dump(dict(camera = camera_name, maxBlock = max_block, maxGap = max_gap,
+                       blocks = full["blocks"], features = full["featureBlocks"], indexed = full["indexed"],
+                       transactions = full["transactions"],
+                       statistics = dict(features = present, blocks = stats["blocks"],
+                                         transactions = stats["transactions"])),
+                  f, indent=1, sort_keys=True)
+        f.write("\n")
+    return filename
+
+def main():
+    parser = OptionParser("""%prog [options] <genicam_xml> <camera_name>
+       %prog [options] --batch <xml_dir_or_manifest>
+
+This script plans the register reads of each feature, merged into blocks, in
+../Db/<camera_name>-readplan.json. See README.md in this directory.""")
+    parser.add_option("", "--max-block", type="int", dest="max_block", default=512,
+                      help="most bytes in a block (default: 512)")
+    parser.add_option("", "--max-gap", type="int", dest="max_gap", default=0,
+                      help="most unused bytes between two registers in a block (default: 0)")
+    parser.add_option("", "--statistics", dest="statistics", default=",".join(statistics_features),
+                      help="comma separated features read on each frame (default: the ADVimba statistics)")
+    parser.add_option("", "--batch", dest="batch", default=None,
+                      help="plan every camera in this directory or manifest")
+    options, args = parser.parse_args()
+    if options.batch and not args:
+        todo = read_manifest(options.batch)
+    elif len(args) == 2 and not options.batch:
+        todo = [(args[0], args[1])]
+    else:
+        parser.error("Incorrect number of arguments")
+    for genicam_xml, camera_name in todo:
+        write_read_plan(genicam_xml, camera_name, max_block=options.max_block, max_gap=options.max_gap,
+                        statistics=[name for name in options.statistics.split(",") if name])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1097 @@
+#!/bin/env python3
+import os, re, sys, math, json, time, struct, itertools
+from xml.etree.ElementTree import parse
+from optparse import OptionParser
+
+from makeDbAndEdl import localName, open_genicam, RO, WO, RW, accessBits, accessModes
+
+class GenICamError(Exception):
+    """A feature that can't be read or written, or a formula that can't be
+    compiled or evaluated"""
+
+# Formulas are made of numbers, names and the operators of the GenICam
+# standard
+formula_token = re.compile(r"\s*(?:(0[xX][0-9a-fA-F]+)|((?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)|"
+                           r"([A-Za-z_][A-Za-z_0-9]*)|(\*\*|<<|>>|<=|>=|<>|&&|\|\||[-+*/%&|^~!=<>?:(),]))")
+
+# binary operators, with their precedence and the python they turn into.
+# An IntSwissKnife works in integers, a SwissKnife in doubles, so they
+# differ in division and in the bit operators, which need integers
+binary_ops = {
+    "||": (1, "(1 if %s or %s else 0)", None),
+    "&&": (2, "(1 if %s and %s else 0)", None),
+    "|": (3, "(int(%s) | int(%s))", "(%s | %s)"),
+    "^": (4, "(int(%s) ^ int(%s))", "(%s ^ %s)"),
+    "&": (5, "(int(%s) & int(%s))", "(%s & %s)"),
+    "=": (6, "(1 if %s == %s else 0)", None),
+    "<>": (6, "(1 if %s != %s else 0)", None),
+    "<": (7, "(1 if %s < %s else 0)", None),
+    ">": (7, "(1 if %s > %s else 0)", None),
+    "<=": (7, "(1 if %s <= %s else 0)", None),
+    ">=": (7, "(1 if %s >= %s else 0)", None),
+    "<<": (8, "(int(%s) << int(%s))", "(%s << %s)"),
+    ">>": (8, "(int(%s) >> int(%s))", "(%s >> %s)"),
+    "+": (9, "(%s + %s)", None),
+    "-": (9, "(%s - %s)", None),
+    "*": (10, "(%s * %s)", None),
+    "/": (10, "(%s / %s)", "_div(%s, %s)"),
+    "%": (10, "_fmod(%s, %s)", "_mod(%s, %s)"),
+    "**": (11, "(%s ** %s)", None),
+}
+unary_ops = {"-": "(-%s)", "+": "(+%s)", "!": "(0 if %s else 1)", "~": "(~int(%s))"}
+unary_precedence = 12
+
+# division and remainder that round towards zero, like C
+def _div(a, b):
+    if isinstance(a, float) or isinstance(b, float):
+        return math.trunc(a / b)
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+def _mod(a, b):
+    return a - b * _div(a, b)
+
+def _round(x, digits=0):
+    scale = 10 ** digits
+    return math.floor(abs(x) * scale + 0.5) / scale * (1 if x >= 0 else -1)
+
+# the functions and constants a formula can use
+formula_functions = dict(
+    SGN = lambda x: (x > 0) - (x < 0),
+    NEG = lambda x: -x,
+    ABS = abs, SQRT = math.sqrt, EXP = math.exp, LN = math.log, LG = math.log10,
+    SIN = math.sin, COS = math.cos, TAN = math.tan,
+    ASIN = math.asin, ACOS = math.acos, ATAN = math.atan,
+    TRUNC = math.trunc, FLOOR = math.floor, CEIL = math.ceil, ROUND = _round)
+formula_constants = dict(PI = repr(math.pi), E = repr(math.e))
+
+# what the compiled formulas see as their globals
+formula_globals = dict(("_" + name, f) for name, f in formula_functions.items())
+formula_globals.update(_div = _div, _mod = _mod, _fmod = math.fmod, __builtins__ = {"int": int})
+
+def tokenize_formula(formula):
+    tokens = []
+    position = 0
+    formula = formula.rstrip()
+    while position < len(formula):
+        match = formula_token.match(formula, position)
+        if match is None:
+            raise GenICamError("Can't read formula %r at %r" % (formula, formula[position:]))
+        hexNumber, number, name, op = match.groups()
+        if hexNumber is not None:
+            tokens.append(("number", str(int(hexNumber, 16))))
+        elif number is not None:
+            tokens.append(("number", number))
+        elif name is not None:
+            tokens.append(("name", name))
+        else:
+            tokens.append(("op", op))
+        position = match.end()
+    tokens.append(("end", None))
+    return tokens
+
+class FormulaParser(object):
+    """Precedence climbing parser that turns a GenICam formula into a python
+    expression in which the variables are the arguments v0, v1, ..."""
+    def __init__(self, formula, variables, integer):
+        self.formula = formula
+        self.tokens = tokenize_formula(formula)
+        self.position = 0
+        self.arguments = dict((name, "v%d" % i) for i, name in enumerate(variables))
+        self.integer = integer
+
+    def error(self, message):
+        return GenICamError("%s in formula %r" % (message, self.formula))
+
+    def next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def expect(self, op):
+        token = self.next()
+        if token != ("op", op):
+            raise self.error("Expected %r" % op)
+
+    def parse(self):
+        expression = self.expression()
+        if self.tokens[self.position][0] != "end":
+            raise self.error("Unexpected %r" % (self.tokens[self.position][1],))
+        return expression
+
+    # a ? b : c, the lowest precedence, which groups to the right
+    def expression(self):
+        condition = self.binary(1)
+        if self.tokens[self.position] == ("op", "?"):
+            self.position += 1
+            whenTrue = self.expression()
+            self.expect(":")
+            whenFalse = self.expression()
+            return "(%s if %s else %s)" % (whenTrue, condition, whenFalse)
+        return condition
+
+    def binary(self, precedence):
+        left = self.unary()
+        while True:
+            kind, op = self.tokens[self.position]
+            if kind != "op" or op not in binary_ops or binary_ops[op][0] < precedence:
+                return left
+            self.position += 1
+            opPrecedence, floatTemplate, intTemplate = binary_ops[op]
+            # ** groups to the right, everything else to the left
+            right = self.binary(opPrecedence if op == "**" else opPrecedence + 1)
+            template = intTemplate if self.integer and intTemplate else floatTemplate
+            left = template % (left, right)
+
+    def unary(self):
+        kind, value = self.tokens[self.position]
+        if kind == "op" and value in unary_ops:
+            self.position += 1
+            return unary_ops[value] % self.binary(unary_precedence)
+        return self.atom()
+
+    def atom(self):
+        kind, value = self.next()
+        if kind == "number":
+            return value
+        if kind == "op" and value == "(":
+            expression = self.expression()
+            self.expect(")")
+            return expression
+        if kind == "name":
+            if self.tokens[self.position] == ("op", "(") and value.upper() in formula_functions:
+                self.position += 1
+                arguments = [self.expression()]
+                while self.tokens[self.position] == ("op", ","):
+                    self.position += 1
+                    arguments.append(self.expression())
+                self.expect(")")
+                return "_%s(%s)" % (value.upper(), ", ".join(arguments))
+            if value in self.arguments:
+                return self.arguments[value]
+            if value.upper() in formula_constants:
+                return formula_constants[value.upper()]
+            raise self.error("Unknown variable %r" % value)
+        raise self.error("Unexpected %r" % (value,))
+
+# compiled formulas, by (formula, variables, integer), shared by every camera
+compiled_formulas = {}
+
+# Compile formula to a python function of the values of variables, in order.
+# Each formula is compiled once, and calling the function doesn't look at the
+# text of the formula again
+def compile_formula(formula, variables=(), integer=False):
+    key = (formula, tuple(variables), integer)
+    function = compiled_formulas.get(key)
+    if function is None:
+        expression = FormulaParser(formula, variables, integer).parse()
+        if integer:
+            expression = "int(%s)" % expression
+        source = "lambda %s: %s" % (", ".join("v%d" % i for i in range(len(variables))), expression)
+        function = eval(compile(source, "<formula %s>" % formula, "eval"), formula_globals)
+        compiled_formulas[key] = function
+    return function
+
+# numbers in the xml are decimal, or hex with 0x
+def parse_int(text):
+    text = text.strip()
+    try:
+        return int(text, 0)
+    except ValueError:
+        return int(text, 10)
+
+# the kinds of node that are registers in a port
+registerKinds = ["IntReg", "MaskedIntReg", "FloatReg", "StringReg", "Register", "StructEntry"]
+
+# the kinds of node whose value is worked out by a formula
+formulaKinds = ["SwissKnife", "IntSwissKnife", "Converter", "IntConverter"]
+
+class SimNode(object):
+    """The parts of a GenICam node that are needed to read and write it"""
+    __slots__ = ("name", "kind", "text", "pVariables", "addresses", "entries")
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        # the text of the first child with each tag
+        self.text = {}
+        # [(variable name, node name)...]
+        self.pVariables = []
+        # the parts the address is the sum of, as (tag, value, offset)
+        self.addresses = []
+        # for an Enumeration [(name, value, pIsImplemented, pIsAvailable)...]
+        self.entries = []
+
+    def read(self, elem):
+        for child in elem:
+            tag = localName(child.tag)
+            if tag == "pVariable":
+                self.pVariables.append((child.get("Name"), child.text.strip()))
+            elif tag in ("Address", "pAddress", "IntSwissKnife", "pIndex"):
+                if tag == "Address":
+                    self.addresses.append((tag, parse_int(child.text), None))
+                elif tag == "IntSwissKnife":
+                    self.addresses.append((tag, child.get("Name"), None))
+                elif tag == "pIndex":
+                    offset = child.get("Offset")
+                    self.addresses.append((tag, child.text.strip(),
+                                           child.get("pOffset") if offset is None else parse_int(offset)))
+                else:
+                    self.addresses.append((tag, child.text.strip(), None))
+            elif tag == "EnumEntry":
+                entry = dict((localName(c.tag), (c.text or "").strip()) for c in child)
+                self.entries.append((child.get("Name"), parse_int(entry["Value"]),
+                                     entry.get("pIsImplemented"), entry.get("pIsAvailable")))
+            elif tag not in self.text and child.text is not None:
+                self.text[tag] = child.text.strip()
+        return self
+
+# the elements under root, leaving out the vendor Extension elements, whose
+# contents can have the same Name as a node
+def elements(root):
+    stack = [root]
+    while stack:
+        elem = stack.pop()
+        yield elem
+        stack += [c for c in reversed(elem) if localName(c.tag) != "Extension"]
+
+# Read the nodes of genicam_xml that have a Name, wherever they are, and the
+# StructEntry nodes of each StructReg, which get the register of the StructReg
+def read_sim_nodes(genicam_xml):
+    nodes = {}
+    categories = []
+    for elem in elements(parse(open_genicam(genicam_xml)).getroot()):
+        kind = localName(elem.tag)
+        if kind == "StructReg":
+            register = SimNode(None, kind).read([c for c in elem if localName(c.tag) != "StructEntry"])
+            for entry in elem:
+                if localName(entry.tag) == "StructEntry":
+                    node = SimNode(entry.get("Name"), "StructEntry").read(entry)
+                    for tag, text in register.text.items():
+                        node.text.setdefault(tag, text)
+                    node.addresses = register.addresses
+                    nodes[node.name] = node
+        elif kind == "Category":
+            categories += [c.text.strip() for c in elem if localName(c.tag) == "pFeature"]
+        elif elem.get("Name") is not None and kind not in ("EnumEntry", "StructEntry", "pVariable"):
+            nodes[elem.get("Name")] = SimNode(elem.get("Name"), kind).read(elem)
+    return nodes, categories
+
+class RegisterSpace(object):
+    """The bytes behind a Port, kept in pages that are made when first written"""
+    pageSize = 4096
+
+    def __init__(self):
+        self.pages = {}
+
+    # the longest register that can be read or written
+    maxLength = 1 << 24
+
+    def read(self, address, length):
+        page, offset = divmod(address, self.pageSize)
+        if offset + length <= self.pageSize:
+            data = self.pages.get(page)
+            return bytes(length) if data is None else bytes(data[offset:offset + length])
+        if not 0 <= length <= self.maxLength:
+            raise GenICamError("Can't read %d bytes at 0x%x" % (length, address))
+        # the register is split between pages
+        parts = []
+        while length > 0:
+            n = min(length, self.pageSize - address % self.pageSize)
+            parts.append(self.read(address, n))
+            address += n
+            length -= n
+        return b"".join(parts)
+
+    def write(self, address, data):
+        while data:
+            page, offset = divmod(address, self.pageSize)
+            n = min(len(data), self.pageSize - offset)
+            if page not in self.pages:
+                self.pages[page] = bytearray(self.pageSize)
+            self.pages[page][offset:offset + n] = data[:n]
+            address += n
+            data = data[n:]
+
+class SimulatedCamera(object):
+    """A camera made from its GenICam xml file. Each register is kept in a
+    RegisterSpace for its port, nodes with a Value keep it in the camera,
+    and everything else is worked out from those through the pValue,
+    pVariable, pIndex and formula links of the xml. The function that reads
+    or writes each node is built the first time it is used"""
+    def __init__(self, genicam_xml):
+        self.genicam_xml = genicam_xml
+        self.nodes, self.categories = read_sim_nodes(genicam_xml)
+        self.ports = {}
+        self.values = {}
+        self.getters = {}
+        self.setters = {}
+        self.readers = {}
+        self.staticAccess = {}
+        self.reset()
+
+    def node(self, name):
+        node = self.nodes.get(name)
+        if node is None:
+            raise GenICamError("There is no node %s" % name)
+        return node
+
+    # The features a screen would show, in the order of the categories
+    def features(self):
+        seen = set()
+        return [name for name in self.categories if name in self.nodes and
+                self.nodes[name].kind != "Category" and not (name in seen or seen.add(name))]
+
+    # The function that returns the value of a node, without checking access
+    def getter(self, name):
+        function = self.getters.get(name)
+        if function is None:
+            node = self.node(name)
+            # stop a loop in the xml from recursing forever
+            self.getters[name] = lambda: self.loop(name)
+            try:
+                function = getattr(self, "get_" + node.kind, None)
+                if function is None:
+                    raise GenICamError("%s is a %s, which can't be read" % (name, node.kind))
+                function = function(node)
+            finally:
+                del self.getters[name]
+            self.getters[name] = function
+        return function
+
+    # The function that writes the value of a node, without checking access
+    def setter(self, name):
+        function = self.setters.get(name)
+        if function is None:
+            node = self.node(name)
+            function = getattr(self, "set_" + node.kind, None)
+            if function is None:
+                raise GenICamError("%s is a %s, which can't be written" % (name, node.kind))
+            function = self.setters[name] = function(node)
+        return function
+
+    def loop(self, name):
+        raise GenICamError("%s depends on itself" % name)
+
+    # a value from the node's text, or the getter of the node its p<tag> points to
+    def value_or_getter(self, node, tag, default, convert=parse_int):
+        if "p" + tag in node.text:
+            return self.getter(node.text["p" + tag])
+        value = convert(node.text[tag]) if tag in node.text else default
+        return lambda: value
+
+    # Registers
+
+    def space(self, node):
+        port = node.text.get("pPort", "Device")
+        if port not in self.ports:
+            self.ports[port] = RegisterSpace()
+        return self.ports[port]
+
+    # the function that returns the address of a register. Offsets that are
+    # formulas of no variables are added in once
+    def address(self, node):
+        base = 0
+        parts = []
+        for tag, value, offset in node.addresses:
+            if tag == "Address":
+                base += value
+            elif tag == "pIndex":
+                parts.append((self.getter(value), self.getter(offset) if isinstance(offset, str) else
+                              (lambda offset=offset: offset) if offset is not None else
+                              self.value_or_getter(node, "Length", 4)))
+            elif not self.node(value).pVariables and self.node(value).kind.endswith("SwissKnife"):
+                base += int(self.getter(value)())
+            else:
+                parts.append((self.getter(value), lambda: 1))
+        if not parts:
+            return lambda: base
+        if len(parts) == 1:
+            (get, scale), = parts
+            return lambda: base + int(get()) * int(scale())
+        return lambda: base + sum(int(get()) * int(scale()) for get, scale in parts)
+
+    def register(self, node):
+        length = self.value_or_getter(node, "Length", 4)
+        bigEndian = node.text.get("Endianess", "LittleEndian") == "BigEndian"
+        return self.space(node), self.address(node), length, "big" if bigEndian else "little"
+
+    def get_IntReg(self, node):
+        space, address, length, order = self.register(node)
+        signed = node.text.get("Sign", "Unsigned") == "Signed"
+        read, fromBytes, n = space.read, int.from_bytes, length()
+        return lambda: fromBytes(read(address(), n), order, signed=signed)
+
+    def set_IntReg(self, node):
+        space, address, length, order = self.register(node)
+        n = length()
+        size = 1 << (8 * n)
+        def set(value):
+            space.write(address(), (int(value) % size).to_bytes(n, order))
+        return set
+
+    # the shift and width of the bits of a MaskedIntReg or StructEntry. A big
+    # endian register numbers its bits from the most significant one
+    def bits(self, node, n):
+        if "Bit" in node.text:
+            lsb = msb = parse_int(node.text["Bit"])
+        else:
+            lsb, msb = parse_int(node.text["LSB"]), parse_int(node.text["MSB"])
+        if node.text.get("Endianess", "LittleEndian") == "BigEndian":
+            return 8 * n - 1 - lsb, lsb - msb + 1
+        return lsb, msb - lsb + 1
+
+    def get_MaskedIntReg(self, node):
+        space, address, length, order = self.register(node)
+        n = length()
+        shift, width = self.bits(node, n)
+        mask = (1 << width) - 1
+        signBit = 1 << (width - 1) if node.text.get("Sign", "Unsigned") == "Signed" else 0
+        read, fromBytes = space.read, int.from_bytes
+        def get():
+            value = (fromBytes(read(address(), n), order) >> shift) & mask
+            return value - (value & signBit) * 2
+        return get
+
+    def set_MaskedIntReg(self, node):
+        space, address, length, order = self.register(node)
+        n = length()
+        shift, width = self.bits(node, n)
+        mask = (1 << width) - 1
+        def set(value):
+            a = address()
+            raw = int.from_bytes(space.read(a, n), order) & ~(mask << shift)
+            space.write(a, (raw | ((int(value) & mask) << shift)).to_bytes(n, order))
+        return set
+
+    get_StructEntry = get_MaskedIntReg
+    set_StructEntry = set_MaskedIntReg
+
+    def float_struct(self, node):
+        space, address, length, order = self.register(node)
+        return space, address, struct.Struct(("<" if order == "little" else ">") +
+                                              ("f" if length() == 4 else "d"))
+
+    def get_FloatReg(self, node):
+        space, address, s = self.float_struct(node)
+        read, unpack, n = space.read, s.unpack, s.size
+        return lambda: unpack(read(address(), n))[0]
+
+    def set_FloatReg(self, node):
+        space, address, s = self.float_struct(node)
+        return lambda value: space.write(address(), s.pack(float(value)))
+
+    def get_StringReg(self, node):
+        space, address, length, order = self.register(node)
+        return lambda: space.read(address(), int(length())).split(b"\0")[0].decode("latin-1")
+
+    def set_StringReg(self, node):
+        space, address, length, order = self.register(node)
+        def set(value):
+            n = int(length())
+            data = str(value).encode("latin-1")
+            if len(data) > n:
+                raise GenICamError("%r is longer than the %d bytes of %s" % (value, n, node.name))
+            space.write(address(), data + bytes(n - len(data)))
+        return set
+
+    def get_Register(self, node):
+        space, address, length, order = self.register(node)
+        return lambda: space.read(address(), int(length()))
+
+    def set_Register(self, node):
+        space, address, length, order = self.register(node)
+        return lambda value: space.write(address(), bytes(value)[:int(length())])
+
+    # Nodes that hold their value themselves, or pass it on through pValue
+
+    def cell(self, node, convert):
+        name = node.name
+        if name not in self.values:
+            self.values[name] = convert(node.text["Value"]) if "Value" in node.text else 0
+        values = self.values
+        return lambda: values[name]
+
+    def set_cell(self, node):
+        name, values = node.name, self.values
+        def set(value):
+            values[name] = value
+        return set
+
+    def get_Integer(self, node):
+        if "pValue" in node.text:
+            get = self.getter(node.text["pValue"])
+            return lambda: int(get())
+        return self.cell(node, parse_int)
+
+    def set_Integer(self, node):
+        if "pValue" in node.text:
+            return self.setter(node.text["pValue"])
+        return self.set_cell(node)
+
+    def get_Float(self, node):
+        if "pValue" in node.text:
+            get = self.getter(node.text["pValue"])
+            return lambda: float(get())
+        return self.cell(node, float)
+
+    set_Float = set_Integer
+    set_String = set_Integer
+
+    def get_String(self, node):
+        return self.getter(node.text["pValue"])
+
+    def get_Boolean(self, node):
+        get = self.get_Integer(node)
+        on = parse_int(node.text.get("OnValue", "1"))
+        return lambda: get() == on
+
+    def set_Boolean(self, node):
+        set = self.set_Integer(node)
+        on = parse_int(node.text.get("OnValue", "1"))
+        off = parse_int(node.text.get("OffValue", "0"))
+        return lambda value: set(on if value else off)
+
+    def get_Enumeration(self, node):
+        return self.get_Integer(node)
+
+    set_Enumeration = set_Integer
+
+    # reading a Command is whether it is done, which it always is
+    def get_Command(self, node):
+        return lambda: True
+
+    def set_Command(self, node):
+        set = self.set_Integer(node)
+        value = self.value_or_getter(node, "CommandValue", 1)
+        return lambda ignored=None: set(value())
+
+    # Formulas
+
+    def formula(self, node, tag, variables, integer):
+        names = [name for name, target in variables]
+        function = compile_formula(node.text[tag], names, integer)
+        getters = [get for name, get in variables]
+        n = len(getters)
+        def evaluate(*values):
+            try:
+                return function(*values)
+            except (ArithmeticError, ValueError) as e:
+                raise GenICamError("%s of %s: %s" % (tag, node.name, e))
+        if n == 0:
+            return lambda: evaluate()
+        if n == 1:
+            get0, = getters
+            return lambda: evaluate(get0())
+        if n == 2:
+            get0, get1 = getters
+            return lambda: evaluate(get0(), get1())
+        return lambda: evaluate(*[get() for get in getters])
+
+    def variables(self, node):
+        return [(name, self.getter(target)) for name, target in node.pVariables]
+
+    def get_IntSwissKnife(self, node):
+        return self.formula(node, "Formula", self.variables(node), node.kind == "IntSwissKnife")
+
+    get_SwissKnife = get_IntSwissKnife
+
+    def get_Converter(self, node):
+        variables = [("TO", self.getter(node.text["pValue"]))] + self.variables(node)
+        return self.formula(node, "FormulaFrom", variables, node.kind == "IntConverter")
+
+    get_IntConverter = get_Converter
+
+    def set_Converter(self, node):
+        # FROM is the value being written, which isn't known until it is
+        fromValue = [0]
+        variables = [("FROM", lambda: fromValue[0])] + self.variables(node)
+        to = self.formula(node, "FormulaTo", variables, node.kind == "IntConverter")
+        set = self.setter(node.text["pValue"])
+        def write(value):
+            fromValue[0] = value
+            set(to())
+        return write
+
+    set_IntConverter = set_Converter
+
+    # Access
+
+    # the nodes a node's access depends on: itself and its pValue chain
+    def chain(self, node):
+        nodes = [node]
+        while "pValue" in node.text and node.text["pValue"] in self.nodes and \
+                self.nodes[node.text["pValue"]] not in nodes:
+            node = self.nodes[node.text["pValue"]]
+            nodes.append(node)
+        return nodes
+
+    # access mode of a node from its xml, before pIsImplemented, pIsAvailable
+    # and pIsLocked are looked at
+    def static_access(self, node):
+        access = self.staticAccess.get(node.name)
+        if access is None:
+            last = self.chain(node)[-1]
+            if last.kind in registerKinds:
+                access = accessBits.get(last.text.get("AccessMode", "RO"), RW)
+            elif last.kind in ("SwissKnife", "IntSwissKnife"):
+                access = RO
+            elif last.kind in ("Converter", "IntConverter"):
+                access = RO
+            else:
+                access = RW
+            for n in self.chain(node):
+                if "ImposedAccessMode" in n.text:
+                    access &= accessBits.get(n.text["ImposedAccessMode"], RW)
+            self.staticAccess[node.name] = access
+        return access
+
+    def conditions(self, node, tag):
+        return [(n.text[tag], self.getter(n.text[tag])) for n in self.chain(node) if tag in n.text]
+
+    # "NI" if name is not implemented, "NA" if it is not available, or else
+    # RO, WO or RW, after any lock
+    def access(self, name):
+        node = self.node(name)
+        for condition, get in self.conditions(node, "pIsImplemented"):
+            if not get():
+                return "NI"
+        for condition, get in self.conditions(node, "pIsAvailable"):
+            if not get():
+                return "NA"
+        access = self.static_access(node)
+        for condition, get in self.conditions(node, "pIsLocked"):
+            if get():
+                access &= RO
+        return accessModes[access]
+
+    # The function that reads a feature as a client of the camera would, with
+    # the pIsImplemented and pIsAvailable conditions checked on every read,
+    # and an Enumeration read as the name of its entry
+    def reader(self, name):
+        function = self.readers.get(name)
+        if function is None:
+            node = self.node(name)
+            if not self.static_access(node) & RO:
+                raise GenICamError("%s can't be read" % name)
+            get = self.getter(name)
+            checks = self.conditions(node, "pIsImplemented") + self.conditions(node, "pIsAvailable")
+            if node.kind == "Enumeration":
+                names = dict((value, entry) for entry, value, implemented, available in node.entries)
+                value = get
+                def get():
+                    v = value()
+                    if v not in names:
+                        raise GenICamError("%s is %d, which is not one of its entries" % (name, v))
+                    return names[v]
+            if not checks:
+                function = get
+            else:
+                def function():
+                    for condition, check in checks:
+                        if not check():
+                            raise GenICamError("%s can't be read, as %s is 0" % (name, condition))
+                    return get()
+            self.readers[name] = function
+        return function
+
+    def get(self, name):
+        return self.reader(name)()
+
+    # write a feature as a client would, checking its access and limits
+    def set(self, name, value):
+        node = self.node(name)
+        access = self.access(name)
+        if access in ("NI", "NA") or not accessBits[access] & WO:
+            raise GenICamError("%s can't be written, its access is %s" % (name, access))
+        if node.kind == "Enumeration":
+            value = self.entry_value(node, value)
+        elif node.kind == "Boolean" and isinstance(value, str):
+            value = value.lower() not in ("0", "false", "off", "")
+        elif node.kind in ("Integer", "Float"):
+            try:
+                value = (parse_int if node.kind == "Integer" else float)(str(value))
+            except ValueError:
+                raise GenICamError("%r is not a value of %s %s" % (value, node.kind, name))
+            low, high = self.limits(node)
+            if not low <= value <= high:
+                raise GenICamError("%s must be between %s and %s, not %s" % (name, low, high, value))
+            if node.kind == "Integer":
+                inc = self.value_or_getter(node, "Inc", 1)()
+                if inc > 1 and (value - low) % inc:
+                    raise GenICamError("%s must be %s plus a multiple of %s, not %s" % (name, low, inc, value))
+        self.setter(name)(value)
+
+    def execute(self, name):
+        self.set(name, 1)
+
+    # The Min and Max of an Integer or Float feature
+    def limits(self, node):
+        integer = node.kind == "Integer"
+        convert = parse_int if integer else float
+        low = self.value_or_getter(node, "Min", -2 ** 63 if integer else -math.inf, convert)()
+        high = self.value_or_getter(node, "Max", 2 ** 63 - 1 if integer else math.inf, convert)()
+        return low, high
+
+    # the entries of an Enumeration that are implemented and available
+    def entries(self, name):
+        return [entry for entry, value, implemented, available in self.node(name).entries
+                if self.true(implemented) and self.true(available)]
+
+    # whether a pIsImplemented or pIsAvailable condition holds, if there is one
+    def true(self, condition):
+        try:
+            return condition is None or bool(self.getter(condition)())
+        except GenICamError:
+            return False
+
+    def entry_value(self, node, value):
+        for entry, entryValue, implemented, available in node.entries:
+            if value == entry or str(value) == str(entryValue):
+                if entry not in self.entries(node.name):
+                    raise GenICamError("%s of %s is not available" % (entry, node.name))
+                return entryValue
+        raise GenICamError("%s is not an entry of %s" % (value, node.name))
+
+    # Contents
+
+    # Clear the registers, and then make the camera look like one that has
+    # been switched on: every condition that says whether a feature is
+    # implemented or available is made true, the increments are 1, the
+    # maximums are 2**31 - 1, buffers are a page long, each writable Integer
+    # and Float starts at its Min, and each Enumeration at its Value in the
+    # xml or its first entry. A formula that divides by registers that are
+    # still 0 gets them set to 1. This is a best guess, --values sets
+    # particular features after it
+    def reset(self):
+        self.ports.clear()
+        self.values.clear()
+        # the functions of nodes that hold their own value start them again
+        self.getters.clear()
+        self.setters.clear()
+        self.readers.clear()
+        conditions = set()
+        for node in self.nodes.values():
+            for tag in ("pIsImplemented", "pIsAvailable"):
+                if tag in node.text:
+                    conditions.add(node.text[tag])
+            for entry in node.entries:
+                conditions.update(c for c in entry[2:] if c is not None)
+        unsolved = self.make_all_true(sorted(conditions))
+        # a maximum worked out by a formula comes from read only registers,
+        # like the size of the sensor
+        for node in self.nodes.values():
+            if "pMax" in node.text:
+                for register in self.registers(node.text["pMax"]):
+                    if not self.static_access(self.nodes[register]) & WO or register == node.text["pMax"]:
+                        self.poke(register, 2 ** 31 - 1)
+        for node in self.nodes.values():
+            if "pInc" in node.text:
+                self.poke(node.text["pInc"], 1)
+            # a buffer as long as the largest register would be can't be read
+            if "pLength" in node.text:
+                self.poke(node.text["pLength"], RegisterSpace.pageSize)
+        for node in self.nodes.values():
+            # a read only feature shows what the camera says, which may be
+            # one of the limits set above
+            if node.kind in ("Integer", "Float") and "pValue" in node.text and \
+                    self.static_access(node) & WO:
+                self.poke(node.name, self.start_value(node))
+            elif node.kind == "Enumeration" and node.entries:
+                values = [value for entry, value, implemented, available in node.entries]
+                if "Value" in node.text and parse_int(node.text["Value"]) in values:
+                    continue
+                entries = self.entries(node.name) or [node.entries[0][0]]
+                self.poke(node.name, [e[1] for e in node.entries if e[0] == entries[0]][0])
+        for node in self.nodes.values():
+            if node.kind in formulaKinds:
+                self.make_computable(node)
+        # the values above can have changed some of the conditions
+        self.make_all_true(sorted(conditions - unsolved))
+
+    # the Min of a feature, unless it is one of the limits of the type
+    def start_value(self, node):
+        try:
+            low = self.limits(node)[0]
+        except GenICamError:
+            return 0
+        return low if math.isfinite(low) and abs(low) < 2 ** 31 else 0
+
+    # write a node without checking its access, and without complaining
+    def poke(self, name, value):
+        try:
+            self.setter(name)(value)
+        except (GenICamError, KeyError, ValueError, OverflowError, struct.error):
+            pass
+
+    # Make as many of the conditions true as can be together. A condition is
+    # only made true in a way that leaves the true conditions that share its
+    # inputs true, so of two that can't both hold, like the availability of
+    # features of different modes, the first one stays. Returns the set of
+    # conditions that are left false
+    def make_all_true(self, conditions):
+        dependsOn = dict((name, self.depends_on(name)) for name in conditions)
+        unsolved = set()
+        for name in conditions:
+            if self.true(name):
+                continue
+            inputs = set(self.condition_inputs(name))
+            keep = [c for c in conditions if c != name and inputs & dependsOn[c] and self.true(c)]
+            if not self.make_true(name, keep=keep):
+                unsolved.add(name)
+        return unsolved
+
+    # the names of the nodes the value of a node is worked out from, through
+    # its pValue, formulas and the addresses of its registers
+    def depends_on(self, name):
+        seen = set()
+        todo = [name]
+        while todo:
+            node = self.nodes.get(todo.pop())
+            if node is None or node.name in seen:
+                continue
+            seen.add(node.name)
+            todo += [target for variable, target in node.pVariables]
+            todo += [node.text[tag] for tag in ("pValue", "pLength") if tag in node.text]
+            for tag, value, offset in node.addresses:
+                if tag != "Address":
+                    todo.append(value)
+                if isinstance(offset, str):
+                    todo.append(offset)
+        return seen
+
+    # the nodes that are set to make a condition true
+    def condition_inputs(self, name):
+        node = self.nodes.get(name)
+        if node is None:
+            return []
+        if node.kind not in ("IntSwissKnife", "SwissKnife"):
+            return [name]
+        return [input for input, candidates, likely in self.formula_inputs(name)]
+
+    # Set a condition node to a value that makes it true, and keeps each of
+    # the conditions in keep true. A formula is solved by trying values for
+    # the nodes it is worked out from, see formula_inputs, changing as few
+    # of them as it can, at most tries times. Returns whether it is true
+    def make_true(self, name, keep=(), tries=1024):
+        node = self.nodes.get(name)
+        if node is None or self.true(name):
+            return node is not None
+        if node.kind in ("IntSwissKnife", "SwissKnife"):
+            inputs = self.formula_inputs(name)
+        else:
+            inputs = [(name, [self.peek(name), -1, 1], -1)]
+        current = [candidates[0] for input, candidates, likely in inputs]
+        # first every input at once to its likely value, which makes most
+        # conditions true, and then the changes to fewest inputs
+        attempts = itertools.chain([dict((i, x[2]) for i, x in enumerate(inputs))],
+                                   (dict(zip(changed, values)) for changed, values in self.changes(inputs)))
+        for values in itertools.islice(attempts, tries):
+            for i in sorted(values):
+                self.poke(inputs[i][0], self.peek(values[i][1]) if isinstance(values[i], tuple) else values[i])
+            if self.true(name) and all(self.true(c) for c in keep):
+                return True
+            # in reverse, as the address of a register can depend on the
+            # value of an input that was set before it
+            for i in sorted(values, reverse=True):
+                self.poke(inputs[i][0], current[i])
+        return False
+
+    # the changes to try to the inputs of a condition, fewest first, as
+    # ([input index...], [value...])
+    def changes(self, inputs):
+        for k in range(1, len(inputs) + 1):
+            for changed in itertools.combinations(range(len(inputs)), k):
+                for values in itertools.product(*[inputs[i][1][1:] for i in changed]):
+                    yield changed, values
+
+    # The nodes a condition formula is worked out from, through the formulas
+    # it uses, with the values to try for each and the likely one, as
+    # [(name, [values...], likely)...]. The values are the one it has, the
+    # numbers the formulas compare it with, the features they compare it
+    # with as ("copy", name), and then the entries of an Enumeration or all
+    # ones, 1 and 0. The likely value is the first it is compared with, or
+    # all ones for a register, which is what most conditions test. The nodes
+    # that copy another come last, so they copy the value it is given
+    def formula_inputs(self, name):
+        compared = {}
+        copies = set()
+        todo = [name]
+        seen = set()
+        while todo:
+            node = self.nodes.get(todo.pop())
+            if node is None or node.name in seen:
+                continue
+            seen.add(node.name)
+            targets = dict(node.pVariables)
+            for variable, target in node.pVariables:
+                if self.nodes.get(target) is not None and self.nodes[target].kind in ("IntSwissKnife", "SwissKnife"):
+                    todo.append(target)
+                elif target in self.nodes:
+                    compared.setdefault(target, [])
+            tokens = tokenize_formula(node.text["Formula"])
+            for i, (kind, op) in enumerate(tokens):
+                if kind != "op" or op not in ("=", "<>") or i == 0:
+                    continue
+                for (leftKind, left), (rightKind, right) in ((tokens[i - 1], tokens[i + 1]),
+                                                             (tokens[i + 1], tokens[i - 1])):
+                    if leftKind != "name" or targets.get(left) not in compared:
+                        continue
+                    if rightKind == "number":
+                        compared[targets[left]].append(int(float(right)))
+                    elif rightKind == "name" and right in targets:
+                        compared[targets[left]].append(("copy", targets[right]))
+                        copies.add(targets[left])
+        inputs = []
+        for target, values in compared.items():
+            node = self.nodes[target]
+            current = self.peek(target)
+            if node.kind == "Enumeration":
+                others = [value for entry, value, implemented, available in node.entries]
+                likely = values[0] if values else current
+            else:
+                others = [-1, 1, 0]
+                likely = values[0] if values else -1
+            candidates = []
+            for value in [current] + values + others:
+                if value is not None and value not in candidates:
+                    candidates.append(value)
+            inputs.append((target, candidates, likely))
+        return sorted(inputs, key=lambda x: x[0] in copies)
+
+    # the value of a node without checking its access, or None if it can't be read
+    def peek(self, name):
+        try:
+            return self.getter(name)()
+        except (GenICamError, KeyError, ValueError):
+            return None
+
+    # If a formula can't be worked out, like a rate from an interval that is
+    # 0, set the inputs that are 0 to 1
+    def make_computable(self, node):
+        try:
+            self.getter(node.name)()
+            return
+        except (GenICamError, KeyError, ValueError):
+            pass
+        inputs = [target for variable, target in node.pVariables]
+        if "pValue" in node.text:
+            inputs.append(node.text["pValue"])
+        for name in inputs:
+            if self.peek(name) == 0:
+                self.poke(name, 1)
+
+    # the registers behind a node: itself, or the variables of its formula
+    def registers(self, name):
+        node = self.nodes.get(name)
+        if node is None:
+            return []
+        if node.kind in registerKinds:
+            return [name]
+        return [target for variable, target in node.pVariables
+                if target in self.nodes and self.nodes[target].kind in registerKinds]
+
+    # the value of every feature that can be read, and the error for those
+    # that can't
+    def dump(self):
+        values, errors = {}, {}
+        for name in self.features():
+            try:
+                values[name] = self.get(name)
+            except (GenICamError, KeyError) as e:
+                errors[name] = str(e)
+        return values, errors
+
+    # Set features from {name: value}, like the output of dump, without
+    # checking their access. Returns {name: error} for the features whose
+    # value comes from a formula, or that can't be set
+    def load_values(self, values):
+        errors = {}
+        for name, value in values.items():
+            try:
+                node = self.node(name)
+                self.setter(name)(self.entry_value(node, value) if node.kind == "Enumeration" else value)
+            except GenICamError as e:
+                errors[name] = str(e)
+        return errors
+
+# Read every feature of camera that can be read, over and over for seconds,
+# and return the number of reads a second
+def bench_reads(camera, seconds=1.0):
+    readers = []
+    for name in camera.features():
+        try:
+            reader = camera.reader(name)
+            reader()
+            readers.append(reader)
+        except (GenICamError, KeyError):
+            pass
+    reads = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        for reader in readers:
+            reader()
+        reads += len(readers)
+    return len(readers), reads / (time.perf_counter() - start)
+
+def main():
+    parser = OptionParser("""%prog [options] <genicam_xml> [feature[=value] ...]
+
+This script makes a simulated camera from a GenICam xml file. Its registers
+are kept in memory, and its features are read and written through the same
+pValue, pIndex, pIsImplemented, pIsAvailable, pIsLocked, SwissKnife and
+Converter nodes as the real camera, with each formula compiled to python once.
+
+Each feature given is written if it has a value, and then read, and printed
+with its access mode. With no features, every feature in the categories is
+printed. --bench reads them all for a time, to see how many features a
+second the simulation can serve to an IOC.""")
+    parser.add_option("", "--values", dest="values", default=None,
+                      help="json file of {feature: value} to set after the camera is reset")
+    parser.add_option("", "--dump", dest="dump", default=None,
+                      help="write the value of every readable feature to this json file")
+    parser.add_option("", "--bench", type="float", dest="bench", default=None,
+                      help="read every feature for this many seconds and report the reads a second")
+    parser.add_option("", "--scan-rate", type="float", dest="scan_rate", default=10.0,
+                      help="scans a second of each feature that --bench compares against (default: 10)")
+    options, args = parser.parse_args()
+    if len(args) < 1:
+        parser.error("Incorrect number of arguments")
+
+    start = time.perf_counter()
+    camera = SimulatedCamera(args[0])
+    print("%s: %d nodes, %d features, %d formulas compiled in %.3f s" % (
+        os.path.basename(args[0]), len(camera.nodes), len(camera.features()),
+        len(compiled_formulas), time.perf_counter() - start))
+    if options.values:
+        with open(options.values) as f:
+            errors = camera.load_values(json.load(f))
+        if errors:
+            print("%d of the values in %s were not set" % (len(errors), options.values))
+    status = 0
+    for arg in args[1:] or camera.features():
+        name, equals, value = arg.partition("=")
+        try:
+            if equals:
+                camera.set(name, value)
+            if camera.node(name).kind == "Command":
+                print("%-40s %-2s" % (name, camera.access(name)))
+            else:
+                print("%-40s %-2s %s" % (name, camera.access(name), camera.get(name)))
+        except GenICamError as e:
+            print("%-40s %-2s %s" % (name, "", e))
+            status = 1 if args[1:] else status
+    if options.dump:
+        values, errors = camera.dump()
+        with open(options.dump, "w") as f:
+            json.dump(values, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if options.bench:
+        features, rate = bench_reads(camera, options.bench)
+        print("%d readable features, %.0f reads a second, %.1f cameras at %g Hz" % (
+            features, rate, rate / max(features, 1) / options.scan_rate, options.scan_rate))
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os, re
+from io import StringIO
+from xml.etree.ElementTree import parse
+
+from makeDbAndEdl import read_model, settings_order, write_settings_req, make_db_and_edl, default_filters
+from makeSyntheticGenICam import write_synthetic_genicam
+
+xml_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "xml")
+
+# The Alvium restores each offset after the width or height and binning that
+# set its pMax, as RegOffsetXMax is invalidated by RegWidth, and only
+# restores the features the xml marks as Streamable
+def test_alvium_settings_order(tmp_path):
+    model = read_model(os.path.join(xml_dir, "AVT_Alvium_1800_U240m.xml"), cache=False)
+    invalidated = dict((feature.name, [node.name for node in changed])
+                       for feature, changed in model.invalidated_features())
+    assert "OffsetX" in invalidated["Width"]
+    assert "OffsetY" in invalidated["Height"]
+    order, loops, aliases = settings_order(model)
+    names = [node.name for node in order]
+    for offset, sizes in (("OffsetX", ["Width", "BinningHorizontal"]), ("OffsetY", ["Height", "BinningVertical"])):
+        for size in sizes + ["BinningSelector"]:
+            if size in names:
+                assert names.index(size) < names.index(offset), (size, offset)
+    assert "Width" in names and "Height" in names
+    assert all(node.streamable for node in order)
+    assert "DeviceFirmwareVersionSelector" not in names
+    req = tmp_path / "Alvium_1800_U240m_settings.req"
+    write_settings_req(model, "Alvium_1800_U240m", str(req))
+    lines = [line for line in req.read_text().splitlines() if not line.startswith("#")]
+    assert lines == ["$(P)$(R)%s" % node.recordName for node in order]
+
+# the fields of each record in a template, as {name: {field: value}}
+def template_records(filename):
+    records = {}
+    for name, body in re.findall(r'record\(\w+, "\$\(P\)\$\(R\)(\w+)"\) \{(.*?)\n\}', open(filename).read(), re.S):
+        records[name] = dict(re.findall(r'field\((\w+),\s*"([^"]*)"\)', body))
+    return records
+
+# a synthetic camera with chunk data generated into tmp_path
+def make_chunk_camera(tmp_path, filters=default_filters):
+    for directory in ("Db", os.path.join("op", "edl")):
+        os.makedirs(str(tmp_path / directory), exist_ok=True)
+    genicam_xml = str(tmp_path / "chunks.xml")
+    write_synthetic_genicam(genicam_xml, features=20, chunks=True)
+    assert make_db_and_edl(genicam_xml, "Chunks", prefix=str(tmp_path), filters=filters, cache=False, log=StringIO())
+    return str(tmp_path / "Db" / "Chunks-chunk.template"), str(tmp_path / "Db" / "Chunks-chunk-attributes.xml")
+
+# The chunk values read from the port with a ChunkID are NDAttributes of
+# their parameters, and each entry of ChunkSelector, with a feature or not,
+# gets records on one chain that selects it and then writes ChunkEnable
+def test_chunk_files(tmp_path):
+    template, attributes = make_chunk_camera(tmp_path)
+    assert [(a.get("name"), a.get("source"), a.get("datatype")) for a in parse(attributes).getroot()] == [
+        ("ChunkTimestamp", "GC_I_ChunkTimestamp", "INT64"),
+        ("ChunkExposureTime", "GC_D_ChunkExposureTime", "DOUBLE"),
+        ("ChunkLineStatusAll", "GC_I_ChunkLineStatusAll", "INT64")]
+    records = template_records(template)
+    names = ["GC_ChunkTimestamp", "GC_ChunkExposureTime", "GC_ChuLineStatusAll", "GC_ChunkCrc"]
+    assert sorted(records) == sorted(name + suffix for name in names for suffix in ("_En", "_EnGo", "_EnSel", "_EnSet"))
+    for i, name in enumerate(names):
+        assert records[name + "_En"]["FLNK"] == "$(P)$(R)GC_ChunkTimestamp_EnGo"
+        go = records[name + "_EnGo"]
+        assert (go["DOL1"], go["LNK1"]) == (str(i), "$(P)$(R)%s_EnSel.VAL PP" % name)
+        assert ("PINI" in go) == (i == 0)
+        assert records[name + "_EnSel"]["OUT"].endswith("GC_E_ChunkSelector")
+        assert records[name + "_EnSel"]["FLNK"] == "$(P)$(R)%s_EnSet" % name
+        enable = records[name + "_EnSet"]
+        assert enable["OUT"].endswith("GC_B_ChunkEnable")
+        assert enable["DOL"] == "$(P)$(R)%s_En NPP" % name
+        assert enable.get("FLNK") == ("$(P)$(R)%s_EnGo" % names[i + 1] if i + 1 < len(names) else None)
+    # the parameters the chain writes have records in the camera's template
+    db = template_records(str(tmp_path / "Db" / "Chunks.template"))
+    assert "GC_ChunkSelector" in db and "GC_ChunkEnable" in db
+
+# Chunk features and controls that the filters leave out of the camera's
+# template get their records in the chunk template
+def test_chunk_files_of_filtered_features(tmp_path):
+    filters = dict(default_filters, exclude=["ChunkDataControl"])
+    template, attributes = make_chunk_camera(tmp_path, filters)
+    records = template_records(template)
+    for name in ("GC_ChunkModeActive", "GC_ChunkSelector", "GC_ChunkEnable", "GC_ChunkTimestamp_RBV",
+                 "GC_ChunkExposureTime_RBV", "GC_ChuLineStatusAll_RBV"):
+        assert name in records, name
+    assert "GC_ChunkSelector" not in template_records(str(tmp_path / "Db" / "Chunks.template"))
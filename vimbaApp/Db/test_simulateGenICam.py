@@ -0,0 +1,34 @@
+import os
+import pytest
+
+from simulateGenICam import SimulatedCamera, GenICamError, RO, compile_formula
+
+xml_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "xml")
+
+# Every feature of the shipped cameras can be read after a reset. The few
+# that are not available, because they belong to another mode than features
+# that are, like ContrastValue and the other Contrast features, can be read
+# once their pIsAvailable condition is made true
+@pytest.mark.parametrize("genicam_xml", ["AVT_Alvium_1800_U240m.xml", "Allied_Vision-Goldeye_G-130.xml"])
+def test_reads_every_feature_after_reset(genicam_xml):
+    camera = SimulatedCamera(os.path.join(xml_dir, genicam_xml))
+    camera.reset()
+    errors = {}
+    for name in camera.features():
+        node = camera.node(name)
+        if node.kind == "Command" or not camera.static_access(node) & RO:
+            continue
+        assert camera.access(name) != "NI", name
+        if camera.access(name) == "NA":
+            for condition, get in camera.conditions(node, "pIsAvailable"):
+                assert camera.make_true(condition), "%s of %s" % (condition, name)
+        try:
+            camera.get(name)
+        except GenICamError as e:
+            errors[name] = str(e)
+    assert errors == {}
+
+# names in formulas are plain pVariable names, Enumeration.EntryName isn't read
+def test_formula_names_have_no_dots():
+    with pytest.raises(GenICamError):
+        compile_formula("SEL.Mono8 + 1", ["SEL.Mono8"])